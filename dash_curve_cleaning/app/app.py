@@ -1,10 +1,37 @@
+import os
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
+import redis
 import uvicorn
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.wsgi import WSGIMiddleware
 
+from connections import THREADS, redis_client
 from dashapp import create_dash_app
+from metrics import REGISTRY
+
+# Number of processes serving the app when run directly with uvicorn. When served by
+# nginx unit, see nginx_unit/workers.sh instead.
+WORKERS = int(os.getenv("WORKERS", 1))
+# Responses of the dash app larger than GZIP_MIN_BYTES are compressed, with the given
+# zlib level, low levels compressing figures several times faster for a few percent
+# more bytes. A GZIP_MIN_BYTES of 0 disables the compression.
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 1))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """The dash app runs in the pool of threads of anyio, of 40 threads by default,
+    which is only resized when THREADS is set."""
+    if THREADS is not None:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = THREADS
+    yield
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
@@ -13,18 +40,40 @@ def read_main():
         "routes": [
             {"method": "GET", "path": "/", "summary": "Landing"},
             {"method": "GET", "path": "/status", "summary": "App status"},
-            {"method": "GET", "path": "/dash", "summary": "Sub-mounted Dash application"},
+            {"method": "GET", "path": "/metrics", "summary": "Callback timings"},
+            {
+                "method": "GET",
+                "path": "/dash",
+                "summary": "Sub-mounted Dash application",
+            },
         ]
     }
 
 
 @app.get("/status")
 def get_status():
-    return {"status": "ok"}
+    try:
+        redis_client().ping()
+        redis_status = "ok"
+    except redis.RedisError:
+        redis_status = "unavailable"
+    return {"status": "ok", "redis": redis_status}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Histograms of the timings, payload sizes and redis round trips of the dash
+    callbacks served by this process."""
+    return REGISTRY.snapshot()
 
 
 dash_app = create_dash_app(requests_pathname_prefix="/dash/")
-app.mount("/dash", WSGIMiddleware(dash_app.server))
+dash_asgi = WSGIMiddleware(dash_app.server)
+if GZIP_MIN_BYTES > 0:
+    dash_asgi = GZipMiddleware(
+        dash_asgi, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL
+    )
+app.mount("/dash", dash_asgi)
 
 if __name__ == "__main__":
-    uvicorn.run(app, port=8050)
+    uvicorn.run("app:app", port=8050, workers=WORKERS)
@@ -0,0 +1,68 @@
+/*
+ * Visibility of the panels of the grid view.
+ *
+ * A panel only reads its series once it scrolls into view, or is about to, and
+ * releases them once it leaves it: its "panel-visible" store is set whenever it enters
+ * or leaves the viewport, extended by MARGIN, which triggers `update_panel`. Panels
+ * are observed from the moment they're added to the page until they're removed.
+ */
+
+(function () {
+    var MARGIN = "300px";
+    var observer = null;
+
+    function changed(entries) {
+        entries.forEach(function (entry) {
+            var panel = entry.target;
+            var visible = entry.isIntersecting;
+            if (panel.dataset.visible === String(visible)) {
+                return;
+            }
+            panel.dataset.visible = String(visible);
+            var id = JSON.parse(panel.id);
+            window.dash_clientside.set_props(
+                {type: "panel-visible", index: id.index},
+                {data: visible}
+            );
+        });
+    }
+
+    function panels(node) {
+        if (!(node instanceof Element)) {
+            return [];
+        }
+        if (node.classList.contains("panel")) {
+            return [node];
+        }
+        return Array.from(node.querySelectorAll(".panel"));
+    }
+
+    function observe(node) {
+        panels(node).forEach(function (panel) {
+            observer.observe(panel);
+        });
+    }
+
+    function unobserve(node) {
+        panels(node).forEach(function (panel) {
+            observer.unobserve(panel);
+        });
+    }
+
+    function start() {
+        observer = new IntersectionObserver(changed, {rootMargin: MARGIN});
+        new MutationObserver(function (mutations) {
+            mutations.forEach(function (mutation) {
+                mutation.removedNodes.forEach(unobserve);
+                mutation.addedNodes.forEach(observe);
+            });
+        }).observe(document.body, {childList: true, subtree: true});
+        observe(document.body);
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", start);
+    } else {
+        start();
+    }
+})();
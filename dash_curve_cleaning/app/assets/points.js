@@ -0,0 +1,205 @@
+/*
+ * Point drags, handled in the browser.
+ *
+ * Moving a point only moves the lines connecting the points of its group, which only
+ * depend on the position of the points and on the axis ranges. They're redrawn here as
+ * soon as a point is dropped, mirroring `FigureModel.update_points` and
+ * `FigureModel._get_line_points`, and the moves are sent to the server once no point
+ * was moved for a short delay, as a single relayout event, to be saved and to classify
+ * the samples again. Every other relayout event, such as a zoom, goes to the server
+ * right away. Figures are handled separately, such as the panels of the grid view, each
+ * sending its events to its own relayout store.
+ *
+ * The points moved in a panel are moved in the other loaded panels as well, as soon as
+ * the moves are sent, by a relayout event marked as shared: it's only drawn, the panel
+ * the points were moved in saves them.
+ */
+
+window.dash_clientside = window.dash_clientside || {};
+window.dash_clientside.points = (function () {
+    var SHAPE_KEY = /^shapes\[(\d+)\](?:\.(x0|x1|y0|y1))?$/;
+    // Marks the relayout events of the moves shared by another panel.
+    var SHARED = "points.shared";
+    // Must match FigureModel.CIRCLE_SIZE.
+    var CIRCLE_SIZE = 10;
+
+    // Shape moves not sent to the server yet, and the timers sending them, by the id of
+    // the relayout store they're sent to.
+    var pending = {};
+    var timers = {};
+
+    // Moves the points moved in a panel in the other loaded panels.
+    function share(store, relayout) {
+        if (store.type !== "panel-relayout") {
+            return;
+        }
+        var moves = {};
+        Object.keys(relayout).forEach(function (key) {
+            if (SHAPE_KEY.test(key)) {
+                moves[key] = relayout[key];
+            }
+        });
+        if (Object.keys(moves).length === 0) {
+            return;
+        }
+        moves[SHARED] = true;
+        document.querySelectorAll('.panel[data-visible="true"]').forEach(function (panel) {
+            var index = JSON.parse(panel.id).index;
+            if (index !== store.index) {
+                window.dash_clientside.set_props(
+                    {type: "panel-figure", index: index},
+                    {relayoutData: moves}
+                );
+            }
+        });
+    }
+
+    function flush(store) {
+        var key = JSON.stringify(store);
+        var relayout = pending[key] || {};
+        delete pending[key];
+        delete timers[key];
+        if (Object.keys(relayout).length > 0) {
+            window.dash_clientside.set_props(store, {data: relayout});
+            share(store, relayout);
+        }
+    }
+
+    function mean(range) {
+        return (range[0] + range[1]) / 2;
+    }
+
+    function center(shape) {
+        return [(shape.x0 + shape.x1) / 2, (shape.y0 + shape.y1) / 2];
+    }
+
+    function moveShapes(shapes, relayout, layout, figureLayout) {
+        var scaleX = (layout.xaxis.range[1] - layout.xaxis.range[0])
+            / figureLayout.width;
+        var scaleY = (layout.yaxis.range[1] - layout.yaxis.range[0])
+            / figureLayout.height;
+        var moved = shapes.map(function (shape) {
+            return Object.assign({}, shape);
+        });
+
+        Object.keys(relayout).forEach(function (key) {
+            var match = SHAPE_KEY.exec(key);
+            var shape = moved[Number(match[1])];
+            if (match[2] === undefined) {
+                Object.assign(shape, relayout[key]);
+            } else {
+                shape[match[2]] = relayout[key];
+            }
+        });
+
+        // Coordinates the points don't have stay in the middle of the viewport.
+        moved.forEach(function (shape) {
+            if (shape.no_x) {
+                shape.x0 = mean(layout.xaxis.range);
+            }
+            if (shape.no_y) {
+                shape.y0 = mean(layout.yaxis.range);
+            }
+            shape.x1 = shape.x0 + scaleX * CIRCLE_SIZE;
+            shape.y1 = shape.y0 + scaleY * CIRCLE_SIZE;
+        });
+        return moved;
+    }
+
+    function groupLine(shapes, layout) {
+        var x = [];
+        var y = [];
+        if (shapes.length > 1) {
+            shapes.forEach(function (shape) {
+                var c = center(shape);
+                x.push(c[0]);
+                y.push(c[1]);
+            });
+        } else if (shapes.length === 1) {
+            var shape = shapes[0];
+            var c = center(shape);
+            if (shape.no_x) {
+                x = [layout.xaxis.range[0], layout.xaxis.range[1]];
+                y = [c[1], c[1]];
+            } else if (shape.no_y) {
+                x = [c[0], c[0]];
+                y = [layout.yaxis.range[0], layout.yaxis.range[1]];
+            } else {
+                x = [c[0], c[0], c[0], layout.xaxis.range[1]];
+                y = [layout.yaxis.range[1], c[1], c[1], c[1]];
+            }
+        }
+        return [x, y];
+    }
+
+    return {
+        drag: function (relayout, figure, layout, delay) {
+            var noUpdate = window.dash_clientside.no_update;
+            if (!relayout || !layout || !figure) {
+                return [noUpdate, noUpdate, noUpdate];
+            }
+
+            // The relayout store is the last output of the callback.
+            var outputs = window.dash_clientside.callback_context.outputs_list;
+            var store = outputs[outputs.length - 1].id;
+            var storeKey = JSON.stringify(store);
+
+            var shared = relayout[SHARED] === true;
+            if (shared) {
+                relayout = Object.assign({}, relayout);
+                delete relayout[SHARED];
+            }
+
+            var keys = Object.keys(relayout);
+            var shapeMove = keys.length > 0 && keys.every(function (key) {
+                return SHAPE_KEY.test(key);
+            });
+            if (!shapeMove) {
+                // Sent along with the moves not sent yet.
+                var moves = pending[storeKey] || {};
+                var merged = Object.assign({}, moves, relayout);
+                delete pending[storeKey];
+                clearTimeout(timers[storeKey]);
+                delete timers[storeKey];
+                share(store, moves);
+                return [noUpdate, noUpdate, merged];
+            }
+
+            var shapes = moveShapes(layout.shapes, relayout, layout, figure.layout);
+            var groups = (layout.meta.groups || "").split(",").filter(Boolean);
+            var offset = Number(layout.meta.lines);
+            var data = figure.data.slice();
+            var first = 0;
+            groups.forEach(function (size, i) {
+                var last = first + Number(size);
+                var line = groupLine(shapes.slice(first, last), layout);
+                data[offset + i] = Object.assign({}, data[offset + i], {
+                    x: line[0],
+                    y: line[1],
+                });
+                first = last;
+            });
+
+            if (!shared) {
+                pending[storeKey] = Object.assign(pending[storeKey] || {}, relayout);
+                clearTimeout(timers[storeKey]);
+                timers[storeKey] = setTimeout(flush, delay, store);
+            }
+
+            var figureShapes = shapes.map(function (shape) {
+                var figureShape = Object.assign({}, shape);
+                delete figureShape.no_x;
+                delete figureShape.no_y;
+                return figureShape;
+            });
+            return [
+                Object.assign({}, figure, {
+                    data: data,
+                    layout: Object.assign({}, figure.layout, {shapes: figureShapes}),
+                }),
+                Object.assign({}, layout, {shapes: shapes}),
+                noUpdate,
+            ];
+        },
+    };
+})();
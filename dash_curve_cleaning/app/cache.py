@@ -0,0 +1,225 @@
+"""Server-side cache of the series displayed by the dash app.
+
+Series are cached in two tiers, both indexed by their redis key and tagged with their
+signature (see `series.signature`), so that a cached series is only used while it's
+still the one stored in redis. Series without a signature are only kept in memory, and
+only used by callers that don't check signatures:
+
+1. an in-process cache, holding the decoded series most recently used by the process.
+2. an optional cache shared by the processes of the host, holding the decoded series as files of
+a directory, such as one in /dev/shm, which processes map in memory rather than read.
+
+Both tiers are bounded by the size of the series they hold, the least recently used
+series being evicted first.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+import woodpecker as wp
+
+MAX_BYTES = 512 * 2**20
+SHARED_MAX_BYTES = 2**30
+# Bytes written by np.save ahead of the samples, at most.
+NPY_HEADER = 4096
+
+
+def _digest(value) -> str:
+    return hashlib.sha1(repr(value).encode()).hexdigest()[:20]
+
+
+class SharedSeriesCache:
+    """Keeps decoded series as .npy files of a directory, shared by every process using
+    the same directory, created on first write. Series are written to a temporary file
+    first, then renamed, so that processes never see partial files, and are mapped in
+    memory read-only when read. Files are evicted by least recent use, to make room for
+    those written, so that they take up at most `max_bytes` bytes, or the size of the
+    device of the directory if smaller."""
+
+    def __init__(self, directory: str, max_bytes: int = SHARED_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._budget: Optional[int] = None
+
+    def _path(self, key: str, signature: Hashable) -> Path:
+        return self.directory / f"{_digest(key)}.{_digest(signature)}.npy"
+
+    def __contains__(self, key: str) -> bool:
+        return any(self.directory.glob(f"{_digest(key)}.*.npy"))
+
+    def get(self, key: str, signature: Hashable) -> Optional[np.ndarray]:
+        """Returns the series cached under a key with the given signature, if any."""
+
+        path = self._path(key, signature)
+        try:
+            values = np.load(path, mmap_mode="r")
+            # The modification time orders the files by last use, for eviction.
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return values
+
+    def put(self, key: str, signature: Hashable, values: np.ndarray):
+        """Caches a series under a key, replacing those cached under other
+        signatures."""
+
+        try:
+            budget = self._prepare()
+        except OSError as error:
+            wp.warning(f"Couldn't cache {key} in {self.directory}: {error}")
+            return
+        # Empty files can't be mapped in memory, and empty series are cheap to read.
+        if len(values) == 0 or values.nbytes + NPY_HEADER > budget:
+            return
+
+        path = self._path(key, signature)
+        for stale in self.directory.glob(f"{_digest(key)}.*.npy"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        self._evict(budget - values.nbytes - NPY_HEADER)
+
+        temporary = path.with_name(
+            f".{path.name}.{os.getpid()}.{threading.get_ident()}"
+        )
+        for retry in (True, False):
+            try:
+                with open(temporary, "wb") as file:
+                    np.save(file, values)
+                os.replace(temporary, path)
+                return
+            except OSError as error:
+                temporary.unlink(missing_ok=True)
+                if retry and error.errno == errno.ENOSPC:
+                    # Other files of the device take up the room left, such as those
+                    # of another cache, so more files are evicted to make up for them.
+                    free = shutil.disk_usage(self.directory).free
+                    self._evict(self._n_bytes() + free - values.nbytes - NPY_HEADER)
+                    continue
+                wp.warning(f"Couldn't cache {key} in {self.directory}: {error}")
+                return
+
+    def _prepare(self) -> int:
+        """Creates the directory, the first time, and returns the bytes its files can
+        take up."""
+
+        if self._budget is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            total = shutil.disk_usage(self.directory).total
+            self._budget = min(self.max_bytes, total)
+        return self._budget
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        """Returns the modification time, the size and the path of the cached files."""
+
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _n_bytes(self) -> int:
+        return sum(file_size for _, file_size, _ in self._files())
+
+    def _evict(self, max_bytes: int):
+        """Evicts the least recently used files until they take up at most `max_bytes`
+        bytes."""
+
+        files = self._files()
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= max_bytes:
+                break
+            # Processes mapping the file in memory keep reading it, its memory is freed
+            # once they're done with it.
+            Path(path).unlink(missing_ok=True)
+            size -= file_size
+
+
+class SeriesCache:
+    """Keeps the decoded series most recently used by the process in memory, along with
+    their signature, up to `max_bytes` bytes of series, backed by an optional cache
+    shared with other processes."""
+
+    def __init__(
+        self,
+        max_bytes: int = MAX_BYTES,
+        shared: Optional[SharedSeriesCache] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._series: "OrderedDict[str, Tuple[Hashable, np.ndarray]]" = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        """Whether a series is cached under a key, whatever its signature."""
+
+        with self._lock:
+            if key in self._series:
+                return True
+        return self.shared is not None and key in self.shared
+
+    def peek(self, key: str) -> Optional[Tuple[Hashable, np.ndarray]]:
+        """Returns the signature and the values of the series cached in memory under a
+        key, if any, whatever its signature."""
+
+        with self._lock:
+            if key not in self._series:
+                return None
+            self._series.move_to_end(key)
+            return self._series[key]
+
+    def get(self, key: str, signature: Hashable) -> Optional[np.ndarray]:
+        """Returns the series cached under a key with the given signature, if any,
+        looking in memory first, then in the shared cache."""
+
+        if signature is None:
+            return None
+
+        cached = self.peek(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        if self.shared is not None:
+            values = self.shared.get(key, signature)
+            if values is not None:
+                self._put(key, signature, values)
+                return values
+        return None
+
+    def put(self, key: str, signature: Hashable, values: np.ndarray):
+        """Caches a series read from redis under a key."""
+
+        self._put(key, signature, values)
+        if self.shared is not None and signature is not None:
+            self.shared.put(key, signature, values)
+
+    def _put(self, key: str, signature: Hashable, values: np.ndarray):
+        with self._lock:
+            self._discard(key)
+            if values.nbytes > self.max_bytes:
+                return
+            self._series[key] = (signature, values)
+            self._n_bytes += values.nbytes
+            while self._n_bytes > self.max_bytes:
+                self._discard(next(iter(self._series)))
+
+    def discard(self, key: str):
+        """Drops the series cached in memory under a key."""
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: str):
+        if key in self._series:
+            self._n_bytes -= self._series.pop(key)[1].nbytes
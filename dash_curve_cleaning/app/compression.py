@@ -0,0 +1,143 @@
+"""Codecs of the series stored with the binary layout.
+
+A codec is a comma separated list of steps, applied in this order when encoding a
+series, and in reverse order when decoding it:
+
+1. quantize:{step} - rounds the samples to a multiple of `step`, storing the number of
+steps as integers. Lossy: decoded samples are within step / 2 of the original ones, and
+samples that aren't finite decode as NaN. Samples too large for their number of steps to
+fit in 64 bits can't be quantized.
+2. delta - stores the difference between consecutive samples, rather than the samples,
+which makes monotonic series, such as timestamps, much more compressible. Lossless, the
+differences are computed on the bits of the samples, modulo 2**64.
+3. zlib or snappy - compresses the resulting bytes. Series are encoded with zlib rather
+than snappy if python-snappy isn't installed, the codec they're recorded with being the
+one used (see `available`).
+
+For instance "quantize:0.01,delta,zlib" stores sensor values with two decimals, and
+"delta,snappy" stores timestamps exactly.
+"""
+
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+import woodpecker as wp
+
+QUANTIZE = "quantize"
+DELTA = "delta"
+ZLIB = "zlib"
+SNAPPY = "snappy"
+COMPRESSIONS = (ZLIB, SNAPPY)
+STEPS = (QUANTIZE, DELTA) + COMPRESSIONS
+
+# Number of steps of a quantized sample that isn't finite.
+NOT_FINITE = np.iinfo(np.int64).min
+
+
+def parse_codec(codec: str) -> List[Tuple[str, Optional[float]]]:
+    """Parses a codec into its steps and their parameter, checking that they're known
+    and come in the order they're applied in."""
+
+    steps = []
+    for step in codec.split(","):
+        name, _, parameter = step.strip().partition(":")
+        if name not in STEPS:
+            raise ValueError(f"Invalid codec step {name}, expected one of {STEPS}.")
+        if name == QUANTIZE:
+            if not parameter or float(parameter) <= 0:
+                raise ValueError(
+                    f"Invalid codec step {step}, expected {QUANTIZE}:step."
+                )
+            steps.append((name, float(parameter)))
+        else:
+            steps.append((name, None))
+
+    order = [STEPS.index(name) if name not in COMPRESSIONS else 2 for name, _ in steps]
+    if order != sorted(set(order)):
+        raise ValueError(
+            f"Invalid codec {codec}, steps must be given once, in the order "
+            f"{QUANTIZE}, {DELTA}, {' or '.join(COMPRESSIONS)}."
+        )
+    return steps
+
+
+def _snappy():
+    try:
+        import snappy
+    except ImportError:
+        raise ValueError("The snappy codec needs the python-snappy package.")
+    return snappy
+
+
+def available(codec: str) -> str:
+    """Returns the codec to encode series with in place of the given one: the same
+    codec, compressing with zlib instead of snappy if python-snappy isn't installed."""
+
+    steps = [step.strip() for step in codec.split(",")]
+    if SNAPPY not in steps:
+        return codec
+    try:
+        _snappy()
+    except ValueError:
+        wp.warning(
+            f"python-snappy isn't installed, {ZLIB} is used instead of {SNAPPY}."
+        )
+        return ",".join(ZLIB if step == SNAPPY else step for step in steps)
+    return codec
+
+
+def encode(values: np.ndarray, codec: str) -> bytes:
+    """Encodes samples, of their own dtype, with a codec."""
+
+    for name, parameter in parse_codec(codec):
+        if name == QUANTIZE:
+            finite = np.isfinite(values)
+            # Divided in double precision, so that float32 samples are also within
+            # step / 2 of their decoded value.
+            quanta = np.round(np.where(finite, values, 0).astype("<f8") / parameter)
+            if np.any(np.abs(quanta) >= 2.0**63):
+                raise ValueError(
+                    f"Samples up to {np.abs(values[finite]).max()} can't be quantized "
+                    f"with a step of {parameter}."
+                )
+            values = quanta.astype("<i8")
+            values[~finite] = NOT_FINITE
+        elif name == DELTA:
+            bits = values.view(f"<u{values.dtype.itemsize}")
+            values = np.empty_like(bits)
+            values[:1] = bits[:1]
+            np.subtract(bits[1:], bits[:-1], out=values[1:])
+        elif name == ZLIB:
+            values = zlib.compress(np.ascontiguousarray(values).tobytes())
+        elif name == SNAPPY:
+            values = _snappy().compress(np.ascontiguousarray(values).tobytes())
+
+    return values if isinstance(values, bytes) else values.tobytes()
+
+
+def decode(blob: bytes, codec: str, dtype: str) -> np.ndarray:
+    """Decodes samples encoded by `encode`, of the given dtype."""
+
+    steps = parse_codec(codec)
+    quantized = steps[0][0] == QUANTIZE
+    # Dtype of the samples as stored, before compression.
+    stored = np.dtype("<i8" if quantized else dtype)
+
+    for name, parameter in reversed(steps):
+        if name == ZLIB:
+            blob = zlib.decompress(blob)
+        elif name == SNAPPY:
+            blob = _snappy().uncompress(blob)
+        elif name == DELTA:
+            differences = np.frombuffer(blob, dtype=f"<u{stored.itemsize}")
+            blob = np.cumsum(differences, dtype=differences.dtype)
+        elif name == QUANTIZE:
+            quanta = np.frombuffer(blob, dtype="<i8")
+            values = (quanta * parameter).astype(dtype)
+            values[quanta == NOT_FINITE] = np.nan
+            return values
+
+    if isinstance(blob, np.ndarray):
+        return blob.view(dtype)
+    return np.frombuffer(blob, dtype=dtype)
@@ -0,0 +1,50 @@
+"""Connections to the redis server, configured from the environment.
+
+Every callback of every session shares the same bounded pool of connections. When all
+of them are in use, callbacks wait for one to be released, up to REDIS_POOL_TIMEOUT
+seconds, instead of opening new ones.
+
+Dash callbacks are synchronous, and run in the pool of threads of the WSGI middleware,
+so concurrent sessions are served by threads sharing this pool, rather than by an
+asyncio client, which would only help code running on the event loop.
+"""
+
+import os
+
+import redis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD") or None
+
+# Number of threads of anyio, serving the dash callbacks of a single process, when
+# THREADS isn't set.
+DEFAULT_THREADS = 40
+THREADS = int(os.getenv("THREADS") or 0) or None
+REDIS_MAX_CONNECTIONS = int(
+    os.getenv("REDIS_MAX_CONNECTIONS", THREADS or DEFAULT_THREADS)
+)
+REDIS_POOL_TIMEOUT = int(os.getenv("REDIS_POOL_TIMEOUT", 20))
+
+_pool = None
+
+
+def redis_client() -> redis.Redis:
+    """Returns a redis client using the shared pool of connections."""
+
+    global _pool
+    if _pool is None:
+        _pool = redis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            password=REDIS_PASSWORD,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+        )
+    return redis.Redis(connection_pool=_pool)
+
+
+def pubsub_client() -> redis.Redis:
+    """Returns a redis client with a connection of its own, outside of the shared pool,
+    for subscriptions holding their connection indefinitely."""
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
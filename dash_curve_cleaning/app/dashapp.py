@@ -1,35 +1,89 @@
+import copy
 import json
-from typing import Dict, List, Optional, Tuple
+import os
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from uuid import uuid4
 
+import flask
 import numpy as np
-import redis
 import woodpecker as wp
-from dash import Dash, dcc, html
-from dash.dependencies import Input, Output
+from dash import Dash, Patch, ctx, dcc, html, no_update
+from dash.dependencies import MATCH, ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 from furl import furl
 from plotly.graph_objs import Figure as PlotlyFigure, Scattergl
 from pydantic import BaseModel, validator
 
-BaseModel.Config.validate_all = True
+from cache import MAX_BYTES, SHARED_MAX_BYTES, SeriesCache, SharedSeriesCache
+from connections import pubsub_client, redis_client
+from datastore import RedisStore
+from density import (
+    AUTO,
+    DEFAULT_BIN_PIXELS,
+    DEFAULT_THRESHOLD,
+    DENSITY,
+    bin_centers,
+    bin_counts,
+    colorscale,
+    log_density,
+    use_density,
+)
+from downsampling import DEFAULT_N_OUT, Downsampler
+from envelope import SIDES, Boundary, ClassificationCache, boundary
+from metrics import BYTES, COUNT, collect, observe, phase
+from payload import compact_samples, typed_arrays_supported
+from selection import IndexCache, exclude, exclusions_key
+from series import series_key
+from stats import FULL, RANGES, ROBUST
+from sync import PointBoard
+from traces import (
+    DEFAULT_MAX_TRACES,
+    DEFAULT_WEBGL_THRESHOLD,
+    PER_STAGE,
+    merge_assets,
+    merged_indices,
+    merged_samples,
+    trace_type,
+)
+from writer import DEFAULT_DELAY, PointWriter, version_key
 
-# WIDTH = int(os.getenv("WIDTH"))
-# HEIGHT = int(os.getenv("HEIGHT"))
-# DEBUG = int(os.getenv("DEBUG"))
+BaseModel.Config.validate_all = True
 
-WIDTH = 1200
-HEIGHT = 600
-DEBUG = 1
+WIDTH = int(os.getenv("WIDTH", 1200))
+HEIGHT = int(os.getenv("HEIGHT", 600))
+# Size of the figure of every asset, in the grid view.
+PANEL_WIDTH = int(os.getenv("PANEL_WIDTH", 450))
+PANEL_HEIGHT = int(os.getenv("PANEL_HEIGHT", 350))
+DEBUG = int(os.getenv("DEBUG", 1))
+# Interval in seconds at which the samples appended to the series are read, 0 to never
+# read them.
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", 0))
+# Interval in seconds at which the points moved by other sessions are applied, 0 to never
+# apply them.
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", 0))
+# Seconds the moved points are held for before being written, to write those of
+# consecutive moves at once.
+POINT_WRITE_DELAY = float(os.getenv("POINT_WRITE_DELAY", DEFAULT_DELAY))
+# Seconds without any point dragged in the browser after which the dragged points are
+# sent to the server, see assets/points.js.
+POINT_SEND_DELAY = float(os.getenv("POINT_SEND_DELAY", 0.3))
+# Bytes of series cached by each process, and by all the processes of the host in the
+# SHARED_CACHE_DIR directory, if any.
+SERIES_CACHE_BYTES = int(os.getenv("SERIES_CACHE_BYTES", MAX_BYTES))
+SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR", "")
+SHARED_CACHE_BYTES = int(os.getenv("SHARED_CACHE_BYTES", SHARED_MAX_BYTES))
+# Whether the samples are sent to the browser as typed arrays rather than as decimal
+# numbers, when plotly.js supports them (see `payload`).
+TYPED_ARRAYS = bool(int(os.getenv("TYPED_ARRAYS", 1))) and typed_arrays_supported()
 
 if DEBUG:
     wp.set_level("DEBUG")
 else:
     wp.set_level("INFO")
 
-redis_cl = redis.Redis(
-    # host=os.getenv('REDIS_HOST'),
-    # port=int(os.getenv('REDIS_PORT')),
-    # password=os.getenv('REDIS_PASSWORD'),
-)
+redis_cl = redis_client()
 
 COLORS = [
     "#1f77b4",  # muted blue
@@ -49,6 +103,27 @@ LINE_COLORS = [
     "lightsalmon",
 ]
 
+# Color of the samples removed by the envelope, when shown.
+REMOVED_COLOR = "lightgrey"
+
+SHAPE_RELAYOUT_KEY = re.compile(r"^shapes\[(\d+)\](?:\.(x0|x1|y0|y1))?$")
+
+# The series displayed by the app are kept here once read from redis, so callbacks
+# that follow the initial load don't have to read or send them again, and neither do
+# the loads of urls displaying the same series, as long as they didn't change.
+SERIES_CACHE = SeriesCache(
+    SERIES_CACHE_BYTES,
+    SharedSeriesCache(SHARED_CACHE_DIR, SHARED_CACHE_BYTES)
+    if SHARED_CACHE_DIR
+    else None,
+)
+POINT_BOARD = PointBoard()
+POINT_WRITER = PointWriter(redis_cl, POINT_WRITE_DELAY)
+# Samples removed by the envelope drawn with the points, see `classify`.
+CLASSIFICATION_CACHE = ClassificationCache()
+# Grids of the samples selected in the figure, see `select`.
+INDEX_CACHE = IndexCache()
+
 
 class LineShape(BaseModel):
     """A model representative of a Plotly line shape."""
@@ -108,23 +183,111 @@ class FigureModel(BaseModel):
 
     CIRCLE_SIZE = 10
 
-    class Data(BaseModel):
+    class Data:
+        """A Plotly trace. Unlike the other models, traces aren't validated, so that
+        their samples can be kept as numpy arrays, without checking or copying every
+        single sample."""
+
         class Marker(BaseModel):
             color: str = "#636efa"
             symbol: str = "circle"
             size: int = 5
 
-        x: List[float] = []
-        y: List[float] = []
-        marker: Marker = Marker()
-        xaxis: str = "x"
-        yaxis: str = "y"
-        type: str = "scatter"
-        legendgroup: str = ""
-        mode: str = "markers"
-        name: str = ""
-        orientation: str = "v"
-        showlegend: bool = True
+        __slots__ = (
+            "x",
+            "y",
+            "marker",
+            "xaxis",
+            "yaxis",
+            "type",
+            "legendgroup",
+            "mode",
+            "name",
+            "orientation",
+            "showlegend",
+            "customdata",
+        )
+
+        def __init__(
+            self,
+            x: Optional[Sequence[float]] = None,
+            y: Optional[Sequence[float]] = None,
+            marker: Optional[Marker] = None,
+            xaxis: str = "x",
+            yaxis: str = "y",
+            type: str = "scatter",
+            legendgroup: str = "",
+            mode: str = "markers",
+            name: str = "",
+            orientation: str = "v",
+            showlegend: bool = True,
+            customdata: Optional[np.ndarray] = None,
+        ):
+            self.x = np.empty(0) if x is None else x
+            self.y = np.empty(0) if y is None else y
+            self.marker = FigureModel.Data.Marker() if marker is None else marker
+            self.xaxis = xaxis
+            self.yaxis = yaxis
+            self.type = type
+            self.legendgroup = legendgroup
+            self.mode = mode
+            self.name = name
+            self.orientation = orientation
+            self.showlegend = showlegend
+            # Index of the asset of every sample of a trace merging assets.
+            self.customdata = customdata
+
+        def dict(self) -> Dict:
+            """Returns the dictionary of the trace, as expected by plotly. The samples
+            aren't copied."""
+
+            dct = {name: getattr(self, name) for name in self.__slots__}
+            dct["marker"] = self.marker.dict()
+            if self.customdata is None:
+                del dct["customdata"]
+            return dct
+
+    class Heatmap:
+        """A Plotly heatmap trace, used to draw the density of the samples of a stage.
+        Like `Data`, it isn't validated."""
+
+        __slots__ = (
+            "x",
+            "y",
+            "z",
+            "colorscale",
+            "type",
+            "legendgroup",
+            "name",
+            "showlegend",
+            "showscale",
+            "hoverinfo",
+        )
+
+        def __init__(
+            self,
+            x: np.ndarray,
+            y: np.ndarray,
+            z: np.ndarray,
+            colorscale: List,
+            legendgroup: str = "",
+            name: str = "",
+            showlegend: bool = True,
+        ):
+            self.x = x
+            self.y = y
+            self.z = z
+            self.colorscale = colorscale
+            self.type = "heatmap"
+            self.legendgroup = legendgroup
+            self.name = name
+            self.showlegend = showlegend
+            self.showscale = False
+            self.hoverinfo = "skip"
+
+        def dict(self) -> Dict:
+            """Returns the dictionary of the trace, as expected by plotly."""
+            return {name: getattr(self, name) for name in self.__slots__}
 
     class Layout(BaseModel):
         class Axis(BaseModel):
@@ -137,14 +300,24 @@ class FigureModel(BaseModel):
         shapes: List[CircleShape] = []
         yaxis: Axis
         xaxis: Axis
+        width: int = WIDTH
+        height: int = HEIGHT
+        # Plotly keeps this attribute as is, we use it to remember how the figure
+        # was rendered.
+        meta: Dict[str, str] = {}
 
-    data: List[Data] = []
+    data: List[Union[Data, Heatmap]] = []
     layout: Layout
     point_groups: Dict[str, List[str]]
     point_names: List[str]
     assets: List[str]
     x_name: str
     y_name: str
+    # Message to show the user, such as the points of the session that weren't saved.
+    notice: Optional[str] = None
+
+    class Config:
+        arbitrary_types_allowed = True
 
     @property
     def x_range(self) -> float:
@@ -158,105 +331,486 @@ class FigureModel(BaseModel):
     def scale_x(self) -> float:
         """Returns the size in pixels of a single unit of the X variable."""
 
-        return self.x_range / WIDTH
+        return self.x_range / self.layout.width
 
     @property
     def scale_y(self) -> float:
         """Returns the size in pixels of a single unit of the y variable."""
 
-        return self.y_range / HEIGHT
+        return self.y_range / self.layout.height
+
+    @property
+    def density(self) -> bool:
+        """Whether the samples are rendered as densities rather than scatter traces."""
+
+        return self.layout.meta.get("render") == DENSITY
+
+    @property
+    def merged(self) -> bool:
+        """Whether the samples of the assets of a stage are drawn as a single trace
+        (see `traces`)."""
+
+        return self.layout.meta.get("traces") == PER_STAGE
 
     def __iter__(self):
         return iter(self.layout.shapes)
 
+    def n_sample_traces(self, stages) -> int:
+        """Returns the number of traces drawing the samples, which come before the
+        traces drawing the lines."""
+
+        if self.density or self.merged:
+            return len(stages)
+        return len(stages) * len(self.assets)
+
+    def _per_stage(self, items: List) -> List[List]:
+        """Splits items given for every asset/stage into those of every stage."""
+
+        n_assets = len(self.assets)
+        return [items[i : i + n_assets] for i in range(0, len(items), n_assets)]
+
+    def sample_traces(self, series: List[Tuple[np.ndarray, np.ndarray]]) -> List[Dict]:
+        """Returns the samples of every trace drawing them, x, y and, if the traces
+        are merged, customdata, given the samples of every asset/stage, in the same
+        order as the traces added by `populate_figure_data`."""
+
+        if self.merged:
+            return [merged_samples(stage) for stage in self._per_stage(series)]
+        return [{"x": x, "y": y} for x, y in series]
+
+    def trace_indices(
+        self, indices: List[np.ndarray], lengths: List[int]
+    ) -> List[np.ndarray]:
+        """Returns the indices in every trace drawing the samples of samples given by
+        their indices in the series of every asset/stage, holding `lengths` paired
+        samples."""
+
+        if self.merged:
+            return [
+                merged_indices(stage, stage_lengths)
+                for stage, stage_lengths in zip(
+                    self._per_stage(indices), self._per_stage(lengths)
+                )
+            ]
+        return indices
+
     def set_titles(self, x_title, y_title):
         """Sets the figure titles for the x and y axis."""
         self.layout.xaxis.title = FigureModel.Layout.Axis.Title(text=x_title)
         self.layout.yaxis.title = FigureModel.Layout.Axis.Title(text=y_title)
 
+    @staticmethod
+    def _padded_range(min_value: float, max_value: float) -> Tuple[float, float]:
+        return (
+            min_value - (max_value - min_value) * 0.05,
+            max_value + (max_value - min_value) * 0.05,
+        )
+
     def set_ranges(self, min_x: float, max_x: float, min_y: float, max_y: float):
         """Sets the figure ranges for the x and y axis."""
-        self.layout.xaxis.range = (
-            min_x - (max_x - min_x) * 0.05,
-            max_x + (max_x - min_x) * 0.05,
-        )
-        self.layout.yaxis.range = (
-            min_y - (max_y - min_y) * 0.05,
-            max_y + (max_y - min_y) * 0.05,
-        )
+        self.layout.xaxis.range = self._padded_range(min_x, max_x)
+        self.layout.yaxis.range = self._padded_range(min_y, max_y)
 
-    def populate_figure_data(self, uuid: str, plot, stages):
-        """Populates the figure data based on the data saved in the redis server."""
+    @property
+    def lengths(self) -> Optional[List[int]]:
+        """Returns the number of samples read so far from the series of every
+        asset/stage trace, or None if the figure doesn't read the samples appended to
+        its series (see `follow_tail`)."""
 
-        min_x = np.inf
-        max_x = -np.inf
-        min_y = np.inf
-        max_y = -np.inf
+        lengths = self.layout.meta.get("lengths")
+        if lengths is None:
+            return None
+        return [int(length) for length in lengths.split(",") if length]
 
-        if len(self.data[0].x) == 0:
+    @property
+    def extent(self) -> Tuple[float, float, float, float]:
+        """Returns the minimum and maximum of the x and y samples read so far."""
+        return tuple(float(value) for value in self.layout.meta["extent"].split(","))
+
+    def fits_extent(self) -> bool:
+        """Whether the figure ranges are still those set from the extent of the samples
+        read so far, that is whether the viewport wasn't zoomed or panned."""
+
+        min_x, max_x, min_y, max_y = self.extent
+        if not np.isfinite(min_x):
+            return True
+        return np.allclose(
+            self.layout.xaxis.range, self._padded_range(min_x, max_x)
+        ) and np.allclose(self.layout.yaxis.range, self._padded_range(min_y, max_y))
+
+    def apply_relayout(self, relayout_data: Optional[Dict]) -> Tuple[bool, bool]:
+        """Applies the axis changes of a relayout event to the figure layout. Returns
+        whether the viewport changed and whether the axes were asked to autorange."""
+
+        if not relayout_data:
+            return False, False
+
+        changed = False
+        autorange = False
+        for axis_name in ("xaxis", "yaxis"):
+            axis = getattr(self.layout, axis_name)
+            if relayout_data.get(f"{axis_name}.autorange"):
+                autorange = True
+            elif f"{axis_name}.range[0]" in relayout_data:
+                axis.range = (
+                    relayout_data[f"{axis_name}.range[0]"],
+                    relayout_data[f"{axis_name}.range[1]"],
+                )
+                changed = True
+            elif f"{axis_name}.range" in relayout_data:
+                axis.range = tuple(relayout_data[f"{axis_name}.range"])
+                changed = True
 
-            self.data = []
-            i = 0
-            for stage_idx, stage in enumerate(stages):
-                for _, asset in enumerate(self.assets):
-                    self.data.append(FigureModel.Data())
-                    x = [
-                        float(v)
-                        for v in redis_cl.lrange(
-                            f"{uuid}:{plot}:{asset}:{self.x_name}:{stage}", 0, -1
-                        )
-                    ]
-                    y = [
-                        float(v)
-                        for v in redis_cl.lrange(
-                            f"{uuid}:{plot}:{asset}:{self.y_name}:{stage}", 0, -1
-                        )
-                    ]
+        return changed or autorange, autorange
+
+    def series_keys(self, uuid: str, plot, stages) -> List[str]:
+        """Returns the keys of the series displayed in the figure."""
+
+        return [
+            series_key(uuid, plot, asset, var, stage)
+            for stage in stages
+            for asset in self.assets
+            for var in (self.x_name, self.y_name)
+        ]
+
+    def point_keys(self, uuid: str) -> List[str]:
+        """Returns the keys of the point parameters stored in the redis server, along
+        with the key of their version."""
+
+        return [
+            f"{uuid}:{point}.{axis}"
+            for point in self.point_names
+            for axis in ("x", "y")
+        ] + [version_key(uuid)]
+
+    @property
+    def points_version(self) -> Optional[int]:
+        """Returns the version of the saved points the figure points were moved from."""
+
+        version = self.layout.meta.get("version")
+        return None if version is None else int(version)
+
+    def set_points_version(self, version: int):
+        self.layout.meta["version"] = str(version)
+
+    @property
+    def session(self) -> str:
+        """Returns the id of the session displaying the figure, set when loaded."""
+
+        if "session" not in self.layout.meta:
+            self.layout.meta["session"] = uuid4().hex
+        return self.layout.meta["session"]
+
+    def follow_tail(
+        self,
+        store: RedisStore,
+        uuid: str,
+        plot,
+        stages,
+        extent: Tuple[float, float, float, float],
+    ):
+        """Remembers how many samples were read from the series of every asset/stage
+        trace, and their extent, so that only the samples appended to the series later
+        on are read (see `tail_figure_data`)."""
+
+        lengths = [
+            min(
+                store.length(series_key(uuid, plot, asset, self.x_name, stage)),
+                store.length(series_key(uuid, plot, asset, self.y_name, stage)),
+            )
+            for stage in stages
+            for asset in self.assets
+        ]
+        self.layout.meta["lengths"] = ",".join(str(length) for length in lengths)
+        self.layout.meta["extent"] = ",".join(repr(float(value)) for value in extent)
+
+    def tail_figure_data(
+        self, store: RedisStore, uuid: str, plot, stages, robust: bool = False
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Returns the samples appended to the series since they were last read, for
+        every asset/stage trace, in the same order as the traces added by
+        `populate_figure_data`. Only those samples are read, and the lengths and the
+        extent remembered by `follow_tail` are updated from them alone. A `robust`
+        extent is kept as is, rather than stretched to outliers of the new samples."""
+
+        offsets = {}
+        keys = []
+        traces = ((stage, asset) for stage in stages for asset in self.assets)
+        for (stage, asset), length in zip(traces, self.lengths):
+            x_key = series_key(uuid, plot, asset, self.x_name, stage)
+            y_key = series_key(uuid, plot, asset, self.y_name, stage)
+            offsets[x_key] = offsets[y_key] = length
+            keys.append((x_key, y_key))
+
+        tails = store.tails(offsets)
+
+        min_x, max_x, min_y, max_y = self.extent
+        lengths = []
+        series = []
+        for x_key, y_key in keys:
+            # The x and y samples of a trace go in pairs, unpaired samples are left for
+            # the next read.
+            n = min(len(tails[x_key]), len(tails[y_key]))
+            x = tails[x_key][:n]
+            y = tails[y_key][:n]
+            store.extend(x_key, offsets[x_key], x)
+            store.extend(y_key, offsets[y_key], y)
+            if n > 0 and not robust:
+                min_x = min(min_x, x.min())
+                max_x = max(max_x, x.max())
+                min_y = min(min_y, y.min())
+                max_y = max(max_y, y.max())
+            lengths.append(offsets[x_key] + n)
+            series.append((x, y))
+
+        self.layout.meta["lengths"] = ",".join(str(length) for length in lengths)
+        self.layout.meta["extent"] = ",".join(
+            repr(float(value)) for value in (min_x, max_x, min_y, max_y)
+        )
+        return series
+
+    def read_figure_data(
+        self, store: RedisStore, uuid: str, plot, stages
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Returns the samples read so far (see `follow_tail`) of the series of every
+        asset/stage trace, in the same order as the traces added by
+        `populate_figure_data`."""
+
+        store.prefetch(series_keys=self.series_keys(uuid, plot, stages))
+
+        series = []
+        traces = ((stage, asset) for stage in stages for asset in self.assets)
+        for (stage, asset), length in zip(traces, self.lengths):
+            x = store.series(series_key(uuid, plot, asset, self.x_name, stage))
+            y = store.series(series_key(uuid, plot, asset, self.y_name, stage))
+            series.append((x[:length], y[:length]))
+        return series
+
+    def populate_figure_data(
+        self,
+        store: RedisStore,
+        uuid: str,
+        plot,
+        stages,
+        downsampler: Optional[Downsampler] = None,
+        levels: Optional[Dict[str, int]] = None,
+        robust: bool = False,
+        webgl_threshold: int = DEFAULT_WEBGL_THRESHOLD,
+    ):
+        """Populates the figure data based on the data saved in the redis server. If a
+        downsampler is given, only the downsampled series are added to the figure, and
+        if pyramid levels are given (see `pyramid_levels`), only those are read. The
+        traces are merged by stage if the figure is `merged`, and drawn with WebGL
+        past `webgl_threshold` samples (see `traces`). Returns the extent of the
+        series, `robust` or not (see `_extent`)."""
+
+        if len(self.data) == 0 or len(self.data[0].x) == 0:
+
+            series = []
+            names = []
+            for stage in stages:
+                for asset in self.assets:
+                    x_key = series_key(uuid, plot, asset, self.x_name, stage)
+                    y_key = series_key(uuid, plot, asset, self.y_name, stage)
+                    x = store.series(x_key, None if levels is None else levels[x_key])
+                    y = store.series(y_key, None if levels is None else levels[y_key])
 
                     wp.debug(len(x))
                     wp.debug(len(y))
 
-                    self.data[i].x = x
-                    self.data[i].y = y
-                    self.data[i].name = f"{asset}:{stage}"
-                    self.data[i].legendgroup = f"{asset}:{stage}"
-                    self.data[i].marker.color = COLORS[stage_idx]
+                    if downsampler is not None:
+                        x, y = downsampler(x, y)
+
+                    series.append((x, y))
+                    names.append(f"{asset}:{stage}")
 
-                    if len(self.data[i].x) > 0 and len(self.data[i].y) > 0:
-                        min_x = min(min_x, min(self.data[i].x))
-                        max_x = max(max_x, max(self.data[i].x))
-                        min_y = min(min_y, min(self.data[i].y))
-                        max_y = max(max_y, max(self.data[i].y))
+            traces = self.sample_traces(series)
+            if self.merged:
+                names = list(stages)
+            traces_per_stage = len(traces) // len(stages)
+            kind = trace_type(sum(len(trace["x"]) for trace in traces), webgl_threshold)
 
-                    i += 1
+            self.data = []
+            for i, (samples, name) in enumerate(zip(traces, names)):
+                data = FigureModel.Data(type=kind, name=name, legendgroup=name)
+                data.x = samples["x"]
+                data.y = samples["y"]
+                data.customdata = samples.get("customdata")
+                data.marker.color = COLORS[i // traces_per_stage]
+                self.data.append(data)
 
-            return min_x, max_x, min_y, max_y
+            return self._extent(store, uuid, plot, stages, robust)
 
         return None, None, None, None
 
-    def populate_points(self, uuid: str):
+    def _extent(self, store: RedisStore, uuid: str, plot, stages, robust: bool = False):
+        """Returns the minimum and maximum of the x and y series of all the traces, taken
+        from the statistics of the series when they have some. If `robust`, the
+        ROBUST_QUANTILES of the series are used instead, leaving their outliers out."""
+
+        min_x = np.inf
+        max_x = -np.inf
+        min_y = np.inf
+        max_y = -np.inf
+        for stage in stages:
+            for asset in self.assets:
+                extent_x = store.extent(
+                    series_key(uuid, plot, asset, self.x_name, stage), robust
+                )
+                extent_y = store.extent(
+                    series_key(uuid, plot, asset, self.y_name, stage), robust
+                )
+                if extent_x is not None and extent_y is not None:
+                    min_x = min(min_x, extent_x[0])
+                    max_x = max(max_x, extent_x[1])
+                    min_y = min(min_y, extent_y[0])
+                    max_y = max(max_y, extent_y[1])
+
+        return min_x, max_x, min_y, max_y
+
+    def pyramid_levels(
+        self, store: RedisStore, uuid: str, plot, stages, n_out: int
+    ) -> Optional[Dict[str, int]]:
+        """Picks, for every series, the coarsest level of its pyramid expected to hold at
+        least `n_out` samples inside the current viewport, estimating the share of
+        samples inside the viewport from the coarsest level. Returns None if any series
+        has no pyramid."""
+
+        x_range = self.layout.xaxis.range
+        y_range = self.layout.yaxis.range
+
+        levels = {}
+        for stage in stages:
+            for asset in self.assets:
+                x_key = series_key(uuid, plot, asset, self.x_name, stage)
+                y_key = series_key(uuid, plot, asset, self.y_name, stage)
+                pyramid = store.pyramid(x_key)
+                if (
+                    pyramid is None
+                    or store.pyramid(y_key) is None
+                    or store.pyramid(y_key).length != pyramid.length
+                ):
+                    return None
+
+                x = store.series(x_key, pyramid.levels[0])
+                y = store.series(y_key, pyramid.levels[0])
+                inside = np.count_nonzero(
+                    (x >= x_range[0])
+                    & (x <= x_range[1])
+                    & (y >= y_range[0])
+                    & (y <= y_range[1])
+                )
+                share = max(inside, 1) / max(len(x), 1)
+                levels[x_key] = levels[y_key] = pyramid.level(
+                    int(np.ceil(n_out / share))
+                )
+
+        return levels
+
+    def resample_figure_data(
+        self,
+        store: RedisStore,
+        uuid: str,
+        plot,
+        stages,
+        downsampler: Downsampler,
+        levels: Optional[Dict[str, int]] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Returns the downsampled samples of the current viewport, for every asset/stage
+        trace, in the same order as the traces added by `populate_figure_data`. If
+        pyramid levels are given (see `pyramid_levels`), only those are read."""
+
+        series = []
+        for stage in stages:
+            for asset in self.assets:
+                x_key = series_key(uuid, plot, asset, self.x_name, stage)
+                y_key = series_key(uuid, plot, asset, self.y_name, stage)
+                x, y = downsampler(
+                    store.series(x_key, None if levels is None else levels[x_key]),
+                    store.series(y_key, None if levels is None else levels[y_key]),
+                    self.layout.xaxis.range,
+                    self.layout.yaxis.range,
+                )
+                wp.debug(f"Resampled {asset}:{stage} to {len(x)} samples.")
+                series.append((x, y))
+
+        return series
+
+    def density_figure_data(
+        self,
+        store: RedisStore,
+        uuid: str,
+        plot,
+        stages,
+        bin_pixels: int = DEFAULT_BIN_PIXELS,
+    ) -> List[Heatmap]:
+        """Returns a heatmap trace per stage, binning the samples of all the assets over
+        the current viewport, with bins of `bin_pixels` pixels."""
+
+        n_x = max(self.layout.width // bin_pixels, 1)
+        n_y = max(self.layout.height // bin_pixels, 1)
+
+        traces = []
+        for stage_idx, stage in enumerate(stages):
+            counts = bin_counts(
+                (
+                    (
+                        store.series(series_key(uuid, plot, asset, self.x_name, stage)),
+                        store.series(series_key(uuid, plot, asset, self.y_name, stage)),
+                    )
+                    for asset in self.assets
+                ),
+                self.layout.xaxis.range,
+                self.layout.yaxis.range,
+                n_x,
+                n_y,
+            )
+            wp.debug(f"Binned {counts.sum()} samples of stage {stage}.")
+
+            traces.append(
+                FigureModel.Heatmap(
+                    x=bin_centers(self.layout.xaxis.range, n_x),
+                    y=bin_centers(self.layout.yaxis.range, n_y),
+                    z=log_density(counts),
+                    colorscale=colorscale(COLORS[stage_idx]),
+                    legendgroup=stage,
+                    name=stage,
+                )
+            )
+
+        return traces
+
+    def reset_ranges(
+        self, store: RedisStore, uuid: str, plot, stages, robust: bool = False
+    ):
+        """Sets the figure ranges to the extent of the full series, `robust` or not (see
+        `_extent`), as done when the figure is first populated. Returns that extent."""
+
+        min_x, max_x, min_y, max_y = self._extent(store, uuid, plot, stages, robust)
+        if np.isfinite(min_x):
+            self.set_ranges(min_x, max_x, min_y, max_y)
+        return min_x, max_x, min_y, max_y
+
+    def populate_points(self, store: RedisStore, uuid: str):
         """Populates the image points based on the data saved in the redis server."""
 
         self.layout.shapes = []
         for point in self.point_names:
-            try:
-                x = float(redis_cl.mget(f"{uuid}:{point}.x")[0])
-                no_x = False
-            except TypeError:
+            x = store.point(f"{uuid}:{point}.x")
+            no_x = x is None
+            if no_x:
                 x = np.mean(self.layout.xaxis.range)
-                no_x = True
 
-            try:
-                y = float(redis_cl.mget(f"{uuid}:{point}.y")[0])
-                no_y = False
-            except TypeError:
+            y = store.point(f"{uuid}:{point}.y")
+            no_y = y is None
+            if no_y:
                 y = np.mean(self.layout.yaxis.range)
-                no_y = True
 
             wp.debug(f"points: {y}")
 
+            # Built without validation, its position is set by `update_points`.
             self.layout.shapes.append(
-                CircleShape(
+                CircleShape.construct(
                     x0=x,
                     y0=y,
                     x1=x + self.scale_x * self.CIRCLE_SIZE,
@@ -266,6 +820,16 @@ class FigureModel(BaseModel):
                 )
             )
 
+    def set_line_traces(self, stages):
+        """Remembers the size of the point groups and the index of the first trace
+        drawing their lines, so that the browser can redraw the lines as points are
+        dragged (see assets/points.js)."""
+
+        self.layout.meta["groups"] = ",".join(
+            str(len(point_group)) for point_group in self.point_groups.values()
+        )
+        self.layout.meta["lines"] = str(self.n_sample_traces(stages))
+
     def populate_lines(self):
         """Draws a set of lines connecting each points group."""
 
@@ -288,24 +852,20 @@ class FigureModel(BaseModel):
 
             self.data.append(data)
 
-    def update_points(self, uuid: str):
+    def update_points(self, store: RedisStore, uuid: str):
         """Updates the figure points based on the data stored in the redis server."""
 
         for i, point in enumerate(self.layout.shapes):
-            try:
-                float(redis_cl.mget(f"{uuid}:{self.point_names[i]}.x")[0])
-                no_x = False
-            except TypeError:
-                no_x = True
-
-            try:
-                float(redis_cl.mget(f"{uuid}:{self.point_names[i]}.y")[0])
-                no_y = False
-            except TypeError:
-                no_y = True
-
-            point.no_x = no_x
-            point.no_y = no_y
+            point.no_x = store.point(f"{uuid}:{self.point_names[i]}.x") is None
+            point.no_y = store.point(f"{uuid}:{self.point_names[i]}.y") is None
+        self.rescale_points()
+
+    def rescale_points(self):
+        """Fits the figure points to the current ranges, without reading redis: the
+        coordinates they don't have stay in the middle of the viewport, and their
+        circles keep the same size in pixels."""
+
+        for point in self.layout.shapes:
             if point.no_x:
                 point.x0 = np.mean(self.layout.xaxis.range)
             if point.no_y:
@@ -313,6 +873,22 @@ class FigureModel(BaseModel):
             point.x1 = point.x0 + self.scale_x * self.CIRCLE_SIZE
             point.y1 = point.y0 + self.scale_y * self.CIRCLE_SIZE
 
+    def sync_points(self, uuid: str, points: Dict[str, float]):
+        """Moves the points to the given point parameters, indexed by their redis key,
+        such as those published by other sessions (see `sync`)."""
+
+        for i, point in enumerate(self.layout.shapes):
+            x = points.get(f"{uuid}:{self.point_names[i]}.x")
+            y = points.get(f"{uuid}:{self.point_names[i]}.y")
+            if x is not None:
+                point.x0 = x
+                point.no_x = False
+            if y is not None:
+                point.y0 = y
+                point.no_y = False
+            point.x1 = point.x0 + self.scale_x * self.CIRCLE_SIZE
+            point.y1 = point.y0 + self.scale_y * self.CIRCLE_SIZE
+
     def update_lines(self):
         """Updates the drawn lines based on the new position of the points."""
 
@@ -377,17 +953,179 @@ class FigureModel(BaseModel):
             point_idx += 1
         return x, y, point_idx
 
-    def save_points(self, uuid: str):
-        """Saves the point parameters on the redis server."""
+    def boundaries(self, sides: List[str]) -> List[Boundary]:
+        """Returns the boundaries drawn by the point groups, each removing the samples
+        on the given side of it (see `envelope`). Like the lines of the groups, they go
+        through the centers of the points."""
 
+        boundaries = []
+        point_idx = 0
+        for point_group, side in zip(self.point_groups.values(), sides):
+            shapes = self.layout.shapes[point_idx : point_idx + len(point_group)]
+            point_idx += len(point_group)
+            group_boundary = boundary(
+                [
+                    (
+                        (shape.x0 + shape.x1) / 2,
+                        (shape.y0 + shape.y1) / 2,
+                        shape.no_x,
+                        shape.no_y,
+                    )
+                    for shape in shapes
+                ],
+                side,
+            )
+            if group_boundary is not None:
+                boundaries.append(group_boundary)
+        return boundaries
+
+    def classify(
+        self,
+        store: RedisStore,
+        uuid: str,
+        plot,
+        stages,
+        sides: List[str],
+        cache: ClassificationCache,
+    ) -> List[Tuple[np.ndarray, int]]:
+        """Returns the indices of the samples removed by the envelope drawn with the
+        points, and the number of samples, of the full series of every asset/stage
+        trace, in the same order as the traces added by `populate_figure_data`."""
+
+        boundaries = self.boundaries(sides)
+        store.prefetch(series_keys=self.series_keys(uuid, plot, stages))
+
+        classifications = []
+        for stage in stages:
+            for asset in self.assets:
+                x_key = series_key(uuid, plot, asset, self.x_name, stage)
+                y_key = series_key(uuid, plot, asset, self.y_name, stage)
+                x = store.series(x_key)
+                y = store.series(y_key)
+                n = min(len(x), len(y))
+                removed = cache.removed(
+                    uuid, (x_key, y_key, n), x[:n], y[:n], boundaries
+                )
+                classifications.append((removed, n))
+        return classifications
+
+    def select(
+        self,
+        store: RedisStore,
+        uuid: str,
+        plot,
+        stages,
+        selected_data: Dict,
+        cache: IndexCache,
+    ) -> List[np.ndarray]:
+        """Returns the indices of the samples inside the box or the lasso of a plotly
+        selection event, in the full series of every asset/stage trace, in the same
+        order as the traces added by `populate_figure_data`."""
+
+        store.prefetch(series_keys=self.series_keys(uuid, plot, stages))
+
+        selections = []
+        for stage in stages:
+            for asset in self.assets:
+                x_key = series_key(uuid, plot, asset, self.x_name, stage)
+                y_key = series_key(uuid, plot, asset, self.y_name, stage)
+                x = store.series(x_key)
+                y = store.series(y_key)
+                n = min(len(x), len(y))
+                index = cache.index(uuid, (x_key, y_key, n), x[:n], y[:n])
+                if "lassoPoints" in selected_data:
+                    lasso = selected_data["lassoPoints"]
+                    selections.append(index.lasso(lasso["x"], lasso["y"]))
+                elif "range" in selected_data:
+                    box = selected_data["range"]
+                    selections.append(index.box(box["x"], box["y"]))
+                else:
+                    selections.append(index.order[:0])
+        return selections
+
+    def point_values(self, uuid: str) -> Dict[str, float]:
+        """Returns the point parameters of the figure, indexed by their redis key."""
+
+        points_dict = {}
         for i, point in enumerate(self.point_names):
-            points_dict = {}
             if not self.layout.shapes[i].no_x:
                 points_dict.update({f"{uuid}:{point}.x": self.layout.shapes[i].x0})
             if not self.layout.shapes[i].no_y:
                 points_dict.update({f"{uuid}:{point}.y": self.layout.shapes[i].y0})
-            wp.debug(points_dict)
-            redis_cl.mset(points_dict)
+        return points_dict
+
+    @staticmethod
+    def point_name(uuid: str, key: str) -> str:
+        """Returns the name of the point of the redis key of one of its parameters."""
+        return key[len(uuid) + 1 :].rsplit(".", 1)[0]
+
+    def reject_points(self, uuid: str, keys: List[str]):
+        """Sets the notice telling the user the point parameters of the given keys
+        weren't saved."""
+
+        names = sorted({self.point_name(uuid, key) for key in keys})
+        if names:
+            self.notice = (
+                "Another session saved its points in the meantime, the moves of "
+                f"{', '.join(names)} were not saved."
+            )
+
+    def save_points(
+        self,
+        store: RedisStore,
+        uuid: str,
+        writer: PointWriter,
+        moved: Sequence[str] = (),
+    ):
+        """Saves the point parameters that changed on the redis server, through the
+        writer. If other sessions saved theirs since the figure points were read, the
+        figure points are moved to the saved ones instead, and nothing is saved. The
+        figure notice then names the points whose moves were lost, the `moved` points
+        as well as those of earlier writes of the session that didn't go through."""
+
+        saved_version = int(store.point(version_key(uuid)) or 0)
+        version = writer.version(
+            uuid,
+            self.session,
+            saved_version if self.points_version is None else self.points_version,
+            saved_version,
+            store,
+        )
+        point_keys = self.point_keys(uuid)[:-1]
+        points_dict = self.point_values(uuid)
+        if version != saved_version:
+            wp.warning(
+                f"Points of {uuid} were saved by another session since version "
+                f"{version}, they're reloaded."
+            )
+            saved = {
+                key: store.point(key)
+                for key in point_keys
+                if store.point(key) is not None
+            }
+            self.sync_points(uuid, saved)
+            self.set_points_version(saved_version)
+            lost = [key for key in points_dict if self.point_name(uuid, key) in moved]
+            rejected = writer.rejected(uuid, self.session, store)
+            self.reject_points(uuid, lost + rejected)
+            return
+
+        # Only the points that moved since they were saved are written.
+        saved = {key: store.point(key) for key in point_keys}
+        saved.update(writer.pending(uuid, self.session))
+        changed = {
+            key: float(value)
+            for key, value in points_dict.items()
+            if saved.get(key) != value
+        }
+        wp.debug(changed)
+        if changed:
+            # The points of earlier writes that didn't go through are written again if
+            # the figure still shows their moves.
+            rejected = writer.rejected(uuid, self.session, store)
+            self.reject_points(uuid, [key for key in rejected if key not in changed])
+            writer.save(uuid, self.session, changed, version)
+        self.set_points_version(version)
 
 
 class Url:
@@ -395,6 +1133,21 @@ class Url:
 
     def __init__(self, url: str):
         self._url = furl(url)
+        self.downsample = self._fetch_optional_param("downsample")
+        self.max_points = int(self._fetch_optional_param("max_points", DEFAULT_N_OUT))
+        # In the auto mode, an explicit downsampling takes precedence over densities,
+        # see `use_density`.
+        self.render = self._fetch_optional_param("render", AUTO)
+        self.density_threshold = int(
+            self._fetch_optional_param("density_threshold", DEFAULT_THRESHOLD)
+        )
+        self.traces = self._fetch_optional_param("traces", AUTO)
+        self.max_traces = int(
+            self._fetch_optional_param("max_traces", DEFAULT_MAX_TRACES)
+        )
+        self.webgl_threshold = int(
+            self._fetch_optional_param("webgl_threshold", DEFAULT_WEBGL_THRESHOLD)
+        )
         self.uuid = self._fetch_param("uuid")
         self.plot = self._fetch_param("plot")
         self.assets = self._parse_list_str(self._fetch_param("assets"))
@@ -409,6 +1162,34 @@ class Url:
         self.point_names = [
             line_name for group in self.point_groups.values() for line_name in group
         ]
+        # Side of the boundary of each point group whose samples are removed, either
+        # "above" or "below", or None to not classify the samples.
+        envelope = self._fetch_optional_param("envelope")
+        self.envelope = None if envelope is None else self._parse_list_str(envelope)
+        if self.envelope is not None and (
+            len(self.envelope) != len(self.point_groups)
+            or not set(self.envelope) <= set(SIDES)
+        ):
+            raise Exception(
+                f"Invalid url provided. envelope must give one of {SIDES} for each "
+                "point group."
+            )
+        self.show_removed = bool(int(self._fetch_optional_param("show_removed", 0)))
+        ranges = self._fetch_optional_param("ranges", FULL)
+        if ranges not in RANGES:
+            raise Exception(f"Invalid url provided. ranges must be one of {RANGES}.")
+        # Whether the axis ranges leave the outliers of the samples out.
+        self.robust = ranges == ROBUST
+        # Whether every asset gets its own figure, see `create_panel`.
+        self.grid = bool(int(self._fetch_optional_param("grid", 0)))
+
+    def panel(self, asset: str) -> "Url":
+        """Returns the url restricted to a single asset, that of its panel in the grid
+        view."""
+
+        url = copy.copy(self)
+        url.assets = [asset]
+        return url
 
     def _fetch_param(self, name: str):
         try:
@@ -416,13 +1197,18 @@ class Url:
         except KeyError:
             raise Exception(f"Invalid url provided. {name} not found.")
 
+    def _fetch_optional_param(self, name: str, default: Optional[str] = None):
+        return self._url.args.pop(name, default)
+
     @staticmethod
     def _parse_list_str(list_str: str) -> List[str]:
         """Parses a string list in format: a,b,c,d."""
         return list_str.split(",")
 
 
-def create_empty_plotly_figure() -> PlotlyFigure:
+def create_empty_plotly_figure(
+    width: int = WIDTH, height: int = HEIGHT, title: str = "Power Curve Cleaning"
+) -> PlotlyFigure:
     """Creates an empty plotly figure."""
 
     figure = PlotlyFigure()
@@ -433,9 +1219,9 @@ def create_empty_plotly_figure() -> PlotlyFigure:
     figure.update_layout(hovermode=False)
     figure.update_traces(marker_size=1)
     figure.update_layout(
-        width=WIDTH,
-        height=HEIGHT,
-        title="Power Curve Cleaning",
+        width=width,
+        height=height,
+        title=title,
         xaxis_title="",
         yaxis_title="",
     )
@@ -443,16 +1229,549 @@ def create_empty_plotly_figure() -> PlotlyFigure:
     return figure
 
 
+def empty_panel_figure(asset: str) -> Dict:
+    """Returns the figure of a panel that isn't loaded, kept small since most of the
+    panels of a large farm aren't."""
+
+    return {
+        "data": [],
+        "layout": {"width": PANEL_WIDTH, "height": PANEL_HEIGHT, "title": asset},
+    }
+
+
+def create_panel(index: int, asset: str) -> html.Div:
+    """Creates the panel of an asset in the grid view, with its own figure, drawing the
+    same points. The figure is only loaded while the panel is visible, see
+    assets/panels.js and `update_panel`."""
+
+    def panel_id(name: str) -> Dict:
+        return {"type": name, "index": index}
+
+    return html.Div(
+        [
+            dcc.Graph(
+                id=panel_id("panel-figure"),
+                figure=empty_panel_figure(asset),
+                config=dict(editable=True),
+            ),
+            html.Pre(id=panel_id("panel-notice")),
+            html.Pre(id=panel_id("panel-envelope")),
+            dcc.Store(id=panel_id("panel-layout")),
+            dcc.Store(id=panel_id("panel-relayout")),
+            dcc.Store(id=panel_id("panel-visible"), data=False),
+            # Only enabled while the panel is loaded.
+            dcc.Interval(
+                id=panel_id("panel-refresh"),
+                interval=max(REFRESH_INTERVAL, 0.1) * 1000,
+                disabled=True,
+            ),
+            dcc.Interval(
+                id=panel_id("panel-sync"),
+                interval=max(SYNC_INTERVAL, 0.1) * 1000,
+                disabled=True,
+            ),
+        ],
+        id=panel_id("panel"),
+        className="panel",
+        style={
+            "display": "inline-block",
+            "verticalAlign": "top",
+            "width": PANEL_WIDTH,
+            "minHeight": PANEL_HEIGHT,
+        },
+    )
+
+
+def apply_shapes_relayout(shapes: List[Dict], relayout_data: Optional[Dict]):
+    """Applies the shape moves of a relayout event to a list of shape dictionaries."""
+
+    for key, value in (relayout_data or {}).items():
+        match = SHAPE_RELAYOUT_KEY.match(key)
+        if match is None:
+            continue
+        shape = shapes[int(match.group(1))]
+        if match.group(2) is None:
+            shape.update(value)
+        else:
+            shape[match.group(2)] = value
+
+
+def moved_points(figure: FigureModel, relayout_data: Optional[Dict]) -> List[str]:
+    """Returns the names of the points moved by a relayout event."""
+
+    indices = set()
+    for key in relayout_data or {}:
+        match = SHAPE_RELAYOUT_KEY.match(key)
+        if match is not None:
+            indices.add(int(match.group(1)))
+    return [figure.point_names[i] for i in sorted(indices)]
+
+
+def shape_dct(shape: CircleShape) -> Dict:
+    """Returns the dictionary of a shape, as expected by plotly."""
+    return shape.dict(exclude={"no_x", "no_y"})
+
+
 def update_figure_dct_layout(figure_dct: Dict, figure: FigureModel):
     layout_dct = figure.layout.dict()
-    for shape in layout_dct["shapes"]:
-        del shape["no_x"]
-        del shape["no_y"]
+    layout_dct["shapes"] = [shape_dct(shape) for shape in figure.layout.shapes]
     figure_dct["layout"].update(layout_dct)
 
 
-def update_figure_dct_data(figure_dct: Dict, figure: FigureModel):
+def update_figure_dct_data(figure_dct: Dict, figure: FigureModel, compact: bool):
     figure_dct["data"] = [data.dict() for data in figure.data]
+    if compact:
+        figure_dct["data"] = [trace_payload(trace) for trace in figure_dct["data"]]
+
+
+def trace_payload(trace: Dict) -> Dict:
+    """Returns a trace dictionary, or the samples of a trace, to be sent to the browser,
+    their samples being typed arrays if TYPED_ARRAYS."""
+
+    return compact_samples(trace) if TYPED_ARRAYS else trace
+
+
+def patch_shapes(patch: Patch, figure: FigureModel, displayed_shapes: List[Dict]):
+    """Adds to a partial update of a figure the shapes that differ from the displayed
+    ones. Returns whether any did."""
+
+    changed = False
+    for i, shape in enumerate(figure.layout.shapes):
+        if shape.dict() != displayed_shapes[i]:
+            patch["layout"]["shapes"][i] = shape_dct(shape)
+            changed = True
+    return changed
+
+
+def patch_samples(patch: Patch, traces: List[Dict]):
+    """Adds to a partial update of a figure the samples of the traces drawing them,
+    as returned by `FigureModel.sample_traces`."""
+
+    for i, samples in enumerate(traces):
+        for name, values in trace_payload(samples).items():
+            patch["data"][i][name] = values
+
+
+def patch_lines(patch: Patch, figure: FigureModel, stages):
+    """Adds to a partial update of a figure the lines connecting its points."""
+
+    # The connecting lines follow the traces drawing the samples.
+    lines_offset = figure.n_sample_traces(stages)
+    for i, data in enumerate(figure.data):
+        patch["data"][lines_offset + i]["x"] = data.x
+        patch["data"][lines_offset + i]["y"] = data.y
+
+
+def classify_figure(
+    url: Url,
+    downsampler: Optional[Downsampler],
+    store: RedisStore,
+    figure: FigureModel,
+    figure_dct: Union[Dict, Patch],
+) -> str:
+    """Classifies the samples of a figure by the envelope drawn with its points, and
+    returns the number of samples removed from every asset/stage trace, as text. If
+    asked by the url, the removed samples are also greyed out in the figure, or in the
+    partial update of the figure, which is only possible when the traces hold all the
+    samples of their series."""
+
+    classifications = figure.classify(
+        store, url.uuid, url.plot, url.stages, url.envelope, CLASSIFICATION_CACHE
+    )
+
+    if url.show_removed and downsampler is None and not figure.density:
+        # The removed samples are drawn as plotly selected points.
+        removed_points = figure.trace_indices(
+            [removed for removed, _ in classifications],
+            [n for _, n in classifications],
+        )
+        for i, removed in enumerate(removed_points):
+            figure_dct["data"][i]["selectedpoints"] = removed
+            figure_dct["data"][i]["selected"] = {"marker": {"color": REMOVED_COLOR}}
+            figure_dct["data"][i]["unselected"] = {"marker": {"opacity": 1}}
+
+    lines = []
+    traces = ((stage, asset) for stage in url.stages for asset in figure.assets)
+    for (stage, asset), (removed, n) in zip(traces, classifications):
+        share = 100 * len(removed) / n if n else 0
+        lines.append(
+            f"{asset}:{stage}  kept {n - len(removed)}  removed {len(removed)} "
+            f"({share:.1f}%)"
+        )
+    return "\n".join(lines)
+
+
+def select_samples(
+    url: Url, layout_dct: Optional[Dict], selected_data: Optional[Dict], persist: bool
+) -> str:
+    """Selects the samples inside the box or the lasso drawn in a figure built by
+    `load_figure`, and returns the number of samples selected from every asset/stage
+    trace, as text. If asked to persist them, the selected samples are also excluded
+    from the cleaning."""
+
+    if not selected_data or layout_dct is None:
+        return ""
+
+    store = RedisStore(redis_cl, SERIES_CACHE)
+    figure = FigureModel(
+        assets=url.assets,
+        x_name=url.x_name,
+        y_name=url.y_name,
+        point_names=url.point_names,
+        point_groups=url.point_groups,
+        layout=layout_dct,
+    )
+    selections = figure.select(
+        store, url.uuid, url.plot, url.stages, selected_data, INDEX_CACHE
+    )
+
+    traces = [(stage, asset) for stage in url.stages for asset in url.assets]
+    lines = [
+        f"{asset}:{stage}  selected {len(selected)}"
+        for (stage, asset), selected in zip(traces, selections)
+    ]
+    if persist:
+        excluded = exclude(
+            redis_cl,
+            {
+                exclusions_key(url.uuid, url.plot, asset, stage): selected
+                for (stage, asset), selected in zip(traces, selections)
+            },
+        )
+        lines.append(f"{excluded} samples newly excluded from the cleaning.")
+    return "\n".join(lines)
+
+
+def load_figure(
+    url: Url,
+    downsampler: Optional[Downsampler],
+    store: RedisStore,
+    empty_figure: Optional[PlotlyFigure] = None,
+    session: Optional[str] = None,
+) -> Tuple[Dict, FigureModel]:
+    """Builds the full figure of a url, reading its series and points from redis, from
+    an empty figure, that of `create_empty_plotly_figure` by default. The figure is
+    displayed by the given session, or by a new one."""
+
+    with phase("model"):
+        if empty_figure is None:
+            empty_figure = create_empty_plotly_figure()
+        figure_dct = empty_figure.to_plotly_json()
+
+        # Create our own figure model based on the figure dictionary.
+        figure = FigureModel(
+            assets=url.assets,
+            x_name=url.x_name,
+            y_name=url.y_name,
+            point_names=url.point_names,
+            point_groups=url.point_groups,
+            layout=figure_dct["layout"],
+        )
+
+        figure.set_titles(url.x_name, url.y_name)
+
+    # Fetch everything this callback needs from redis in a single round trip.
+    series_keys = figure.series_keys(url.uuid, url.plot, url.stages)
+    point_keys = figure.point_keys(url.uuid)
+
+    # When downsampling series that have a pyramid, only the pyramid level needed to
+    # draw the figure is read, instead of the full series.
+    pyramids = False
+    if downsampler is not None:
+        store.prefetch_pyramids(series_keys, point_keys)
+        pyramids = all(store.pyramid(key) is not None for key in series_keys)
+    if not pyramids:
+        store.prefetch(series_keys=series_keys, point_keys=point_keys)
+
+    with phase("figure_data"):
+        if use_density(
+            url.render,
+            (store.length(key) for key in series_keys),
+            url.density_threshold,
+            downsampler is not None,
+        ):
+            store.prefetch(series_keys=series_keys)
+            figure.layout.meta = {"render": DENSITY}
+            extent = figure.reset_ranges(
+                store, url.uuid, url.plot, url.stages, url.robust
+            )
+            figure.data = figure.density_figure_data(
+                store, url.uuid, url.plot, url.stages
+            )
+        else:
+            levels = None
+            if pyramids:
+                figure.reset_ranges(store, url.uuid, url.plot, url.stages, url.robust)
+                levels = figure.pyramid_levels(
+                    store, url.uuid, url.plot, url.stages, downsampler.n_out
+                )
+                store.prefetch_levels(levels)
+
+            if merge_assets(
+                url.traces, len(url.assets), len(url.stages), url.max_traces
+            ):
+                figure.layout.meta["traces"] = PER_STAGE
+
+            # Fetch the axis data from redis.
+            extent = figure.populate_figure_data(
+                store,
+                url.uuid,
+                url.plot,
+                url.stages,
+                downsampler,
+                levels,
+                url.robust,
+                url.webgl_threshold,
+            )
+
+            if extent[0] is not None:
+                figure.set_ranges(*extent)
+
+        # The samples appended to the series later on are then read on their own,
+        # including those of series read from pyramids, whose length is that of their
+        # pyramid. Appending samples to a series drops its pyramid, the traces are then
+        # resampled from the series itself.
+        figure.follow_tail(store, url.uuid, url.plot, url.stages, extent)
+
+    # Fetch the points from the redis server.
+    with phase("points_lines"):
+        figure.populate_points(store, url.uuid)
+        figure.populate_lines()
+        figure.set_line_traces(url.stages)
+
+        figure.update_points(store, url.uuid)
+        figure.update_lines()
+
+    # The points were just read, there's nothing to save.
+    figure.set_points_version(int(store.point(version_key(url.uuid)) or 0))
+    figure.layout.meta["session"] = session or uuid4().hex
+
+    # Update the figure dictionary based on the changes made to our figure model. The
+    # samples of traces that the samples appended to their series are appended to
+    # (see `tail_figure`) are sent as lists, typed arrays can't be extended.
+    extended = (
+        REFRESH_INTERVAL > 0
+        and figure.lengths is not None
+        and downsampler is None
+        and not figure.density
+        and not figure.merged
+    )
+    with phase("serialization"):
+        update_figure_dct_layout(figure_dct, figure)
+        update_figure_dct_data(figure_dct, figure, compact=not extended)
+
+    return figure_dct, figure
+
+
+def patch_figure(
+    url: Url,
+    downsampler: Optional[Downsampler],
+    store: RedisStore,
+    layout_dct: Dict,
+    relayout_data: Optional[Dict],
+) -> Tuple[Optional[Patch], FigureModel]:
+    """Applies a relayout event to the layout of a figure built by `load_figure`, and
+    returns a partial update of the figure holding only the shapes that changed and the
+    lines connecting them, or None if nothing changed. The sample traces are only part
+    of the update if they have to be resampled or rebinned for a new viewport."""
+
+    with phase("model"):
+        # Shapes as currently displayed by the browser.
+        apply_shapes_relayout(layout_dct["shapes"], relayout_data)
+        displayed_shapes = copy.deepcopy(layout_dct["shapes"])
+
+        figure = FigureModel(
+            assets=url.assets,
+            x_name=url.x_name,
+            y_name=url.y_name,
+            point_names=url.point_names,
+            point_groups=url.point_groups,
+            layout=layout_dct,
+        )
+        viewport_changed, autorange = figure.apply_relayout(relayout_data)
+    rebin = figure.density and viewport_changed
+    resample = downsampler is not None and viewport_changed and not figure.density
+
+    # Fetch everything this callback needs from redis in a single round trip. The
+    # series are only needed to resample, rebin or autorange, and are usually cached.
+    # When resampling series that have a pyramid, their pyramid headers are enough to
+    # autorange, and only the pyramid levels needed for the new viewport are read.
+    series_keys = figure.series_keys(url.uuid, url.plot, url.stages)
+    point_keys = figure.point_keys(url.uuid)
+    pyramids = False
+    if resample:
+        store.prefetch_pyramids(series_keys, point_keys)
+        pyramids = all(store.pyramid(key) is not None for key in series_keys)
+    store.prefetch(
+        series_keys=(
+            series_keys if rebin or ((resample or autorange) and not pyramids) else []
+        ),
+        point_keys=point_keys,
+    )
+
+    patch = Patch()
+
+    with phase("figure_data"):
+        if autorange:
+            figure.reset_ranges(store, url.uuid, url.plot, url.stages, url.robust)
+            patch["layout"]["xaxis"]["range"] = list(figure.layout.xaxis.range)
+            patch["layout"]["yaxis"]["range"] = list(figure.layout.yaxis.range)
+
+        if resample:
+            levels = None
+            if pyramids:
+                levels = figure.pyramid_levels(
+                    store, url.uuid, url.plot, url.stages, downsampler.n_out
+                )
+                store.prefetch_levels(levels)
+            series = figure.resample_figure_data(
+                store, url.uuid, url.plot, url.stages, downsampler, levels
+            )
+            patch_samples(patch, figure.sample_traces(series))
+
+        if rebin:
+            traces = figure.density_figure_data(store, url.uuid, url.plot, url.stages)
+            for i, trace in enumerate(traces):
+                patch["data"][i] = trace_payload(trace.dict())
+
+    with phase("points_lines"):
+        figure.update_points(store, url.uuid)
+
+    # Save the points that moved on the redis server.
+    with phase("save"):
+        figure.save_points(
+            store, url.uuid, POINT_WRITER, moved_points(figure, relayout_data)
+        )
+
+    with phase("points_lines"):
+        figure.populate_lines()
+
+    with phase("serialization"):
+        shapes_changed = patch_shapes(patch, figure, displayed_shapes)
+        if not shapes_changed and not viewport_changed:
+            return None, figure
+        patch_lines(patch, figure, url.stages)
+
+    return patch, figure
+
+
+def sync_figure(
+    url: Url, store: RedisStore, layout_dct: Dict
+) -> Tuple[Optional[Patch], FigureModel]:
+    """Moves the points of a figure built by `load_figure` to the positions last
+    published by other sessions, and returns a partial update of the figure holding only
+    the points that moved and the lines connecting them, or None if none moved. Redis is
+    only read when the version of the points changed, for the points of the session
+    that weren't saved, which counts as a round trip of the store."""
+
+    with phase("model"):
+        displayed_shapes = copy.deepcopy(layout_dct["shapes"])
+        figure = FigureModel(
+            assets=url.assets,
+            x_name=url.x_name,
+            y_name=url.y_name,
+            point_names=url.point_names,
+            point_groups=url.point_groups,
+            layout=layout_dct,
+        )
+
+    with phase("points_lines"):
+        points = POINT_BOARD.points(url.uuid)
+        figure.sync_points(url.uuid, points)
+        figure.populate_lines()
+        version = points.get(version_key(url.uuid))
+        if version is not None and int(version) != figure.points_version:
+            figure.set_points_version(int(version))
+            figure.reject_points(
+                url.uuid, POINT_WRITER.rejected(url.uuid, figure.session, store)
+            )
+
+    with phase("serialization"):
+        patch = Patch()
+        if not patch_shapes(patch, figure, displayed_shapes):
+            return None, figure
+        patch_lines(patch, figure, url.stages)
+
+    return patch, figure
+
+
+def tail_figure(
+    url: Url,
+    downsampler: Optional[Downsampler],
+    store: RedisStore,
+    layout_dct: Dict,
+) -> Tuple[Optional[Patch], FigureModel]:
+    """Adds to a figure built by `load_figure` the samples appended to its series since
+    they were last read, reading only those, and returns a partial update of the figure,
+    or None if no sample was appended. Unless the viewport was zoomed or panned, its
+    ranges grow to fit the new samples, and its points and lines are redrawn for the
+    new ranges."""
+
+    with phase("model"):
+        displayed_shapes = copy.deepcopy(layout_dct["shapes"])
+        figure = FigureModel(
+            assets=url.assets,
+            x_name=url.x_name,
+            y_name=url.y_name,
+            point_names=url.point_names,
+            point_groups=url.point_groups,
+            layout=layout_dct,
+        )
+    if figure.lengths is None:
+        return None, figure
+
+    with phase("figure_data"):
+        fits_extent = figure.fits_extent()
+        extent = figure.extent
+        tails = figure.tail_figure_data(
+            store, url.uuid, url.plot, url.stages, url.robust
+        )
+        if all(len(x) == 0 for x, _ in tails):
+            return None, figure
+
+        patch = Patch()
+        patch["layout"]["meta"] = figure.layout.meta
+
+        viewport_changed = fits_extent and figure.extent != extent
+        if viewport_changed:
+            figure.set_ranges(*figure.extent)
+            patch["layout"]["xaxis"]["range"] = list(figure.layout.xaxis.range)
+            patch["layout"]["yaxis"]["range"] = list(figure.layout.yaxis.range)
+
+        if figure.density:
+            traces = figure.density_figure_data(store, url.uuid, url.plot, url.stages)
+            for i, trace in enumerate(traces):
+                patch["data"][i] = trace_payload(trace.dict())
+        elif downsampler is not None:
+            # Series read from their pyramid when loaded aren't cached, and are read
+            # in full, at once.
+            store.prefetch(
+                series_keys=figure.series_keys(url.uuid, url.plot, url.stages)
+            )
+            series = figure.resample_figure_data(
+                store, url.uuid, url.plot, url.stages, downsampler
+            )
+            patch_samples(patch, figure.sample_traces(series))
+        elif figure.merged:
+            # The samples of a merged trace are ordered by asset, the new samples of an
+            # asset can't be appended to it, the traces are sent again.
+            series = figure.read_figure_data(store, url.uuid, url.plot, url.stages)
+            patch_samples(patch, figure.sample_traces(series))
+        else:
+            for i, (x, y) in enumerate(tails):
+                if len(x) > 0:
+                    patch["data"][i]["x"].extend(x.tolist())
+                    patch["data"][i]["y"].extend(y.tolist())
+
+    with phase("points_lines"):
+        # The model gives the circles a size of its own, they're sized again, and moved
+        # along with their lines if the ranges changed.
+        figure.rescale_points()
+        if patch_shapes(patch, figure, displayed_shapes):
+            figure.populate_lines()
+            patch_lines(patch, figure, url.stages)
+
+    return patch, figure
 
 
 def create_dash_app(requests_pathname_prefix: str = None) -> Dash:
@@ -463,6 +1782,20 @@ def create_dash_app(requests_pathname_prefix: str = None) -> Dash:
     app.scripts.config.serve_locally = False
 
     empty_figure = create_empty_plotly_figure()
+    # Triggers the reading of the samples appended to the series, see `tail_figure`.
+    refresh = dcc.Interval(
+        id="refresh",
+        interval=max(REFRESH_INTERVAL, 0.1) * 1000,
+        disabled=REFRESH_INTERVAL <= 0,
+    )
+    # Triggers the moves of the points moved by other sessions, see `sync_figure`.
+    sync = dcc.Interval(
+        id="sync",
+        interval=max(SYNC_INTERVAL, 0.1) * 1000,
+        disabled=SYNC_INTERVAL <= 0,
+    )
+    if SYNC_INTERVAL > 0:
+        POINT_BOARD.listen(pubsub_client())
 
     # Depending on if DEBUG is active or not, create an app with a different layout.
     if DEBUG:
@@ -470,11 +1803,27 @@ def create_dash_app(requests_pathname_prefix: str = None) -> Dash:
         app.layout = html.Div(
             [
                 dcc.Location(id="url", refresh=False),
-                dcc.Graph(
-                    id="figure",
-                    figure=empty_figure,
-                    config=dict(editable=True),
+                dcc.Store(id="figure-layout"),
+                dcc.Store(id="relayout"),
+                dcc.Store(id="point-send-delay", data=POINT_SEND_DELAY * 1000),
+                dcc.Store(id="grid-session"),
+                refresh,
+                sync,
+                html.Div(
+                    [
+                        dcc.Graph(
+                            id="figure",
+                            figure=empty_figure,
+                            config=dict(editable=True),
+                        ),
+                        html.Pre(id="notice"),
+                        html.Pre(id="envelope"),
+                        html.Button("Exclude selected samples", id="exclude"),
+                        html.Pre(id="selection"),
+                    ],
+                    id="single",
                 ),
+                html.Div(id="grid"),
                 html.Div(
                     [
                         html.Pre(id="relayout-data", style=styles["pre"]),
@@ -482,7 +1831,7 @@ def create_dash_app(requests_pathname_prefix: str = None) -> Dash:
                 ),
                 html.Div(
                     [
-                        html.Pre(id="figure_dict", style=styles["pre"]),
+                        html.Pre(id="timings", style=styles["pre"]),
                     ]
                 ),
             ]
@@ -490,82 +1839,367 @@ def create_dash_app(requests_pathname_prefix: str = None) -> Dash:
 
         callback = app.callback(
             Output("relayout-data", "children"),
-            Output("figure_dict", "children"),
+            Output("timings", "children"),
+            Output("notice", "children"),
+            Output("envelope", "children"),
             Output("figure", "figure"),
+            Output("figure-layout", "data"),
             Input("url", "href"),
-            Input("figure", "figure"),
-            Input("figure", "relayoutData"),
+            Input("relayout", "data"),
+            Input("refresh", "n_intervals"),
+            Input("sync", "n_intervals"),
+            State("figure-layout", "data"),
         )
     else:
         app.layout = html.Div(
             [
                 dcc.Location(id="url", refresh=False),
-                dcc.Graph(
-                    id="figure",
-                    figure=empty_figure,
-                    config=dict(editable=True),
+                dcc.Store(id="figure-layout"),
+                dcc.Store(id="relayout"),
+                dcc.Store(id="point-send-delay", data=POINT_SEND_DELAY * 1000),
+                dcc.Store(id="grid-session"),
+                refresh,
+                sync,
+                html.Div(
+                    [
+                        dcc.Graph(
+                            id="figure",
+                            figure=empty_figure,
+                            config=dict(editable=True),
+                        ),
+                        html.Pre(id="notice"),
+                        html.Pre(id="envelope"),
+                        html.Button("Exclude selected samples", id="exclude"),
+                        html.Pre(id="selection"),
+                    ],
+                    id="single",
                 ),
+                html.Div(id="grid"),
             ]
         )
 
         callback = app.callback(
+            Output("notice", "children"),
+            Output("envelope", "children"),
             Output("figure", "figure"),
+            Output("figure-layout", "data"),
             Input("url", "href"),
-            Input("figure", "figure"),
-            Input("figure", "relayoutData"),
+            Input("relayout", "data"),
+            Input("refresh", "n_intervals"),
+            Input("sync", "n_intervals"),
+            State("figure-layout", "data"),
         )
 
     @callback
-    def update_image(href: str, figure_dct: Dict, relayout_data: Dict):
+    def update_image(
+        href: str,
+        relayout_data: Dict,
+        n_refresh: Optional[int],
+        n_sync: Optional[int],
+        layout_dct: Optional[Dict],
+    ):
         """Callback used to update the image. We define our own model of the figure,
         which we use to make some necessary operations, then we use this model to
-        update the dictionary corresponding to the true figure that is being displayed.."""
-
-        url = Url(href)
-
-        # Create our own figure model based on the figure dictionary available
-        # inside this callback.
-        figure = FigureModel(
-            assets=url.assets,
-            x_name=url.x_name,
-            y_name=url.y_name,
-            point_names=url.point_names,
-            point_groups=url.point_groups,
-            **figure_dct,
-        )
-
-        figure.set_titles(url.x_name, url.y_name)
-
-        # Fetch the axis data from redis.
-        min_x, max_x, min_y, max_y = figure.populate_figure_data(
-            url.uuid, url.plot, url.stages
-        )
-
-        if min_x is not None:
-            figure.set_ranges(min_x, max_x, min_y, max_y)
-
-        # If the figure doesn't yet have any points, fetch them from the redis server.
-        if len(figure.layout.shapes) == 0:
-            figure.populate_points(url.uuid)
-            figure.populate_lines()
-
-        figure.update_points(url.uuid)
-        figure.update_lines()
-
-        # Save the points on the redis server.
-        figure.save_points(url.uuid)
+        update the true figure that is being displayed.
+
+        The whole figure is only sent when the url is loaded. Its scatter data then
+        stays on the server, and only its (small) layout is kept by the browser, in the
+        "figure-layout" store, so that later calls, such as point drags, only send back
+        a partial update of the figure. The same goes for the samples appended to
+        the series, read every REFRESH_INTERVAL seconds, and for the points moved by
+        other sessions, applied every SYNC_INTERVAL seconds.
+
+        Relayout events of the figure reach this callback through the "relayout"
+        store, see assets/points.js: points dragged in the browser are only sent once
+        no point was dragged for POINT_SEND_DELAY seconds, their lines being redrawn by
+        the browser in the meantime.
+
+        Points dragged by the user but not saved, because another session saved its
+        points in the meantime, are named below the figure, see
+        `FigureModel.save_points`.
+
+        If the url has an envelope, the samples it removes are counted again whenever
+        the figure changes. Samples selected in the figure are handled by
+        `update_selection`. In the grid view, the figures of the assets are handled by
+        `update_panel` instead."""
+
+        with collect("update_image") as phases:
+            with phase("url"):
+                url = Url(href)
+                if url.grid:
+                    raise PreventUpdate
+
+                # When downsampling, the figure only holds the samples of the current
+                # viewport, so every zoom or pan has to resample the series kept on
+                # the server.
+                downsampler = None
+                if url.downsample:
+                    downsampler = Downsampler(url.downsample, url.max_points)
+
+            if layout_dct is None or ctx.triggered_id == "url":
+                # The url was (re)loaded, so only the cached series that didn't change
+                # since are used, and its points are read again, once those held by
+                # the writer are written.
+                CLASSIFICATION_CACHE.drop(url.uuid)
+                INDEX_CACHE.drop(url.uuid)
+                POINT_WRITER.flush(url.uuid)
+                store = RedisStore(redis_cl, SERIES_CACHE, validate=True)
+                figure_dct, figure = load_figure(url, downsampler, store)
+            elif ctx.triggered_id == "refresh":
+                store = RedisStore(redis_cl, SERIES_CACHE)
+                figure_dct, figure = tail_figure(url, downsampler, store, layout_dct)
+                if figure_dct is None:
+                    # No sample was appended, the figure and its layout stay as is.
+                    raise PreventUpdate
+            elif ctx.triggered_id == "sync":
+                store = RedisStore(redis_cl, SERIES_CACHE)
+                figure_dct, figure = sync_figure(url, store, layout_dct)
+                if figure_dct is None:
+                    figure_dct = no_update
+            else:
+                store = RedisStore(redis_cl, SERIES_CACHE)
+                figure_dct, figure = patch_figure(
+                    url, downsampler, store, layout_dct, relayout_data
+                )
+                if figure_dct is None:
+                    figure_dct = no_update
+
+            # The notice of a figure loaded again is cleared.
+            notice = figure.notice or no_update
+            if layout_dct is None or ctx.triggered_id == "url":
+                notice = ""
+
+            counts = no_update
+            if url.envelope is not None and figure_dct is not no_update:
+                with phase("envelope"):
+                    counts = classify_figure(
+                        url, downsampler, store, figure, figure_dct
+                    )
 
-        # Update the figure dictionary based on the changes made to our figure model.
-        update_figure_dct_layout(figure_dct, figure)
-        update_figure_dct_data(figure_dct, figure)
+        round_trips = store.round_trips
+        observe("update_image.redis_round_trips", round_trips, COUNT)
+        # Dash encodes the returned figure after the callback, that time is measured
+        # once the response is ready, see `record_response`.
+        if flask.has_request_context():
+            flask.g.update_image_end = time.perf_counter()
 
         if DEBUG:
+            timings = {name: round(1000 * t, 3) for name, t in phases.items()}
+            timings["redis_round_trips"] = round_trips
             return (
                 json.dumps(relayout_data, indent=2),
-                json.dumps(figure_dct, indent=2),
+                json.dumps(timings, indent=2),
+                notice,
+                counts,
                 figure_dct,
+                figure.layout.dict(),
             )
         else:
-            return figure_dct
+            return notice, counts, figure_dct, figure.layout.dict()
+
+    @app.callback(
+        Output("grid", "children"),
+        Output("single", "style"),
+        Output("refresh", "disabled"),
+        Output("sync", "disabled"),
+        Output("grid-session", "data"),
+        Input("url", "href"),
+    )
+    def update_grid(href: str):
+        """Callback laying out the grid view, a panel per asset, when the url asks for
+        it, instead of the figure of all the assets. The panels are empty until they
+        become visible, see `update_panel`. They're all figures of the same session,
+        so that the points saved from a panel are the version the others move them
+        from."""
+
+        url = Url(href)
+        if not url.grid:
+            return [], {}, REFRESH_INTERVAL <= 0, SYNC_INTERVAL <= 0, None
+
+        # Like in `update_image`, the url was (re)loaded.
+        CLASSIFICATION_CACHE.drop(url.uuid)
+        INDEX_CACHE.drop(url.uuid)
+        panels = [create_panel(index, asset) for index, asset in enumerate(url.assets)]
+        return panels, {"display": "none"}, True, True, uuid4().hex
+
+    @app.callback(
+        Output({"type": "panel-figure", "index": MATCH}, "figure"),
+        Output({"type": "panel-layout", "index": MATCH}, "data"),
+        Output({"type": "panel-notice", "index": MATCH}, "children"),
+        Output({"type": "panel-envelope", "index": MATCH}, "children"),
+        Output({"type": "panel-refresh", "index": MATCH}, "disabled"),
+        Output({"type": "panel-sync", "index": MATCH}, "disabled"),
+        Input({"type": "panel-visible", "index": MATCH}, "data"),
+        Input({"type": "panel-relayout", "index": MATCH}, "data"),
+        Input({"type": "panel-refresh", "index": MATCH}, "n_intervals"),
+        Input({"type": "panel-sync", "index": MATCH}, "n_intervals"),
+        State("url", "href"),
+        State("grid-session", "data"),
+        State({"type": "panel-layout", "index": MATCH}, "data"),
+        prevent_initial_call=True,
+    )
+    def update_panel(
+        visible: bool,
+        relayout_data: Optional[Dict],
+        n_refresh: Optional[int],
+        n_sync: Optional[int],
+        href: str,
+        session: Optional[str],
+        layout_dct: Optional[Dict],
+    ):
+        """Callback updating the figure of a panel of the grid view, like
+        `update_image` does for the figure of all the assets.
+
+        The figure is only loaded once the panel becomes visible, as reported by
+        assets/panels.js, and released once it isn't anymore, so that a farm of many
+        assets only reads and draws the series of the panels being looked at. The
+        intervals reading the appended samples and the moved points of a panel only run
+        while it's loaded.
+
+        Panels share the session of the grid, and the points dragged in a panel are
+        moved in the other loaded panels by the browser, see assets/points.js."""
+
+        with collect("update_panel"):
+            url = Url(href)
+            index = ctx.outputs_list[0]["id"]["index"]
+            if index >= len(url.assets):
+                raise PreventUpdate
+            asset = url.assets[index]
+            url = url.panel(asset)
+            downsampler = None
+            if url.downsample:
+                downsampler = Downsampler(url.downsample, url.max_points)
+
+            if not visible:
+                if layout_dct is None:
+                    raise PreventUpdate
+                return empty_panel_figure(asset), None, "", "", True, True
+
+            disabled = no_update
+            if layout_dct is None:
+                POINT_WRITER.flush(url.uuid)
+                store = RedisStore(redis_cl, SERIES_CACHE, validate=True)
+                empty_figure = create_empty_plotly_figure(
+                    PANEL_WIDTH, PANEL_HEIGHT, asset
+                )
+                figure_dct, figure = load_figure(
+                    url, downsampler, store, empty_figure, session
+                )
+                disabled = (REFRESH_INTERVAL <= 0, SYNC_INTERVAL <= 0)
+            elif ctx.triggered_id["type"] == "panel-refresh":
+                store = RedisStore(redis_cl, SERIES_CACHE)
+                figure_dct, figure = tail_figure(url, downsampler, store, layout_dct)
+                if figure_dct is None:
+                    raise PreventUpdate
+            elif ctx.triggered_id["type"] == "panel-sync":
+                store = RedisStore(redis_cl, SERIES_CACHE)
+                figure_dct, figure = sync_figure(url, store, layout_dct)
+            elif ctx.triggered_id["type"] == "panel-relayout":
+                store = RedisStore(redis_cl, SERIES_CACHE)
+                figure_dct, figure = patch_figure(
+                    url, downsampler, store, layout_dct, relayout_data
+                )
+            else:
+                # Still visible, already loaded.
+                raise PreventUpdate
+            if figure_dct is None:
+                figure_dct = no_update
+            notice = figure.notice or no_update
+            if disabled is not no_update:
+                # Loaded.
+                notice = ""
+
+            counts = no_update
+            if url.envelope is not None and figure_dct is not no_update:
+                with phase("envelope"):
+                    counts = classify_figure(
+                        url, downsampler, store, figure, figure_dct
+                    )
+
+        observe("update_panel.redis_round_trips", store.round_trips, COUNT)
+        if disabled is no_update:
+            return (
+                figure_dct,
+                figure.layout.dict(),
+                notice,
+                counts,
+                no_update,
+                no_update,
+            )
+        return (figure_dct, figure.layout.dict(), notice, counts) + disabled
+
+    @app.callback(
+        Output("selection", "children"),
+        Input("figure", "selectedData"),
+        Input("exclude", "n_clicks"),
+        State("url", "href"),
+        State("figure-layout", "data"),
+        prevent_initial_call=True,
+    )
+    def update_selection(
+        selected_data: Optional[Dict],
+        n_clicks: Optional[int],
+        href: str,
+        layout_dct: Optional[Dict],
+    ):
+        """Callback counting the samples selected with the box or the lasso of the
+        figure, and excluding them from the cleaning when asked to. The samples are
+        selected on the server, from the full series, rather than by the browser."""
+
+        with collect("update_selection"):
+            return select_samples(
+                Url(href),
+                layout_dct,
+                selected_data,
+                persist=ctx.triggered_id == "exclude",
+            )
+
+    # Redraws the lines of the dragged points in the browser, and sends the relayout
+    # events to `update_image`.
+    app.clientside_callback(
+        ClientsideFunction(namespace="points", function_name="drag"),
+        Output("figure", "figure", allow_duplicate=True),
+        Output("figure-layout", "data", allow_duplicate=True),
+        Output("relayout", "data"),
+        Input("figure", "relayoutData"),
+        State("figure", "figure"),
+        State("figure-layout", "data"),
+        State("point-send-delay", "data"),
+        prevent_initial_call=True,
+    )
+    # The same goes for the panels of the grid view, sending their events to
+    # `update_panel`.
+    app.clientside_callback(
+        ClientsideFunction(namespace="points", function_name="drag"),
+        Output(
+            {"type": "panel-figure", "index": MATCH}, "figure", allow_duplicate=True
+        ),
+        Output({"type": "panel-layout", "index": MATCH}, "data", allow_duplicate=True),
+        Output({"type": "panel-relayout", "index": MATCH}, "data"),
+        Input({"type": "panel-figure", "index": MATCH}, "relayoutData"),
+        State({"type": "panel-figure", "index": MATCH}, "figure"),
+        State({"type": "panel-layout", "index": MATCH}, "data"),
+        State("point-send-delay", "data"),
+        prevent_initial_call=True,
+    )
+
+    @app.server.after_request
+    def record_response(response):
+        """Records the size of the payloads and the encoding time of the callback."""
+
+        end = flask.g.pop("update_image_end", None)
+        if end is not None:
+            observe("update_image.encoding", time.perf_counter() - end)
+            observe(
+                "update_image.payload_in_bytes",
+                flask.request.content_length or 0,
+                BYTES,
+            )
+            observe(
+                "update_image.payload_out_bytes",
+                response.calculate_content_length() or 0,
+                BYTES,
+            )
+        return response
 
     return app
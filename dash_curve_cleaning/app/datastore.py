@@ -0,0 +1,397 @@
+"""Data access layer between the dash callbacks and the redis server."""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import woodpecker as wp
+
+from cache import SeriesCache
+from metrics import phase
+from series import (
+    DEFAULT_DTYPE,
+    PYRAMID_READ_COMMANDS,
+    READ_COMMANDS,
+    Pyramid,
+    parse_read,
+    parse_read_level,
+    parse_read_pyramid,
+    parse_read_signature,
+    parse_read_stats,
+    parse_read_tail,
+    pyramid_key,
+    queue_read,
+    queue_read_level,
+    queue_read_pyramid,
+    queue_read_signature,
+    queue_read_stats,
+    queue_read_tail,
+    signature,
+)
+from stats import ROBUST_QUANTILES, SeriesStats, stats_key
+
+
+class RedisStore:
+    """Gathers every key a callback needs and fetches them from redis in a single
+    pipelined round trip. Values not prefetched are still served, at the cost of an
+    extra round trip each, which shows up in `round_trips`.
+
+    A store is meant to live for a single callback call. Series can be shared between
+    stores through a `cache.SeriesCache`, in which case cached series still matching
+    the one stored in redis aren't read again: their signatures are read instead, along
+    with the points, and only the series that changed are read, in a second round trip.
+    Unless told to `validate` them, the series cached in memory are assumed to be up to
+    date, without reading their signature, as done by the callbacks following the load
+    of a url, which add the samples appended to the series themselves.
+
+    The statistics of the series (see `stats`) are read along with the series or their
+    pyramids, whenever a round trip is made anyway, and serve their extent without
+    scanning them."""
+
+    def __init__(
+        self,
+        redis_cl,
+        cache: Optional[SeriesCache] = None,
+        validate: bool = False,
+    ):
+        self._redis_cl = redis_cl
+        self._cache = cache
+        self._validate = validate
+        self._series: Dict[str, np.ndarray] = {}
+        self._signatures: Dict[str, Optional[Tuple[str, int]]] = {}
+        self._points: Dict[str, Optional[float]] = {}
+        self._pyramids: Dict[str, Optional[Pyramid]] = {}
+        self._stats: Dict[str, Optional[SeriesStats]] = {}
+        self.round_trips = 0
+
+    @staticmethod
+    def _level_key(key: str, level: int) -> str:
+        return f"{pyramid_key(key)}:{level}"
+
+    def prefetch(self, series_keys: Iterable[str] = (), point_keys: Iterable[str] = ()):
+        """Fetches the given series, along with their statistics, and points, in a
+        single round trip."""
+
+        series_keys = list(series_keys)
+        stats_keys = [key for key in series_keys if key not in self._stats]
+        series_keys = [key for key in series_keys if key not in self._series]
+        point_keys = [key for key in point_keys if key not in self._points]
+        if self._cache is not None:
+            series_keys = self._prefetch_cached(series_keys, point_keys, stats_keys)
+            stats_keys = [key for key in stats_keys if key not in self._stats]
+            point_keys = [key for key in point_keys if key not in self._points]
+        if not series_keys and not point_keys:
+            return
+
+        pipe = self._redis_cl.pipeline(transaction=False)
+        for key in series_keys:
+            queue_read(pipe, key)
+        for key in stats_keys:
+            queue_read_stats(pipe, key)
+        if point_keys:
+            pipe.mget(point_keys)
+        with phase("redis_fetch"):
+            replies = pipe.execute(raise_on_error=False)
+        self.round_trips += 1
+
+        self._parse_stats(
+            stats_keys, replies[len(series_keys) * READ_COMMANDS :][: len(stats_keys)]
+        )
+        for i, key in enumerate(series_keys):
+            meta, *_ = commands = replies[i * READ_COMMANDS : (i + 1) * READ_COMMANDS]
+            self._series[key] = parse_read(*commands)
+            self._signatures[key] = signature(meta, len(self._series[key]))
+            if self._cache is not None:
+                self._cache.put(key, self._signatures[key], self._series[key])
+        if point_keys:
+            self._parse_points(point_keys, replies[-1])
+
+    def _prefetch_cached(
+        self, series_keys: List[str], point_keys: List[str], stats_keys: List[str]
+    ):
+        """Takes the given series from the cache, reading their signatures along with
+        the given points and statistics, in a single round trip. Returns the series left
+        to read."""
+
+        if not self._validate:
+            for key in series_keys:
+                cached = self._cache.peek(key)
+                if cached is not None:
+                    self._signatures[key], self._series[key] = cached
+            series_keys = [key for key in series_keys if key not in self._series]
+
+        # Series that aren't cached at all are read right away.
+        cached_keys = [key for key in series_keys if key in self._cache]
+        if not cached_keys:
+            return series_keys
+
+        pipe = self._redis_cl.pipeline(transaction=False)
+        for key in cached_keys:
+            queue_read_signature(pipe, key)
+        for key in stats_keys:
+            queue_read_stats(pipe, key)
+        if point_keys:
+            pipe.mget(point_keys)
+        with phase("redis_fetch"):
+            replies = pipe.execute(raise_on_error=False)
+        self.round_trips += 1
+
+        self._parse_stats(stats_keys, replies[len(cached_keys) :][: len(stats_keys)])
+        for key, reply in zip(cached_keys, replies):
+            key_signature = parse_read_signature(reply)
+            values = self._cache.get(key, key_signature)
+            if values is not None:
+                self._series[key] = values
+                self._signatures[key] = key_signature
+        if point_keys:
+            self._parse_points(point_keys, replies[-1])
+
+        return [key for key in series_keys if key not in self._series]
+
+    def _parse_stats(self, stats_keys: List[str], replies: List):
+        for key, reply in zip(stats_keys, replies):
+            self._stats[key] = parse_read_stats(reply)
+
+    def _parse_points(self, point_keys: List[str], values):
+        if isinstance(values, Exception):
+            raise values
+        for key, value in zip(point_keys, values):
+            self._points[key] = None if value is None else float(value)
+
+    def prefetch_pyramids(
+        self, series_keys: Iterable[str], point_keys: Iterable[str] = ()
+    ):
+        """Fetches the headers and the coarsest levels of the pyramids of the given
+        series, along with their statistics and the given points, in a single round
+        trip."""
+
+        series_keys = list(series_keys)
+        stats_keys = [key for key in series_keys if key not in self._stats]
+        series_keys = [key for key in series_keys if key not in self._pyramids]
+        point_keys = [key for key in point_keys if key not in self._points]
+        if not series_keys and not point_keys:
+            return
+
+        pipe = self._redis_cl.pipeline(transaction=False)
+        for key in series_keys:
+            queue_read_pyramid(pipe, key)
+        for key in stats_keys:
+            queue_read_stats(pipe, key)
+        if point_keys:
+            pipe.mget(point_keys)
+        with phase("redis_fetch"):
+            replies = pipe.execute(raise_on_error=False)
+        self.round_trips += 1
+
+        self._parse_stats(
+            stats_keys,
+            replies[len(series_keys) * PYRAMID_READ_COMMANDS :][: len(stats_keys)],
+        )
+
+        for i, key in enumerate(series_keys):
+            pyramid, values = parse_read_pyramid(
+                *replies[i * PYRAMID_READ_COMMANDS : (i + 1) * PYRAMID_READ_COMMANDS]
+            )
+            self._pyramids[key] = pyramid
+            if pyramid is not None:
+                self._series[self._level_key(key, pyramid.levels[0])] = values
+        if point_keys:
+            self._parse_points(point_keys, replies[-1])
+
+    def prefetch_levels(self, levels: Dict[str, int]):
+        """Fetches the given pyramid levels of the given series, in a single round
+        trip. Series without a pyramid are fetched in full. Levels cached for the
+        current pyramid of their series aren't read again."""
+
+        pyramid_keys = [
+            key
+            for key, level in levels.items()
+            if self.pyramid(key) is not None
+            and self._level_key(key, level) not in self._series
+        ]
+        if self._cache is not None:
+            for key in pyramid_keys:
+                values = self._cache.get(
+                    self._level_key(key, levels[key]), self._pyramids[key].signature
+                )
+                if values is not None:
+                    self._series[self._level_key(key, levels[key])] = values
+            pyramid_keys = [
+                key
+                for key in pyramid_keys
+                if self._level_key(key, levels[key]) not in self._series
+            ]
+        series_keys = [
+            key
+            for key in levels
+            if self.pyramid(key) is None
+            and (
+                key not in self._series if self._validate else self._cached(key) is None
+            )
+        ]
+        if not pyramid_keys and not series_keys:
+            return
+
+        pipe = self._redis_cl.pipeline(transaction=False)
+        for key in pyramid_keys:
+            queue_read_level(pipe, key, self._pyramids[key], levels[key])
+        for key in series_keys:
+            queue_read(pipe, key)
+        with phase("redis_fetch"):
+            replies = pipe.execute(raise_on_error=False)
+        self.round_trips += 1
+
+        for key, blob in zip(pyramid_keys, replies):
+            level_key = self._level_key(key, levels[key])
+            self._series[level_key] = parse_read_level(blob, self._pyramids[key])
+            if self._cache is not None:
+                self._cache.put(
+                    level_key, self._pyramids[key].signature, self._series[level_key]
+                )
+        replies = replies[len(pyramid_keys) :]
+        for i, key in enumerate(series_keys):
+            meta, *_ = commands = replies[i * READ_COMMANDS : (i + 1) * READ_COMMANDS]
+            self._series[key] = parse_read(*commands)
+            self._signatures[key] = signature(meta, len(self._series[key]))
+            if self._cache is not None:
+                self._cache.put(key, self._signatures[key], self._series[key])
+
+    def tails(self, offsets: Dict[str, int]) -> Dict[str, np.ndarray]:
+        """Reads the samples appended to the given series after the given offsets, in a
+        single round trip. The samples of binary series are expected to be of the dtype
+        of their cached values, or of the default one, series for which that isn't the
+        case are read again, in a second round trip, as are encoded series, which are
+        read in full."""
+
+        itemsizes = {
+            key: (
+                self._cached(key).dtype.itemsize
+                if self._cached(key) is not None
+                else np.dtype(DEFAULT_DTYPE).itemsize
+            )
+            for key in offsets
+        }
+
+        tails: Dict[str, np.ndarray] = {}
+        keys = list(offsets)
+        while keys:
+            pipe = self._redis_cl.pipeline(transaction=False)
+            for key in keys:
+                queue_read_tail(pipe, key, offsets[key], itemsizes[key])
+            with phase("redis_fetch"):
+                replies = pipe.execute(raise_on_error=False)
+            self.round_trips += 1
+
+            for i, key in enumerate(keys):
+                tail, itemsizes[key] = parse_read_tail(
+                    *replies[i * READ_COMMANDS : (i + 1) * READ_COMMANDS],
+                    offsets[key],
+                    itemsizes[key],
+                )
+                if tail is not None:
+                    tails[key] = tail
+            keys = [key for key in keys if key not in tails]
+
+        return tails
+
+    def _cached(self, key: str) -> Optional[np.ndarray]:
+        """Returns a series already read or cached in memory, without reading it."""
+
+        if key not in self._series and self._cache is not None:
+            cached = self._cache.peek(key)
+            if cached is not None:
+                self._signatures[key], self._series[key] = cached
+        return self._series.get(key)
+
+    def extend(self, key: str, offset: int, values: np.ndarray):
+        """Appends samples read after `offset` to a cached series. If the series isn't
+        cached with exactly `offset` samples, it's dropped from the cache instead, to be
+        read again in full when needed."""
+
+        if self._cached(key) is None:
+            return
+        if len(self._series[key]) == offset:
+            self._series[key] = np.concatenate([self._series[key], values])
+            # Appending samples doesn't change the version of a series.
+            if self._signatures[key] is not None:
+                version, _ = self._signatures[key]
+                self._signatures[key] = version, len(self._series[key])
+            if self._cache is not None:
+                self._cache.put(key, self._signatures[key], self._series[key])
+        else:
+            del self._series[key]
+            del self._signatures[key]
+            if self._cache is not None:
+                self._cache.discard(key)
+
+    def pyramid(self, key: str) -> Optional[Pyramid]:
+        """Returns the header of the pyramid of a series, or None if it has none."""
+        if key not in self._pyramids:
+            wp.debug(f"Pyramid of {key} was not prefetched.")
+            self.prefetch_pyramids([key])
+        return self._pyramids[key]
+
+    def series(self, key: str, level: Optional[int] = None) -> np.ndarray:
+        """Returns the values of a series. If a level is given and the series has a
+        pyramid, only the samples of that level are returned."""
+
+        if level is not None and self.pyramid(key) is not None:
+            if self._level_key(key, level) not in self._series:
+                wp.debug(f"Level {level} of {key} was not prefetched.")
+                self.prefetch_levels({key: level})
+            return self._series[self._level_key(key, level)]
+
+        if key not in self._series:
+            wp.debug(f"Series {key} was not prefetched.")
+            self.prefetch(series_keys=[key])
+        return self._series[key]
+
+    def length(self, key: str) -> int:
+        """Returns the number of samples of a series, without reading it if its
+        pyramid header is known."""
+
+        pyramid = self._pyramids.get(key)
+        if pyramid is not None:
+            return pyramid.length
+        return len(self.series(key))
+
+    def stats(self, key: str) -> Optional[SeriesStats]:
+        """Returns the statistics of a series, or None if it has none, or if they're
+        outdated."""
+
+        if key not in self._stats:
+            wp.debug(f"Statistics of {key} were not prefetched.")
+            self._stats[key] = parse_read_stats(self._redis_cl.hgetall(stats_key(key)))
+            self.round_trips += 1
+        stats = self._stats[key]
+        if stats is None or stats.count != self.length(key):
+            return None
+        return stats
+
+    def extent(self, key: str, robust: bool = False) -> Optional[Tuple[float, float]]:
+        """Returns the minimum and maximum of a series, or None if it has no finite
+        samples, without reading it if its statistics or its pyramid header are known.
+        If `robust`, its ROBUST_QUANTILES are returned instead, leaving outliers
+        out."""
+
+        stats = self.stats(key)
+        if stats is not None:
+            return stats.robust_extent() if robust else stats.extent()
+
+        pyramid = self._pyramids.get(key)
+        if pyramid is not None and not robust:
+            return pyramid.extent
+
+        values = self.series(key)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return None
+        if robust:
+            return tuple(np.quantile(values, ROBUST_QUANTILES))
+        return values.min(), values.max()
+
+    def point(self, key: str) -> Optional[float]:
+        """Returns the value of a point parameter, or None if it isn't set."""
+        if key not in self._points:
+            wp.debug(f"Point {key} was not prefetched.")
+            self.prefetch(point_keys=[key])
+        return self._points[key]
@@ -0,0 +1,80 @@
+"""Density rendering of the figure traces.
+
+Past a few hundred thousand samples a scatter cloud is slow to draw and hard to read, so
+the samples of each stage are binned server-side instead, into a grid whose size depends
+on the size of the figure in pixels rather than on the number of samples.
+"""
+
+from typing import Iterable, Tuple
+
+import numpy as np
+
+SCATTER = "scatter"
+DENSITY = "density"
+AUTO = "auto"
+RENDER_MODES = (SCATTER, DENSITY, AUTO)
+
+# Number of samples of a single series above which the auto mode renders densities.
+DEFAULT_THRESHOLD = 300_000
+# Size in pixels of the side of a single bin.
+DEFAULT_BIN_PIXELS = 4
+
+
+def use_density(
+    render: str, lengths: Iterable[int], threshold: int, downsampled: bool = False
+) -> bool:
+    """Returns whether the figure should be rendered as densities. The auto mode never
+    does when the traces are `downsampled`, which already keeps them small."""
+
+    if render not in RENDER_MODES:
+        raise Exception(
+            f"Invalid render mode {render}, expected one of {RENDER_MODES}."
+        )
+    if render == AUTO:
+        return not downsampled and max(lengths, default=0) > threshold
+    return render == DENSITY
+
+
+def bin_counts(
+    series: Iterable[Tuple[np.ndarray, np.ndarray]],
+    x_range: Tuple[float, float],
+    y_range: Tuple[float, float],
+    n_x: int,
+    n_y: int,
+) -> np.ndarray:
+    """Counts the samples of all the given series falling in each bin of a `n_y` by `n_x`
+    grid spanning the given ranges."""
+
+    counts = np.zeros(n_x * n_y, dtype=np.int64)
+    for x, y in series:
+        ix = np.floor((x - x_range[0]) * (n_x / (x_range[1] - x_range[0])))
+        iy = np.floor((y - y_range[0]) * (n_y / (y_range[1] - y_range[0])))
+        mask = (ix >= 0) & (ix < n_x) & (iy >= 0) & (iy < n_y)
+        idx = iy[mask].astype(np.int64) * n_x + ix[mask].astype(np.int64)
+        counts += np.bincount(idx, minlength=n_x * n_y)
+
+    return counts.reshape(n_y, n_x)
+
+
+def bin_centers(value_range: Tuple[float, float], n: int) -> np.ndarray:
+    """Returns the centers of `n` bins spanning a range."""
+    step = (value_range[1] - value_range[0]) / n
+    return value_range[0] + step * (np.arange(n) + 0.5)
+
+
+def log_density(counts: np.ndarray) -> np.ndarray:
+    """Returns the log10 of the counts, empty bins are set to NaN so they're drawn as
+    transparent."""
+
+    z = np.full(counts.shape, np.nan)
+    filled = counts > 0
+    z[filled] = np.log10(counts[filled])
+    return z
+
+
+def colorscale(color: str):
+    """Returns a colorscale going from a faint to a solid version of a "#rrggbb"
+    color."""
+
+    r, g, b = (int(color[i : i + 2], 16) for i in (1, 3, 5))
+    return [[0, f"rgba({r},{g},{b},0.2)"], [1, f"rgba({r},{g},{b},1)"]]
@@ -0,0 +1,67 @@
+"""Server-side downsampling of the figure traces.
+
+The full resolution series stay on the server, only the samples needed to draw the
+current viewport, cut down to a point budget, are sent to the browser.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from plotly_resampler.aggregation import LTTB, MinMaxAggregator, MinMaxLTTB
+
+AGGREGATORS = {
+    "minmaxlttb": MinMaxLTTB,
+    "lttb": LTTB,
+    "minmax": MinMaxAggregator,
+}
+
+DEFAULT_METHOD = "minmaxlttb"
+DEFAULT_N_OUT = 5000
+
+
+class Downsampler:
+    """Reduces the samples of a trace to at most `n_out` samples inside a viewport.
+
+    Power curves are scatter clouds rather than time series, so the samples inside the
+    viewport are sorted by x before being aggregated. Aggregating on the sample index of
+    the sorted series makes each bin hold the same number of samples, which keeps the
+    density of the cloud, while the min/max based methods keep the outliers that
+    define the cleaning envelope."""
+
+    def __init__(self, method: str = DEFAULT_METHOD, n_out: int = DEFAULT_N_OUT):
+        try:
+            self._aggregator = AGGREGATORS[method]()
+        except KeyError:
+            raise Exception(
+                f"Invalid downsampling method {method}, expected one of "
+                f"{list(AGGREGATORS)}."
+            )
+        self.method = method
+        self.n_out = n_out
+
+    def __call__(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        x_range: Optional[Tuple[float, float]] = None,
+        y_range: Optional[Tuple[float, float]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the samples of a trace to be drawn for the given viewport."""
+
+        mask = np.ones(len(x), dtype=bool)
+        if x_range is not None:
+            mask &= (x >= x_range[0]) & (x <= x_range[1])
+        if y_range is not None:
+            mask &= (y >= y_range[0]) & (y <= y_range[1])
+        if not mask.all():
+            x = x[mask]
+            y = y[mask]
+
+        if len(x) <= self.n_out:
+            return x, y
+
+        order = np.argsort(x, kind="stable")
+        x = x[order]
+        y = np.ascontiguousarray(y[order])
+        idx = self._aggregator.arg_downsample(y, n_out=self.n_out)
+        return x[idx], y[idx]
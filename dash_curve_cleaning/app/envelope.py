@@ -0,0 +1,133 @@
+"""Classification of the samples by the cleaning envelope drawn with the points.
+
+Each point group draws a boundary, and removes the samples on one of its sides, either
+"above" it (greater coordinates) or "below" it. Like the lines drawn by the dash app,
+the boundary of a group depends on its number of points:
+
+1. several points - a polyline going through the points, ordered by x. Only the samples
+within the x extent of the polyline are compared to it.
+2. a single point without an x - a horizontal line at the y of the point.
+3. a single point without a y - a vertical line at the x of the point.
+4. a single point - the corner going up and right from the point, whose "above" side
+holds the samples with both a greater x and a greater y.
+
+A sample is removed if any of the boundaries removes it. Boundaries are built from the
+centers of the points, through which the lines are drawn, and are hashable, so that
+classifications can be cached per point configuration.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ABOVE = "above"
+BELOW = "below"
+SIDES = (ABOVE, BELOW)
+
+POLYLINE = "polyline"
+HORIZONTAL = "horizontal"
+VERTICAL = "vertical"
+CORNER = "corner"
+
+# Number of classifications kept by a cache.
+MAX_ENTRIES = 64
+
+Boundary = Tuple
+
+
+def boundary(
+    points: Sequence[Tuple[float, float, bool, bool]], side: str
+) -> Optional[Boundary]:
+    """Returns the boundary drawn by a point group, given the (x, y, no_x, no_y) of its
+    points, or None if it draws none."""
+
+    if side not in SIDES:
+        raise Exception(f"Invalid envelope side {side}, expected one of {SIDES}.")
+
+    if len(points) > 1:
+        points = sorted(points)
+        return (
+            POLYLINE,
+            side,
+            tuple(float(x) for x, _, _, _ in points),
+            tuple(float(y) for _, y, _, _ in points),
+        )
+    if len(points) == 1:
+        x, y, no_x, no_y = points[0]
+        if no_x and no_y:
+            return None
+        if no_x:
+            return HORIZONTAL, side, float(y)
+        if no_y:
+            return VERTICAL, side, float(x)
+        return CORNER, side, float(x), float(y)
+    return None
+
+
+def _beyond(values: np.ndarray, limit, side: str) -> np.ndarray:
+    return values > limit if side == ABOVE else values < limit
+
+
+def removed(x: np.ndarray, y: np.ndarray, boundaries: Sequence[Boundary]) -> np.ndarray:
+    """Returns the mask of the samples removed by any of the boundaries."""
+
+    mask = np.zeros(len(x), dtype=bool)
+    for kind, side, *coordinates in boundaries:
+        if kind == POLYLINE:
+            xs, ys = coordinates
+            # Interpolating every sample is faster than selecting those inside first.
+            mask |= (
+                _beyond(y, np.interp(x, xs, ys), side) & (x >= xs[0]) & (x <= xs[-1])
+            )
+        elif kind == HORIZONTAL:
+            mask |= _beyond(y, coordinates[0], side)
+        elif kind == VERTICAL:
+            mask |= _beyond(x, coordinates[0], side)
+        elif kind == CORNER:
+            corner = (x >= coordinates[0]) & (y >= coordinates[1])
+            mask |= corner if side == ABOVE else ~corner
+    return mask
+
+
+class ClassificationCache:
+    """Keeps the indices of the samples removed by the most recent classifications,
+    so that they're only computed again once the points or the samples change."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def removed(
+        self,
+        uuid: str,
+        key: Hashable,
+        x: np.ndarray,
+        y: np.ndarray,
+        boundaries: List[Boundary],
+    ) -> np.ndarray:
+        """Returns the indices of the samples of a uuid removed by the boundaries. The
+        samples are only classified if no classification of the key by the same
+        boundaries is cached, so the key must identify the samples, such as their redis
+        keys and their number."""
+
+        key = (uuid, key, tuple(boundaries))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        indices = np.flatnonzero(removed(x, y, boundaries))
+        with self._lock:
+            self._entries[key] = indices
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return indices
+
+    def drop(self, uuid: str):
+        """Drops the classifications cached for a uuid."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == uuid]:
+                del self._entries[key]
@@ -0,0 +1,251 @@
+"""Producer side API, writing the series and points displayed by the dash app.
+
+A producer hands over the samples of every asset/stage of a plot, as pandas DataFrames
+or mappings of variable names to arrays, and gets back the url displaying them:
+
+    url = ingest(
+        redis_cl,
+        uuid="12345",
+        plot="power_curve",
+        data={("A01", "original"): frame, ("A02", "original"): other_frame},
+        x_name="active_power",
+        y_name="wind_speed",
+        point_groups={"points_0": ["point_1", "point_2"]},
+        points={"point_1": (0, 0), "point_2": (5, None)},
+    )
+
+Every numeric column is written as a series (see `series`), along with its statistics and its
+pyramid. The series are first written under staging keys, with pipelined commands
+sending the samples in chunks, then renamed over the keys read by the dash app in a
+single transaction, so that viewers never see half-written data: they see either the
+previous version of every series, or the new one.
+"""
+
+import os
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+from urllib.parse import urlencode
+
+import numpy as np
+import redis
+import woodpecker as wp
+
+from selection import exclusions_key
+from series import (
+    BINARY,
+    DEFAULT_DTYPE,
+    meta_key,
+    pyramid_key,
+    queue_write_pyramid,
+    queue_write_series,
+    series_key,
+)
+from stats import stats_key
+from sync import encode_points, points_channel
+from writer import version_key, writers_key
+
+DEFAULT_BASE_URL = "http://0.0.0.0:8050/dash"
+
+
+def dash_url(
+    uuid: str,
+    plot: str,
+    assets: Sequence[str],
+    x_name: str,
+    y_name: str,
+    stages: Sequence[str],
+    point_groups: Mapping[str, Sequence[str]],
+    base_url: str = DEFAULT_BASE_URL,
+    **params,
+) -> str:
+    """Returns the url displaying a plot in the dash app. Optional url parameters, such
+    as `downsample` or `envelope`, are given as keyword arguments, lists being joined
+    with commas."""
+
+    args = {
+        "uuid": uuid,
+        "plot": plot,
+        "assets": assets,
+        "x_name": x_name,
+        "y_name": y_name,
+        "stages": stages,
+        "point_group_names": list(point_groups),
+        **point_groups,
+        **params,
+    }
+    query = urlencode(
+        {
+            name: ",".join(value) if isinstance(value, (list, tuple)) else value
+            for name, value in args.items()
+        },
+        safe=",",
+    )
+    return f"{base_url}?{query}"
+
+
+def _columns(
+    frame, x_name: str, y_name: str, variables: Optional[Sequence[str]] = None
+) -> Dict[str, np.ndarray]:
+    """Returns the numeric columns of a DataFrame, or of a mapping of names to arrays,
+    or only the given `variables` along with x and y. Other columns, such as dates or
+    labels, are skipped with a warning."""
+
+    names = list(dict.fromkeys([x_name, y_name, *(variables or [])]))
+    for name in names:
+        if name not in frame:
+            raise ValueError(f"Invalid data, {name} not found in {list(frame)}.")
+
+    columns = {}
+    for name in names if variables else frame:
+        values = np.asarray(frame[name])
+        if np.issubdtype(values.dtype, np.number) and values.dtype.kind != "c":
+            columns[str(name)] = values
+        elif not variables and name not in (x_name, y_name):
+            wp.warning(f"Column {name} of dtype {values.dtype} isn't numeric, skipped.")
+        else:
+            raise ValueError(
+                f"Invalid data, {name} of dtype {values.dtype} isn't numeric."
+            )
+    if len({len(values) for values in columns.values()}) > 1:
+        raise ValueError("Invalid data, columns must have the same length.")
+    return columns
+
+
+def _family(key: str) -> List[str]:
+    """Returns the keys a series is stored under, along with its header, statistics and
+    pyramid."""
+    return [
+        key,
+        meta_key(key),
+        stats_key(key),
+        pyramid_key(key),
+        meta_key(pyramid_key(key)),
+    ]
+
+
+def ingest(
+    redis_cl,
+    uuid: str,
+    plot: str,
+    data: Mapping[Tuple[str, str], object],
+    x_name: str,
+    y_name: str,
+    point_groups: Mapping[str, Sequence[str]],
+    points: Optional[Mapping[str, Tuple[Optional[float], Optional[float]]]] = None,
+    layout: str = BINARY,
+    dtype: str = DEFAULT_DTYPE,
+    codec: Optional[str] = None,
+    pyramid: bool = True,
+    variables: Optional[Sequence[str]] = None,
+    base_url: str = DEFAULT_BASE_URL,
+    **params,
+) -> str:
+    """Writes the samples of every (asset, stage) of a plot, given as a DataFrame or a
+    mapping of variable names to arrays, and the x and y of the points, None leaving a
+    coordinate as is, then returns the url displaying them (see `dash_url`).
+
+    Every numeric column is written, or only the given `variables` along with x and y.
+    Series are written with the given layout, dtype and codec (see `series`), and a
+    pyramid if `pyramid`, then swapped in at once, along with the points. Samples
+    excluded from the cleaning of the written asset/stages are forgotten, they were
+    indices of the previous samples."""
+
+    columns = {
+        key: _columns(frame, x_name, y_name, variables) for key, frame in data.items()
+    }
+    staging = f"staging:{os.urandom(8).hex()}"
+
+    # Keys written under staging keys, by the keys they're renamed to.
+    renames: Dict[str, str] = {}
+    finals: List[str] = []
+    pipe = redis_cl.pipeline(transaction=False)
+    for (asset, stage), variables in columns.items():
+        for var, values in variables.items():
+            key = series_key(uuid, plot, asset, var, stage)
+            staging_key = f"{staging}:{key}"
+            written = queue_write_series(
+                pipe, staging_key, values, layout, dtype, codec
+            )
+            if pyramid:
+                written += queue_write_pyramid(pipe, staging_key, values, dtype)
+            for written_key in written:
+                renames[written_key] = key + written_key[len(staging_key) :]
+            finals += _family(key)
+
+    stale = set(finals) - set(renames.values())
+    stale |= {exclusions_key(uuid, plot, *key) for key in columns}
+    try:
+        pipe.execute()
+        _swap(redis_cl, uuid, renames, stale, _point_values(uuid, points or {}))
+    except Exception:
+        if renames:
+            redis_cl.delete(*renames)
+        raise
+
+    assets = list(dict.fromkeys(asset for asset, _ in columns))
+    stages = list(dict.fromkeys(stage for _, stage in columns))
+    return dash_url(
+        uuid, plot, assets, x_name, y_name, stages, point_groups, base_url, **params
+    )
+
+
+def _point_values(
+    uuid: str, points: Mapping[str, Tuple[Optional[float], Optional[float]]]
+) -> Dict[str, float]:
+    """Returns the point parameters to write, indexed by their redis key."""
+
+    return {
+        f"{uuid}:{point}.{axis}": float(value)
+        for point, coordinates in points.items()
+        for axis, value in zip(("x", "y"), coordinates)
+        if value is not None
+    }
+
+
+def _swap(
+    redis_cl,
+    uuid: str,
+    renames: Dict[str, str],
+    stale: Set[str],
+    points: Dict[str, float],
+):
+    """Renames the staging keys over the keys read by the dash app, deletes the stale
+    ones, and writes the point parameters, in a single transaction. Like
+    `writer.write_points`, written points get a new version, published along with them
+    to the sessions displaying the uuid, retrying if another session saves its points
+    in the meantime."""
+
+    with redis_cl.pipeline() as pipe:
+        while True:
+            try:
+                if points:
+                    pipe.watch(version_key(uuid))
+                    version = int(pipe.get(version_key(uuid)) or 0) + 1
+                pipe.multi()
+                for written_key, key in renames.items():
+                    pipe.rename(written_key, key)
+                if stale:
+                    pipe.delete(*stale)
+                if points:
+                    pipe.mset(points)
+                    pipe.set(version_key(uuid), version)
+                    # Not written by a session.
+                    pipe.hdel(writers_key(uuid), version)
+                    pipe.publish(
+                        points_channel(uuid),
+                        encode_points({**points, version_key(uuid): version}),
+                    )
+                pipe.execute()
+                return
+            except redis.WatchError:
+                continue
+
+
+def drop_staging(redis_cl) -> int:
+    """Deletes the staging keys left over by ingestions that were interrupted, such as
+    by a crash of the producer, returning how many were deleted. Not to be called while
+    ingesting."""
+
+    pipe = redis_cl.pipeline(transaction=False)
+    for key in redis_cl.scan_iter("staging:*", count=1000):
+        pipe.delete(key)
+    return sum(pipe.execute())
@@ -0,0 +1,129 @@
+"""Instrumentation of the hot paths of the dash app.
+
+Measurements are aggregated into histograms, kept per process, which are exposed by the
+/metrics endpoint of the app.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence
+
+# Upper bounds of the buckets of each kind of histogram.
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+COUNT = (1, 2, 3, 4, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """A histogram of the observed values, with fixed buckets."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Returns an upper bound of the q-quantile of the observed values."""
+
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+    def dict(self) -> Dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class Registry:
+    """Histograms of every measurement, indexed by name."""
+
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = SECONDS):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(buckets)
+            self._histograms[name].observe(value)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                name: hist.dict() for name, hist in sorted(self._histograms.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+REGISTRY = Registry()
+
+_phases: contextvars.ContextVar = contextvars.ContextVar("phases", default=None)
+
+
+@contextmanager
+def collect(name: str) -> Iterator[Dict[str, float]]:
+    """Collects the duration of the phases measured with `phase` while the context is
+    active, and then records them as "{name}.{phase}", along with the total duration
+    as "{name}.total". Yields the durations of the phases, in seconds."""
+
+    phases: Dict[str, float] = {}
+    token = _phases.set(phases)
+    start = time.perf_counter()
+    try:
+        yield phases
+    finally:
+        phases["total"] = time.perf_counter() - start
+        _phases.reset(token)
+        for phase_name, duration in phases.items():
+            REGISTRY.observe(f"{name}.{phase_name}", duration)
+
+
+@contextmanager
+def phase(name: str):
+    """Measures the duration of a phase of the operation being collected. Phases with
+    the same name are added up. Does nothing if no operation is being collected."""
+
+    phases: Optional[Dict[str, float]] = _phases.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = SECONDS):
+    """Records a single measurement."""
+    REGISTRY.observe(name, value, buckets)
@@ -0,0 +1,96 @@
+"""Compact encoding of the samples sent to the browser.
+
+Dash serializes the figures returned by the callbacks with plotly's JSON encoder, which
+uses orjson when it's installed, writing every sample as a decimal number. Since version
+2.28, plotly.js also accepts arrays as typed arrays: the base64 encoded bytes of the
+samples, along with their dtype, such as
+
+    {"dtype": "f8", "bdata": "AAAAAAAA8D8AAAAAAAAAQA=="}
+
+which takes 4/3 bytes per byte of sample, whatever its number of digits. That's
+smaller than the decimal form of samples printed with many digits, such as computed
+ones, but larger than that of samples measured with a few decimals, so the smaller of
+the two is sent, estimated from a subset of the samples. 64 bits integers, which
+plotly.js doesn't support, are sent as the smallest integers holding them.
+"""
+
+import base64
+from typing import Dict, Union
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+from plotly.offline import get_plotlyjs_version
+
+# Dtypes of the typed arrays accepted by plotly.js.
+DTYPES = {
+    "int8": "i1",
+    "uint8": "u1",
+    "int16": "i2",
+    "uint16": "u2",
+    "int32": "i4",
+    "uint32": "u4",
+    "float32": "f4",
+    "float64": "f8",
+}
+INTEGERS = (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32)
+
+# Attributes of the traces holding samples.
+SAMPLE_ATTRIBUTES = ("x", "y", "z", "customdata")
+# Number of samples printed to estimate the size of the decimal form of an array.
+SUBSET_SIZE = 1000
+
+
+def typed_arrays_supported() -> bool:
+    """Returns whether the plotly.js bundled with plotly, used by dash, accepts typed
+    arrays. Older dash core components bundled a plotly.js of their own instead, whose
+    version this doesn't tell, hence the floor of dash 2.16 in requirements.txt, whose
+    core components bundle a plotly.js accepting them (2.28 or later)."""
+
+    major, minor = (int(part) for part in get_plotlyjs_version().split(".")[:2])
+    return (major, minor) >= (2, 28)
+
+
+def decimal_bytes(values: np.ndarray) -> float:
+    """Returns an estimate of the number of bytes per sample of the decimal form of
+    samples, as printed by the JSON encoder of plotly, from an evenly spaced subset."""
+
+    flat = values.ravel()
+    subset = flat[:: max(len(flat) // SUBSET_SIZE, 1)][:SUBSET_SIZE]
+    return len(to_json_plotly(subset)) / len(subset)
+
+
+def typed_array(values: np.ndarray) -> Union[Dict, np.ndarray]:
+    """Returns the typed array of numpy samples, or the samples as they are if their
+    dtype has no typed array, or if their decimal form is smaller."""
+
+    if values.size == 0:
+        return values
+    if values.dtype.kind in "iu" and values.dtype.itemsize == 8:
+        low, high = values.min(), values.max()
+        for dtype in INTEGERS:
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                values = values.astype(dtype)
+                break
+    if values.dtype.name not in DTYPES:
+        return values
+    if values.dtype.itemsize * 4 / 3 >= decimal_bytes(values):
+        return values
+
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+    array = {
+        "dtype": DTYPES[values.dtype.name],
+        "bdata": base64.b64encode(values.data).decode("ascii"),
+    }
+    if values.ndim > 1:
+        array["shape"] = ",".join(str(n) for n in values.shape)
+    return array
+
+
+def compact_samples(trace: Dict) -> Dict:
+    """Replaces the numpy samples of a trace dictionary, or of the samples of a trace
+    (see `FigureModel.sample_traces`), by typed arrays, in place."""
+
+    for name in SAMPLE_ATTRIBUTES:
+        if isinstance(trace.get(name), np.ndarray):
+            trace[name] = typed_array(trace[name])
+    return trace
@@ -0,0 +1,196 @@
+"""Server-side selection of samples, and their exclusion from the cleaning.
+
+The samples of a trace are indexed by a uniform grid: they're sorted by grid cell, with
+cells ordered column by column, so that the samples of the cells of a column within a
+box are contiguous. A box query then only looks at the samples of the cells it covers,
+and a lasso query at those of the box around the lasso.
+
+Selected samples can be excluded from the cleaning. The indices of the excluded samples
+of an asset/stage, in its series, are kept in the redis SET
+"{uuid}:{plot}:{asset}:{stage}:excluded".
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Sequence, Tuple
+
+import numpy as np
+
+# Number of cells of the grid along each axis.
+DEFAULT_CELLS = 256
+# Number of grids kept by a cache.
+MAX_INDEXES = 32
+# Number of sample indices excluded per command.
+CHUNK_SIZE = 10_000
+
+
+def exclusions_key(uuid: str, plot: str, asset: str, stage: str) -> str:
+    """Returns the redis key of the samples of an asset/stage excluded from the
+    cleaning."""
+    return f"{uuid}:{plot}:{asset}:{stage}:excluded"
+
+
+def exclude(redis_cl, exclusions: Dict[str, np.ndarray]) -> int:
+    """Adds sample indices to the excluded samples of asset/stages, given by their
+    exclusions key, in a single round trip. Returns the number of samples that weren't
+    excluded yet."""
+
+    pipe = redis_cl.pipeline(transaction=False)
+    for key, indices in exclusions.items():
+        for start in range(0, len(indices), CHUNK_SIZE):
+            pipe.sadd(key, *indices[start : start + CHUNK_SIZE].tolist())
+    return sum(pipe.execute())
+
+
+def excluded(redis_cl, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Returns the sorted indices of the excluded samples of asset/stages, given by their
+    exclusions key, in a single round trip."""
+
+    pipe = redis_cl.pipeline(transaction=False)
+    for key in keys:
+        pipe.smembers(key)
+    return {
+        key: np.sort(np.array([int(index) for index in indices], dtype=np.int64))
+        for key, indices in zip(keys, pipe.execute())
+    }
+
+
+def inside_polygon(
+    x: np.ndarray, y: np.ndarray, xs: Sequence[float], ys: Sequence[float]
+) -> np.ndarray:
+    """Returns the mask of the samples inside a polygon, by the even-odd rule."""
+
+    inside = np.zeros(len(x), dtype=bool)
+    j = len(xs) - 1
+    for i in range(len(xs)):
+        if ys[i] != ys[j]:
+            crosses = (ys[i] > y) != (ys[j] > y)
+            x_cross = xs[i] + (y - ys[i]) * (xs[j] - xs[i]) / (ys[j] - ys[i])
+            inside ^= crosses & (x < x_cross)
+        j = i
+    return inside
+
+
+class GridIndex:
+    """A uniform grid over the samples of a trace, answering box and lasso queries with
+    the indices of the samples inside, in increasing order."""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, cells: int = DEFAULT_CELLS):
+        self.x = x
+        self.y = y
+        self.cells = cells
+        finite = np.isfinite(x) & np.isfinite(y)
+        if finite.any():
+            self.x_min, self.x_max = x[finite].min(), x[finite].max()
+            self.y_min, self.y_max = y[finite].min(), y[finite].max()
+        else:
+            self.x_min = self.x_max = self.y_min = self.y_max = 0.0
+
+        # Samples that aren't finite are left out of the grid, in an extra cell.
+        cell = np.full(len(x), cells * cells, dtype=np.int64)
+        cell[finite] = self._column(x[finite]) * cells + self._row(y[finite])
+        dtype = np.int32 if len(x) < 2**31 else np.int64
+        self.order = np.argsort(cell, kind="stable").astype(dtype)
+        self.starts = np.searchsorted(cell[self.order], np.arange(cells * cells + 1))
+
+    def _cell(
+        self, values: np.ndarray, min_value: float, max_value: float
+    ) -> np.ndarray:
+        if max_value <= min_value:
+            return np.zeros(np.shape(values), dtype=np.int64)
+        cell = (np.asarray(values) - min_value) * (self.cells / (max_value - min_value))
+        return np.clip(cell, 0, self.cells - 1).astype(np.int64)
+
+    def _column(self, x) -> np.ndarray:
+        return self._cell(x, self.x_min, self.x_max)
+
+    def _row(self, y) -> np.ndarray:
+        return self._cell(y, self.y_min, self.y_max)
+
+    def _candidates(
+        self, x_range: Tuple[float, float], y_range: Tuple[float, float]
+    ) -> np.ndarray:
+        """Returns the indices of the samples of the cells overlapping a box."""
+
+        x_range = sorted(x_range)
+        y_range = sorted(y_range)
+        if (
+            x_range[1] < self.x_min
+            or x_range[0] > self.x_max
+            or y_range[1] < self.y_min
+            or y_range[0] > self.y_max
+        ):
+            return self.order[:0]
+
+        first_column, last_column = self._column(x_range)
+        first_row, last_row = self._row(y_range)
+        columns = np.arange(first_column, last_column + 1) * self.cells
+        return np.concatenate(
+            [
+                self.order[
+                    self.starts[column + first_row] : self.starts[column + last_row + 1]
+                ]
+                for column in columns
+            ]
+        )
+
+    def box(
+        self, x_range: Tuple[float, float], y_range: Tuple[float, float]
+    ) -> np.ndarray:
+        """Returns the indices of the samples inside a box."""
+
+        candidates = self._candidates(x_range, y_range)
+        x = self.x[candidates]
+        y = self.y[candidates]
+        inside = (
+            (x >= min(x_range))
+            & (x <= max(x_range))
+            & (y >= min(y_range))
+            & (y <= max(y_range))
+        )
+        return np.sort(candidates[inside])
+
+    def lasso(self, xs: Sequence[float], ys: Sequence[float]) -> np.ndarray:
+        """Returns the indices of the samples inside a lasso, given its vertices."""
+
+        if len(xs) < 3:
+            return self.order[:0]
+        candidates = self._candidates((min(xs), max(xs)), (min(ys), max(ys)))
+        inside = inside_polygon(self.x[candidates], self.y[candidates], xs, ys)
+        return np.sort(candidates[inside])
+
+
+class IndexCache:
+    """Keeps the grids of the most recently selected traces, built on their first
+    selection."""
+
+    def __init__(self, max_indexes: int = MAX_INDEXES):
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[Hashable, GridIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index(
+        self, uuid: str, key: Hashable, x: np.ndarray, y: np.ndarray
+    ) -> GridIndex:
+        """Returns the grid of the samples of a uuid, built only if none is cached for
+        the key, so the key must identify the samples, such as their redis keys and
+        their number."""
+
+        key = (uuid, key)
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+
+        index = GridIndex(x, y)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def drop(self, uuid: str):
+        """Drops the grids cached for a uuid."""
+        with self._lock:
+            for key in [key for key in self._indexes if key[0] == uuid]:
+                del self._indexes[key]
@@ -0,0 +1,435 @@
+"""Storage layouts of the series read by the dash app.
+
+Every series lives under the key "{uuid}:{plot}:{asset}:{var}:{stage}" and can be stored
+in one of two layouts:
+
+1. list - a redis LIST with one decimal value per element (the original layout).
+2. binary - a single redis STRING holding a contiguous little-endian float blob, next to
+a small header hash "{key}:meta" with the dtype and the number of samples. The blob can
+also be encoded with a codec (see `compression`), recorded in the header.
+
+Readers don't need to know which layout, or which codec, was used, both layouts are
+requested in the same pipeline and the one that answers is decoded. Samples can be
+appended to a series of either layout, and readers can then read only the samples
+appended after a given offset, unless the series is encoded, in which case it's read
+and written in full.
+
+Every write of a binary series gets a new random version, kept in its header, so that
+readers caching the series can tell whether it changed from its signature, the version
+and the number of samples, without reading it (see `queue_read_signature`). Series of
+the list layout have no version, and no signature: a list rewritten with as many
+samples would look unchanged. Neither do binary series whose header has no version,
+such as those written by other tools.
+
+A series can also have a level of detail pyramid, stored under "{key}:lod" with the
+binary layout. It holds the samples of the series shuffled with a fixed permutation, so
+that any prefix of it is a uniform sample of the series, and each level (1k, 10k, 100k
+samples and the full series) can be read with a single GETRANGE. Series of the same
+length, such as the x and y series of an asset/stage, are shuffled with the same
+permutation, so prefixes of the same length pair up. Its header also holds the levels
+and the extent of the series.
+
+Series written or appended to by this module also have statistics, kept up to date in
+the hash "{key}:stats" (see `stats`), so that their extent and quantiles are known
+without reading them. Statistics whose number of samples doesn't match the series, such
+as those of a series appended to by another writer, are outdated.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import compression
+from stats import SeriesStats, stats_key
+
+LIST = "list"
+BINARY = "binary"
+LAYOUTS = (LIST, BINARY)
+
+DTYPES = ("<f4", "<f8")
+DEFAULT_DTYPE = "<f8"
+
+# Number of commands queued by `queue_read` for a single series.
+READ_COMMANDS = 3
+
+# Bytes of a binary series, and number of samples of a list series, sent per command
+# when writing a series, so that large series aren't written by a single huge command.
+CHUNK_BYTES = 8 * 2**20
+LIST_CHUNK_SIZE = 10_000
+
+PYRAMID_LEVELS = (1_000, 10_000, 100_000)
+PYRAMID_SEED = 0
+# Number of commands queued by `queue_read_pyramid` for a single series.
+PYRAMID_READ_COMMANDS = 2
+
+
+def series_key(uuid: str, plot: str, asset: str, var: str, stage: str) -> str:
+    """Returns the redis key of a series."""
+    return f"{uuid}:{plot}:{asset}:{var}:{stage}"
+
+
+def meta_key(key: str) -> str:
+    """Returns the redis key of the header of a binary series."""
+    return f"{key}:meta"
+
+
+def pyramid_key(key: str) -> str:
+    """Returns the redis key of the level of detail pyramid of a series."""
+    return f"{key}:lod"
+
+
+def _decode_dict(dct: Dict) -> Dict[str, str]:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (
+            v.decode() if isinstance(v, bytes) else v
+        )
+        for k, v in dct.items()
+    }
+
+
+def encode_series(
+    values: Sequence[float], dtype: str = DEFAULT_DTYPE, codec: Optional[str] = None
+):
+    """Packs the values of a series into a blob, encoded with the codec if one is given,
+    or with the one used in its place (see `compression.available`), returning the blob
+    and its header."""
+
+    if dtype not in DTYPES:
+        raise ValueError(f"Invalid dtype {dtype}, expected one of {DTYPES}.")
+
+    array = np.ascontiguousarray(values, dtype=dtype)
+    meta = {"dtype": dtype, "length": len(array), "version": os.urandom(8).hex()}
+    if codec:
+        meta["codec"] = compression.available(codec)
+        return compression.encode(array, meta["codec"]), meta
+    return array.tobytes(), meta
+
+
+def decode_series(blob: bytes, meta: Dict) -> np.ndarray:
+    """Decodes a blob written by `encode_series`. Unless the blob is encoded with a
+    codec, the returned array is a read-only view over the blob, no copy is made."""
+
+    meta = _decode_dict(meta)
+    if meta.get("codec"):
+        array = compression.decode(blob or b"", meta["codec"], meta["dtype"])
+    else:
+        array = np.frombuffer(blob or b"", dtype=meta["dtype"])
+    if len(array) != int(meta["length"]):
+        raise ValueError(
+            f"Corrupted series, expected {meta['length']} samples, got {len(array)}."
+        )
+    return array
+
+
+def decode_list(values: List[bytes]) -> np.ndarray:
+    """Decodes the elements of a series stored with the list layout."""
+    if len(values) == 0:
+        return np.empty(0, dtype=np.float64)
+    return np.asarray(values).astype(np.float64)
+
+
+def queue_read(pipe, key: str):
+    """Queues on a pipeline the commands needed to read a series, whatever its layout.
+    The pipeline must be executed with `raise_on_error=False`, since the command that
+    doesn't match the layout of the key fails with a WRONGTYPE error."""
+
+    pipe.hgetall(meta_key(key))
+    pipe.get(key)
+    pipe.lrange(key, 0, -1)
+
+
+def parse_read(meta: Dict, blob: Union[bytes, Exception], values) -> np.ndarray:
+    """Decodes the replies of the commands queued by `queue_read`."""
+
+    if meta and not isinstance(meta, Exception) and not isinstance(blob, Exception):
+        return decode_series(blob, meta)
+    if isinstance(values, Exception):
+        raise values
+    return decode_list(values)
+
+
+def signature(meta: Dict, length: int) -> Optional[Tuple[str, int]]:
+    """Returns the signature of a series of a given length, given the header read by
+    `queue_read`, or None for series without a version, such as those of the list
+    layout."""
+
+    if meta and not isinstance(meta, Exception):
+        version = _decode_dict(meta).get("version")
+        if version:
+            return version, length
+    return None
+
+
+def queue_read_signature(pipe, key: str):
+    """Queues on a pipeline the command needed to read the signature of a series."""
+    pipe.hmget(meta_key(key), "version", "length")
+
+
+def parse_read_signature(meta: List) -> Optional[Tuple[str, int]]:
+    """Decodes the reply of the command queued by `queue_read_signature`."""
+
+    if isinstance(meta, Exception):
+        raise meta
+    version, length = meta
+    if not version or length is None:
+        return None
+    return version.decode(), int(length)
+
+
+def read_series(redis_cl, key: str) -> np.ndarray:
+    """Reads a series from redis in a single round trip."""
+
+    pipe = redis_cl.pipeline(transaction=False)
+    queue_read(pipe, key)
+    return parse_read(*pipe.execute(raise_on_error=False))
+
+
+def write_series(
+    redis_cl,
+    key: str,
+    values: Sequence[float],
+    layout: str = BINARY,
+    dtype: str = DEFAULT_DTYPE,
+    codec: Optional[str] = None,
+):
+    """Writes a series to redis, replacing whatever was stored under the key, in a
+    single transaction. Series of the binary layout can be encoded with a codec (see
+    `compression`)."""
+
+    pipe = redis_cl.pipeline()
+    queue_write_series(pipe, key, values, layout, dtype, codec)
+    pipe.execute()
+
+
+def queue_write_series(
+    pipe,
+    key: str,
+    values: Sequence[float],
+    layout: str = BINARY,
+    dtype: str = DEFAULT_DTYPE,
+    codec: Optional[str] = None,
+) -> List[str]:
+    """Queues on a pipeline the commands writing a series, its header and its
+    statistics, replacing whatever was stored under the key. The samples are sent in
+    chunks (see CHUNK_BYTES). Returns the keys written."""
+
+    if layout not in LAYOUTS:
+        raise ValueError(f"Invalid layout {layout}, expected one of {LAYOUTS}.")
+    if codec and layout != BINARY:
+        raise ValueError(f"Only series of the {BINARY} layout can be encoded.")
+
+    pipe.delete(key, meta_key(key), stats_key(key))
+    pipe.hset(stats_key(key), mapping=SeriesStats.from_values(values).to_meta())
+    if layout == BINARY:
+        blob, meta = encode_series(values, dtype, codec)
+        _queue_write_blob(pipe, key, blob)
+        pipe.hset(meta_key(key), mapping=meta)
+        return [key, meta_key(key), stats_key(key)]
+
+    values = np.asarray(values, dtype=np.float64)
+    for start in range(0, len(values), LIST_CHUNK_SIZE):
+        pipe.rpush(key, *values[start : start + LIST_CHUNK_SIZE].tolist())
+    return ([key] if len(values) > 0 else []) + [stats_key(key)]
+
+
+def _queue_write_blob(pipe, key: str, blob: bytes):
+    """Queues the commands writing a blob in chunks, without copying it."""
+
+    view = memoryview(blob)
+    pipe.set(key, view[:CHUNK_BYTES])
+    for start in range(CHUNK_BYTES, len(view), CHUNK_BYTES):
+        pipe.append(key, view[start : start + CHUNK_BYTES])
+
+
+def append_series(redis_cl, key: str, values: Sequence[float]):
+    """Appends samples to a series, whatever its layout, creating it with the list layout
+    if it doesn't exist. Its statistics are updated with the appended samples. The
+    pyramid of the series, if any, no longer matches it and is deleted."""
+
+    pipe = redis_cl.pipeline(transaction=False)
+    pipe.hgetall(meta_key(key))
+    pipe.hgetall(stats_key(key))
+    pipe.exists(key)
+    meta, stats, exists = pipe.execute()
+    meta = _decode_dict(meta)
+    # Statistics are only started along with the series, those of a series written
+    # without them would be missing its first samples.
+    if stats:
+        stats = SeriesStats.from_meta(_decode_dict(stats))
+    else:
+        stats = None if exists else SeriesStats()
+    if stats is not None:
+        stats.add(values)
+
+    pipe = redis_cl.pipeline()
+    if meta.get("codec"):
+        # Encoded series can't be appended to, they're encoded again in full, keeping
+        # their version.
+        series = np.concatenate([decode_series(redis_cl.get(key), meta), values])
+        blob, _ = encode_series(series, meta["dtype"], meta["codec"])
+        _queue_write_blob(pipe, key, blob)
+        pipe.hset(meta_key(key), "length", len(series))
+    elif meta:
+        blob, _ = encode_series(values, meta["dtype"])
+        pipe.append(key, blob)
+        pipe.hincrby(meta_key(key), "length", len(values))
+    elif len(values) > 0:
+        pipe.rpush(key, *[float(v) for v in values])
+    if stats is not None:
+        pipe.hset(stats_key(key), mapping=stats.to_meta())
+    pipe.delete(pyramid_key(key), meta_key(pyramid_key(key)))
+    pipe.execute()
+
+
+def queue_read_stats(pipe, key: str):
+    """Queues on a pipeline the command needed to read the statistics of a series."""
+    pipe.hgetall(stats_key(key))
+
+
+def parse_read_stats(meta: Dict) -> Optional[SeriesStats]:
+    """Decodes the reply of the command queued by `queue_read_stats`, returning None if
+    the series has no statistics."""
+
+    if not meta or isinstance(meta, Exception):
+        return None
+    return SeriesStats.from_meta(_decode_dict(meta))
+
+
+def queue_read_tail(pipe, key: str, offset: int, itemsize: int):
+    """Queues on a pipeline the commands needed to read the samples of a series from
+    `offset` on, whatever its layout. The dtype of a binary series isn't known yet, its
+    samples are expected to be `itemsize` bytes long, or to be encoded if `itemsize` is
+    0, in which case the series is read in full."""
+
+    pipe.hgetall(meta_key(key))
+    pipe.getrange(key, offset * itemsize, -1)
+    pipe.lrange(key, offset, -1)
+
+
+def parse_read_tail(
+    meta: Dict, blob: Union[bytes, Exception], values, offset: int, itemsize: int
+) -> Tuple[Optional[np.ndarray], int]:
+    """Decodes the replies of the commands queued by `queue_read_tail`, returning the
+    samples along with their size in bytes, 0 for encoded series. If the samples of a
+    binary series aren't `itemsize` bytes long, None is returned instead, and the tail
+    has to be read again with the returned size."""
+
+    if meta and not isinstance(meta, Exception) and not isinstance(blob, Exception):
+        meta = _decode_dict(meta)
+        if meta.get("codec"):
+            if itemsize != 0:
+                return None, 0
+            return decode_series(blob, meta)[offset:], 0
+        dtype = np.dtype(meta["dtype"])
+        if dtype.itemsize != itemsize:
+            return None, dtype.itemsize
+        # Samples appended after the header was read are left for the next read.
+        count = max(min(len(blob) // itemsize, int(meta["length"]) - offset), 0)
+        return np.frombuffer(blob, dtype=dtype, count=count), itemsize
+    if isinstance(values, Exception):
+        raise values
+    return decode_list(values), itemsize
+
+
+def pyramid_order(length: int) -> np.ndarray:
+    """Returns the permutation used to shuffle the pyramids of series of a given
+    length."""
+    return np.random.default_rng(PYRAMID_SEED).permutation(length)
+
+
+def write_pyramid(
+    redis_cl,
+    key: str,
+    values: Sequence[float],
+    dtype: str = DEFAULT_DTYPE,
+):
+    """Writes the level of detail pyramid of a series, in a single transaction."""
+
+    pipe = redis_cl.pipeline()
+    queue_write_pyramid(pipe, key, values, dtype)
+    pipe.execute()
+
+
+def queue_write_pyramid(
+    pipe, key: str, values: Sequence[float], dtype: str = DEFAULT_DTYPE
+) -> List[str]:
+    """Queues on a pipeline the commands writing the level of detail pyramid of a
+    series, in chunks (see CHUNK_BYTES). Returns the keys written."""
+
+    values = np.asarray(values, dtype=dtype)
+    blob, meta = encode_series(values[pyramid_order(len(values))], dtype)
+    meta["levels"] = ",".join(
+        str(level) for level in PYRAMID_LEVELS if level < len(values)
+    )
+    if len(values) > 0:
+        meta["min"] = repr(float(values.min()))
+        meta["max"] = repr(float(values.max()))
+
+    pipe.delete(pyramid_key(key), meta_key(pyramid_key(key)))
+    _queue_write_blob(pipe, pyramid_key(key), blob)
+    pipe.hset(meta_key(pyramid_key(key)), mapping=meta)
+    return [pyramid_key(key), meta_key(pyramid_key(key))]
+
+
+class Pyramid:
+    """Header of the level of detail pyramid of a series."""
+
+    def __init__(self, meta: Dict):
+        meta = _decode_dict(meta)
+        self.dtype = np.dtype(meta["dtype"])
+        self.length = int(meta["length"])
+        self.levels = [int(level) for level in meta["levels"].split(",") if level]
+        self.levels.append(self.length)
+        # Levels of pyramids without a version aren't cached, see `signature`.
+        self.signature: Optional[Tuple[str, int]] = (
+            (meta["version"], self.length) if meta.get("version") else None
+        )
+        self.extent: Optional[Tuple[float, float]] = (
+            (float(meta["min"]), float(meta["max"])) if "min" in meta else None
+        )
+
+    def level(self, n_samples: int) -> int:
+        """Returns the smallest level holding at least `n_samples` samples."""
+        return next((level for level in self.levels if level >= n_samples), self.length)
+
+    def n_bytes(self, level: int) -> int:
+        """Returns the size in bytes of a level."""
+        return level * self.dtype.itemsize
+
+
+def queue_read_pyramid(pipe, key: str):
+    """Queues on a pipeline the commands needed to read the header and the coarsest
+    level of the pyramid of a series. The dtype isn't known yet, so enough bytes for
+    the widest one are read."""
+
+    pipe.hgetall(meta_key(pyramid_key(key)))
+    pipe.getrange(
+        pyramid_key(key),
+        0,
+        PYRAMID_LEVELS[0] * max(np.dtype(d).itemsize for d in DTYPES) - 1,
+    )
+
+
+def parse_read_pyramid(meta: Dict, blob: bytes) -> Tuple[Optional[Pyramid], np.ndarray]:
+    """Decodes the replies of the commands queued by `queue_read_pyramid`, returning
+    None if the series has no pyramid."""
+
+    if not meta or isinstance(meta, Exception) or isinstance(blob, Exception):
+        return None, np.empty(0)
+
+    pyramid = Pyramid(meta)
+    level = min(pyramid.levels[0], len(blob) // pyramid.dtype.itemsize)
+    return pyramid, np.frombuffer(blob, dtype=pyramid.dtype, count=level)
+
+
+def queue_read_level(pipe, key: str, pyramid: Pyramid, level: int):
+    """Queues on a pipeline the command needed to read a level of a pyramid."""
+    pipe.getrange(pyramid_key(key), 0, pyramid.n_bytes(level) - 1)
+
+
+def parse_read_level(blob: bytes, pyramid: Pyramid) -> np.ndarray:
+    """Decodes the reply of the command queued by `queue_read_level`."""
+    if isinstance(blob, Exception):
+        raise blob
+    return np.frombuffer(blob, dtype=pyramid.dtype)
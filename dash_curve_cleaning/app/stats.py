@@ -0,0 +1,202 @@
+"""Statistics of the series, kept next to them so that axis ranges don't need samples.
+
+The statistics of a series are stored in the redis hash "{key}:stats" when the series is
+written, and updated when samples are appended to it: its number of samples, minimum and
+maximum, and a sketch of the distribution of its samples, from which quantiles are
+estimated.
+
+The sketch buckets the samples by the logarithm of their magnitude, with buckets
+growing by `(1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)`, so that the quantiles it
+estimates are within RELATIVE_ACCURACY of the exact ones (DDSketch). Sketches of two
+sets of samples merge by adding their bucket counts, which is how samples appended to a
+series are accounted for without reading the series.
+"""
+
+import json
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Axis range modes: the full extent of the samples, or the robust one, between the
+# ROBUST_QUANTILES of the samples, which leaves outliers out.
+FULL = "full"
+ROBUST = "robust"
+RANGES = (FULL, ROBUST)
+ROBUST_QUANTILES = (0.001, 0.999)
+
+RELATIVE_ACCURACY = 0.01
+# Samples of a smaller magnitude are counted as zeros.
+MIN_MAGNITUDE = 1e-9
+
+
+def stats_key(key: str) -> str:
+    """Returns the redis key of the statistics of a series."""
+    return f"{key}:stats"
+
+
+class Sketch:
+    """Counts of the samples in buckets of exponentially growing magnitude."""
+
+    def __init__(
+        self,
+        gamma: float = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY),
+        zeros: int = 0,
+        positive: Optional[Dict[int, int]] = None,
+        negative: Optional[Dict[int, int]] = None,
+    ):
+        self.gamma = gamma
+        self.zeros = zeros
+        self.positive = {} if positive is None else positive
+        self.negative = {} if negative is None else negative
+
+    @property
+    def count(self) -> int:
+        return self.zeros + sum(self.positive.values()) + sum(self.negative.values())
+
+    def add(self, values: np.ndarray):
+        """Adds finite samples to the sketch."""
+
+        magnitudes = np.abs(values)
+        large = magnitudes >= MIN_MAGNITUDE
+        self.zeros += int(np.count_nonzero(~large))
+        buckets = np.ceil(np.log(magnitudes[large]) / np.log(self.gamma)).astype(
+            np.int64
+        )
+        positive = values[large] > 0
+        for counts, selected in ((self.positive, positive), (self.negative, ~positive)):
+            selected = buckets[selected]
+            if len(selected) == 0:
+                continue
+            # Buckets span a few thousands at most, they're counted without sorting.
+            first = selected.min()
+            bucket_counts = np.bincount(selected - first)
+            for offset in np.flatnonzero(bucket_counts):
+                bucket = int(first + offset)
+                counts[bucket] = counts.get(bucket, 0) + int(bucket_counts[offset])
+
+    def merge(self, other: "Sketch"):
+        """Adds the counts of another sketch, of the same accuracy."""
+
+        self.zeros += other.zeros
+        for counts, other_counts in (
+            (self.positive, other.positive),
+            (self.negative, other.negative),
+        ):
+            for bucket, n in other_counts.items():
+                counts[bucket] = counts.get(bucket, 0) + n
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns an estimate of a quantile of the samples, None if there are none."""
+
+        count = self.count
+        if count == 0:
+            return None
+
+        rank = q * (count - 1)
+        seen = 0
+        for bucket in sorted(self.negative, reverse=True):
+            seen += self.negative[bucket]
+            if seen > rank:
+                return -self._value(bucket)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for bucket in sorted(self.positive):
+            seen += self.positive[bucket]
+            if seen > rank:
+                return self._value(bucket)
+        return self._value(max(self.positive))
+
+    def _value(self, bucket: int) -> float:
+        return 2 * self.gamma**bucket / (self.gamma + 1)
+
+    def dumps(self) -> str:
+        return json.dumps(
+            {
+                "gamma": self.gamma,
+                "zeros": self.zeros,
+                "positive": self.positive,
+                "negative": self.negative,
+            },
+            sort_keys=True,
+        )
+
+    @classmethod
+    def loads(cls, dumped: str) -> "Sketch":
+        dct = json.loads(dumped)
+        return cls(
+            dct["gamma"],
+            dct["zeros"],
+            {int(bucket): n for bucket, n in dct["positive"].items()},
+            {int(bucket): n for bucket, n in dct["negative"].items()},
+        )
+
+
+class SeriesStats:
+    """Number of samples, extent and sketch of the finite samples of a series."""
+
+    def __init__(
+        self,
+        count: int = 0,
+        min_value: float = np.inf,
+        max_value: float = -np.inf,
+        sketch: Optional[Sketch] = None,
+    ):
+        self.count = count
+        self.min = min_value
+        self.max = max_value
+        self.sketch = Sketch() if sketch is None else sketch
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> "SeriesStats":
+        stats = cls()
+        stats.add(values)
+        return stats
+
+    def add(self, values: np.ndarray):
+        """Accounts for samples appended to the series."""
+
+        values = np.asarray(values, dtype=np.float64)
+        self.count += len(values)
+        finite = values[np.isfinite(values)]
+        if len(finite) > 0:
+            self.min = min(self.min, float(finite.min()))
+            self.max = max(self.max, float(finite.max()))
+            self.sketch.add(finite)
+
+    def extent(self) -> Optional[Tuple[float, float]]:
+        """Returns the minimum and maximum of the samples, None if there are none."""
+        if self.min > self.max:
+            return None
+        return self.min, self.max
+
+    def robust_extent(self) -> Optional[Tuple[float, float]]:
+        """Returns the ROBUST_QUANTILES of the samples, None if there are none."""
+
+        extent = self.extent()
+        if extent is None:
+            return None
+        # Quantiles are estimates, they're kept within the extent.
+        low, high = (self.sketch.quantile(q) for q in ROBUST_QUANTILES)
+        return max(low, extent[0]), min(high, extent[1])
+
+    def to_meta(self) -> Dict[str, str]:
+        """Returns the fields of the redis hash of the statistics."""
+
+        return {
+            "count": str(self.count),
+            "min": repr(self.min),
+            "max": repr(self.max),
+            "sketch": self.sketch.dumps(),
+        }
+
+    @classmethod
+    def from_meta(cls, meta: Dict[str, str]) -> "SeriesStats":
+        """Returns the statistics stored in the fields of a redis hash."""
+
+        return cls(
+            int(meta["count"]),
+            float(meta["min"]),
+            float(meta["max"]),
+            Sketch.loads(meta["sketch"]),
+        )
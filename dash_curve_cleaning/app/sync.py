@@ -0,0 +1,86 @@
+"""Synchronization of the points between the sessions displaying the same uuid.
+
+Whenever point parameters are saved, the ones that changed are published, as a JSON
+object mapping their redis key to their new value, on the channel "{uuid}:points". Every
+process of the dash app listens to those channels and keeps the latest published values,
+so that sessions can move their points without reading them from redis. Other clients,
+such as the cleaning job, can subscribe to the same channels instead of polling redis.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import woodpecker as wp
+
+MAX_UUIDS = 64
+
+
+def points_channel(uuid: str) -> str:
+    """Returns the channel on which the point changes of a uuid are published."""
+    return f"{uuid}:points"
+
+
+def encode_points(points: Dict[str, float]) -> str:
+    return json.dumps({key: float(value) for key, value in points.items()})
+
+
+def decode_points(message: bytes) -> Dict[str, float]:
+    return {key: float(value) for key, value in json.loads(message).items()}
+
+
+class PointBoard:
+    """Keeps the latest published point parameters of the most recently changed uuids,
+    indexed by their redis key. Only the `max_uuids` most recently changed uuids are
+    kept."""
+
+    def __init__(self, max_uuids: int = MAX_UUIDS):
+        self.max_uuids = max_uuids
+        self._uuids: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def update(self, uuid: str, points: Dict[str, float]):
+        """Records point parameters published for a uuid."""
+
+        with self._lock:
+            self._uuids.setdefault(uuid, {}).update(points)
+            self._uuids.move_to_end(uuid)
+            while len(self._uuids) > self.max_uuids:
+                self._uuids.popitem(last=False)
+
+    def points(self, uuid: str) -> Dict[str, float]:
+        """Returns the latest point parameters published for a uuid."""
+
+        with self._lock:
+            return dict(self._uuids.get(uuid, {}))
+
+    def _handle(self, message: Dict):
+        channel = message["channel"].decode()
+        uuid = channel[: -len(points_channel(""))]
+        try:
+            self.update(uuid, decode_points(message["data"]))
+        except (ValueError, AttributeError) as error:
+            wp.warning(f"Invalid point message on {channel}: {error}")
+
+    @staticmethod
+    def _handle_error(error: Exception, pubsub, thread):
+        # The connection is opened again, and the channels subscribed again, on the
+        # next read.
+        wp.warning(f"Lost the subscription to the point channels: {error}")
+
+    def listen(self, redis_cl, sleep_time: float = 1.0) -> Optional[threading.Thread]:
+        """Subscribes to the point channels of every uuid, in a background thread. The
+        client holds its connection for as long as the thread runs, so it shouldn't
+        share the pool of the callbacks."""
+
+        if self._thread is None:
+            pubsub = redis_cl.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{points_channel("*"): self._handle})
+            self._thread = pubsub.run_in_thread(
+                sleep_time=sleep_time,
+                daemon=True,
+                exception_handler=self._handle_error,
+            )
+        return self._thread
@@ -0,0 +1,68 @@
+"""Rendering plan of the scatter traces drawing the samples.
+
+By default every asset/stage gets its own trace, drawn as SVG, which browsers struggle
+with past a few dozen traces or a few thousand markers, as on a farm of 60 turbines
+cleaned over 3 stages. The plan picks:
+
+1. the grouping of the samples, either a trace per asset/stage, or a trace per stage,
+holding the samples of all its assets one after the other, the index of the asset of
+every sample being kept as its `customdata`. The assets of a stage share its color, so
+merged traces look the same, and the legend shows or hides a whole stage at once.
+2. the type of the traces, WebGL ("scattergl") once the figure holds more than
+`webgl_threshold` samples, as plotly express does, SVG ("scatter") otherwise.
+"""
+
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+PER_ASSET = "asset"
+PER_STAGE = "stage"
+AUTO = "auto"
+TRACE_MODES = (PER_ASSET, PER_STAGE, AUTO)
+
+SVG = "scatter"
+WEBGL = "scattergl"
+
+# Number of asset/stage traces above which the auto mode merges the assets of a stage.
+DEFAULT_MAX_TRACES = 20
+# Number of samples of the figure above which its traces are drawn with WebGL.
+DEFAULT_WEBGL_THRESHOLD = 1000
+
+
+def merge_assets(traces: str, n_assets: int, n_stages: int, max_traces: int) -> bool:
+    """Returns whether the assets of each stage should be drawn as a single trace."""
+
+    if traces not in TRACE_MODES:
+        raise Exception(f"Invalid trace mode {traces}, expected one of {TRACE_MODES}.")
+    if traces == AUTO:
+        return n_assets > 1 and n_assets * n_stages > max_traces
+    return traces == PER_STAGE
+
+
+def trace_type(n_samples: int, threshold: int) -> str:
+    """Returns the type of the traces of a figure holding `n_samples` samples."""
+    return WEBGL if n_samples > threshold else SVG
+
+
+def merged_samples(series: Sequence[Tuple[np.ndarray, np.ndarray]]) -> Dict:
+    """Returns the x, y and customdata of a trace holding the samples of every asset of
+    a stage, given in the order of the assets. Unpaired samples are left out, so that
+    the samples of an asset start where those of the previous one end."""
+
+    lengths = [min(len(x), len(y)) for x, y in series]
+    return {
+        "x": np.concatenate([x[:n] for (x, _), n in zip(series, lengths)]),
+        "y": np.concatenate([y[:n] for (_, y), n in zip(series, lengths)]),
+        "customdata": np.repeat(np.arange(len(series)), lengths),
+    }
+
+
+def merged_indices(indices: Sequence[np.ndarray], lengths: Sequence[int]) -> np.ndarray:
+    """Returns the indices in a merged trace (see `merged_samples`) of samples given by
+    their indices in the series of every asset, holding `lengths` paired samples."""
+
+    offsets = np.cumsum([0] + list(lengths[:-1]))
+    return np.concatenate(
+        [np.asarray(idx) + offset for idx, offset in zip(indices, offsets)]
+    )
@@ -0,0 +1,220 @@
+"""Persistence of the point parameters moved in the dash app.
+
+The points of a uuid are versioned by the counter "{uuid}:points:version", incremented
+by every write. A write only goes through if the version is still the one the points
+were moved from (compare-and-set, with WATCH), so that a session can't silently
+overwrite the points saved by another one in the meantime. The session behind each of
+the last versions is recorded in the HASH "{uuid}:points:writers", so that a session can
+tell its own writes from those of other sessions, whichever process of the app wrote
+them, and a write moved from a version the same session wrote over since goes through.
+
+The points of a write that doesn't go through are added to the SET
+"{uuid}:points:rejected:{session}", for the session to tell its user.
+
+Writes are held for a short delay before being sent, so that the points moved by
+several callbacks in a row, such as a series of drags, are written at once.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis
+import woodpecker as wp
+
+from sync import encode_points, points_channel
+
+# Seconds a write is held for, waiting for more points to be moved.
+DEFAULT_DELAY = 0.5
+# Seconds a write can be held for, at most, if points keep being moved.
+DEFAULT_MAX_DELAY = 2.0
+# Number of versions whose session is remembered.
+MAX_VERSIONS = 16
+# Seconds the points of a rejected write are kept, if the session doesn't get them.
+REJECTED_TTL = 3600
+
+
+def version_key(uuid: str) -> str:
+    """Returns the redis key of the version of the points of a uuid."""
+    return f"{uuid}:points:version"
+
+
+def writers_key(uuid: str) -> str:
+    """Returns the redis key of the HASH mapping the last versions of the points of a
+    uuid to the session that wrote them."""
+    return f"{uuid}:points:writers"
+
+
+def rejected_key(uuid: str, session: str) -> str:
+    """Returns the redis key of the SET of the points of a session that weren't
+    written."""
+    return f"{uuid}:points:rejected:{session}"
+
+
+def written_by(
+    redis_cl, uuid: str, session: str, version: int, saved: int, store=None
+) -> bool:
+    """Returns whether the points of a uuid were only written by a session since
+    `version`, up to the `saved` version. Reading the sessions that wrote them counts as
+    a round trip of the `store` given, if any (see `datastore.RedisStore`)."""
+
+    if saved == version:
+        return True
+    if not version < saved <= version + MAX_VERSIONS:
+        return False
+    writers = redis_cl.hmget(writers_key(uuid), list(range(version + 1, saved + 1)))
+    if store is not None:
+        store.round_trips += 1
+    return all(writer is not None and writer.decode() == session for writer in writers)
+
+
+def write_points(
+    redis_cl, uuid: str, session: str, points: Dict[str, float], version: int
+) -> Optional[int]:
+    """Writes point parameters of a session, and publishes them along with their new
+    version, if the points of the uuid weren't written by another session since
+    `version`. Returns the new version, or None if they were."""
+
+    with redis_cl.pipeline() as pipe:
+        try:
+            pipe.watch(version_key(uuid))
+            saved = int(pipe.get(version_key(uuid)) or 0)
+            if not written_by(pipe, uuid, session, version, saved):
+                return None
+            pipe.multi()
+            pipe.mset(points)
+            pipe.incr(version_key(uuid))
+            pipe.hset(writers_key(uuid), saved + 1, session)
+            pipe.hdel(writers_key(uuid), saved + 1 - MAX_VERSIONS)
+            pipe.publish(
+                points_channel(uuid),
+                encode_points({**points, version_key(uuid): saved + 1}),
+            )
+            return pipe.execute()[1]
+        except redis.WatchError:
+            return None
+
+
+class _PendingWrite:
+    def __init__(self, version: int):
+        self.version = version
+        self.points: Dict[str, float] = {}
+        self.since = time.monotonic()
+        self.timer: Optional[threading.Timer] = None
+
+
+class PointWriter:
+    """Holds the point parameters to write for every session, and writes them once no
+    point was moved for `delay` seconds, or `max_delay` seconds after the first one
+    was. With no delay, points are written right away. Sessions are identified by the
+    uuid they display and an id of their own.
+
+    The points of the writes that don't go through are kept in redis until the
+    session gets them (see `rejected`)."""
+
+    def __init__(
+        self,
+        redis_cl,
+        delay: float = DEFAULT_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ):
+        self._redis_cl = redis_cl
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending: Dict[Tuple[str, str], _PendingWrite] = {}
+        self._lock = threading.Lock()
+
+    def version(
+        self, uuid: str, session: str, version: int, saved: int, store=None
+    ) -> int:
+        """Returns the `saved` version of the points of a uuid if they were only
+        written by a session since `version`, in any process, or `version` otherwise.
+        The round trip it may take counts in the `store` given, if any."""
+
+        if written_by(self._redis_cl, uuid, session, version, saved, store):
+            return saved
+        return version
+
+    def rejected(self, uuid: str, session: str, store=None) -> List[str]:
+        """Returns, and forgets, the keys of the point parameters of a session that
+        weren't written because another session wrote its own in the meantime. The
+        round trip it takes counts in the `store` given, if any."""
+
+        with self._redis_cl.pipeline() as pipe:
+            pipe.smembers(rejected_key(uuid, session))
+            pipe.delete(rejected_key(uuid, session))
+            keys, _ = pipe.execute()
+        if store is not None:
+            store.round_trips += 1
+        return sorted(key.decode() for key in keys)
+
+    def pending(self, uuid: str, session: str) -> Dict[str, float]:
+        """Returns the point parameters of a session not written yet."""
+
+        with self._lock:
+            pending = self._pending.get((uuid, session))
+            return {} if pending is None else dict(pending.points)
+
+    def save(self, uuid: str, session: str, points: Dict[str, float], version: int):
+        """Saves point parameters of a session, moved from the given version of the
+        points."""
+
+        stale = due = None
+        with self._lock:
+            pending = self._pending.get((uuid, session))
+            if pending is not None and pending.version != version:
+                # The points held so far were moved from another version, they're
+                # written on their own.
+                stale = self._pending.pop((uuid, session))
+                stale.timer.cancel()
+                pending = None
+
+            if pending is None:
+                pending = self._pending[(uuid, session)] = _PendingWrite(version)
+            else:
+                pending.timer.cancel()
+            pending.points.update(points)
+
+            delay = min(self.delay, pending.since + self.max_delay - time.monotonic())
+            if delay > 0:
+                pending.timer = threading.Timer(
+                    delay, self.flush, args=(uuid,), kwargs={"session": session}
+                )
+                pending.timer.start()
+            else:
+                due = self._pending.pop((uuid, session))
+
+        for write in (stale, due):
+            if write is not None:
+                self._write(uuid, session, write)
+
+    def flush(self, uuid: str, session: Optional[str] = None):
+        """Writes the point parameters of a session held so far, or those of every
+        session of the uuid if none is given."""
+
+        with self._lock:
+            keys = [
+                key
+                for key in self._pending
+                if key[0] == uuid and session in (None, key[1])
+            ]
+            writes = [(key[1], self._pending.pop(key)) for key in keys]
+            for _, pending in writes:
+                pending.timer.cancel()
+
+        for session, pending in writes:
+            self._write(uuid, session, pending)
+
+    def _write(self, uuid: str, session: str, pending: _PendingWrite):
+        version = write_points(
+            self._redis_cl, uuid, session, pending.points, pending.version
+        )
+        if version is None:
+            wp.warning(
+                f"Points of {uuid} were saved by another session since version "
+                f"{pending.version}, {list(pending.points)} were not saved."
+            )
+            with self._redis_cl.pipeline() as pipe:
+                pipe.sadd(rejected_key(uuid, session), *pending.points)
+                pipe.expire(rejected_key(uuid, session), REJECTED_TTL)
+                pipe.execute()
@@ -0,0 +1,376 @@
+"""
+Benchmarks the dash app on a synthetic farm of configurable size.
+
+The farm is written to a local redis server, or to an in-process stand-in (fakeredis)
+when no server is given, then each step of the callback is timed on its own, along with
+the whole `update_image` callback, both when the url is loaded and when a point is
+dragged, and the size of the loaded figure, encoded and gzip compressed as sent by the
+app. The peak memory allocated by each step is measured on a separate run, so that
+tracing allocations doesn't slow down the timed ones.
+
+Results are written as JSON, so that they can be compared between commits:
+
+    python benchmark.py --assets 4 --stages 2 --samples 1000000 -o before.json
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+# Benchmark the production layout of the app, unless told otherwise.
+os.environ.setdefault("DEBUG", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from ingest import dash_url  # noqa: E402
+from populate_redis_with_test_data import (  # noqa: E402
+    point_groups,
+    point_parameters,
+    populate,
+    x_max,
+    x_min,
+    y_deviation,
+)
+from writer import PointWriter  # noqa: E402
+
+N_COPIES = 10
+UUID = "benchmark"
+PLOT = "power_curve"
+X_NAME = "active_power"
+Y_NAME = "wind_speed"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--assets", type=int, default=3, help="Number of assets.")
+    parser.add_argument("--stages", type=int, default=1, help="Number of stages.")
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=100_000,
+        help="Number of samples of each series, that is of each asset and stage.",
+    )
+    parser.add_argument("--downsample", help="Downsampling method, none by default.")
+    parser.add_argument("--max-points", type=int, help="Points kept when downsampling.")
+    parser.add_argument("--render", default="auto", help="Render mode of the figure.")
+    parser.add_argument(
+        "--no-pyramid", action="store_true", help="Don't write the pyramids."
+    )
+    parser.add_argument(
+        "--gzip-level", type=int, default=1, help="Zlib level of the responses."
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per step.")
+    parser.add_argument(
+        "--redis",
+        help="Url of the redis server, such as redis://localhost:6379/0. The farm is "
+        "written to an in-process fakeredis server when not given. Only the keys of "
+        f"the farm, under {UUID}:, are deleted.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Output file, stdout by default.")
+    return parser.parse_args()
+
+
+def redis_connection(url):
+    if url is None:
+        import fakeredis
+
+        return fakeredis.FakeRedis()
+
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+def delete_keys(redis_cl, pattern: str):
+    """Deletes the keys matching a pattern, such as those left by a previous run,
+    leaving the other keys of the server alone."""
+
+    keys = list(redis_cl.scan_iter(match=pattern, count=1000))
+    for start in range(0, len(keys), 1000):
+        redis_cl.delete(*keys[start : start + 1000])
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_url(args, assets, stages):
+    params = {"render": args.render}
+    if args.downsample:
+        params["downsample"] = args.downsample
+    if args.max_points:
+        params["max_points"] = args.max_points
+    return dash_url(
+        UUID,
+        PLOT,
+        assets,
+        X_NAME,
+        Y_NAME,
+        stages,
+        {f"points_{i}": group for i, group in enumerate(point_groups)},
+        "http://localhost:8050/dash",
+        **params,
+    )
+
+
+class Recorder:
+    """Runs the steps, either timing them or measuring their peak memory."""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.durations = {}
+        self.peaks = {}
+
+    def __call__(self, name, fn, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+            result = fn(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1] - start_memory
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        else:
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.durations.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+
+def run_steps(record, dashapp, url, redis_cl, gzip_level):
+    """Runs each step of `dashapp.load_figure` on its own, then encodes and compresses
+    the figure. Returns the size of the encoded figure and of the compressed one."""
+
+    from datastore import RedisStore
+    from plotly.io.json import to_json_plotly
+
+    url = dashapp.Url(url)
+    downsampler = None
+    if url.downsample:
+        downsampler = dashapp.Downsampler(url.downsample, url.max_points)
+
+    store = RedisStore(redis_cl)
+    # Points are written right away, so that their writes are timed.
+    writer = PointWriter(redis_cl, delay=0)
+    figure_dct = dashapp.create_empty_plotly_figure().to_plotly_json()
+    figure = dashapp.FigureModel(
+        assets=url.assets,
+        x_name=url.x_name,
+        y_name=url.y_name,
+        point_names=url.point_names,
+        point_groups=url.point_groups,
+        layout=figure_dct["layout"],
+    )
+    series_keys = figure.series_keys(url.uuid, url.plot, url.stages)
+    point_keys = figure.point_keys(url.uuid)
+
+    record("prefetch", store.prefetch, series_keys, point_keys)
+    extent = record(
+        "populate_figure_data",
+        figure.populate_figure_data,
+        store,
+        url.uuid,
+        url.plot,
+        url.stages,
+        downsampler,
+    )
+    if extent[0] is not None:
+        figure.set_ranges(*extent)
+    record("populate_points", figure.populate_points, store, url.uuid)
+    record("populate_lines", figure.populate_lines)
+    record("update_points", figure.update_points, store, url.uuid)
+    record("update_lines", figure.update_lines)
+    record("save_points", figure.save_points, store, url.uuid, writer)
+    record(
+        "update_figure_dct_layout", dashapp.update_figure_dct_layout, figure_dct, figure
+    )
+    record(
+        "update_figure_dct_data",
+        dashapp.update_figure_dct_data,
+        figure_dct,
+        figure,
+        compact=True,
+    )
+    encoded = record("encode", to_json_plotly, figure_dct).encode()
+    compressed = record("compress", gzip.compress, encoded, gzip_level)
+    return len(encoded), len(compressed)
+
+
+def post_callback(client, dash_app, values, changed):
+    """Calls `update_image` the way the browser does, returning its response."""
+
+    output, callback = next(iter(dash_app.callback_map.items()))
+    outputs = []
+    for spec in output.strip(".").split("..."):
+        component_id, prop = spec.rsplit(".", 1)
+        outputs.append({"id": component_id, "property": prop})
+
+    def with_values(dependencies):
+        return [
+            dict(d, value=values.get(f"{d['id']}.{d['property']}"))
+            for d in dependencies
+        ]
+
+    response = client.post(
+        dash_app.config.routes_pathname_prefix + "_dash-update-component",
+        json={
+            "output": output,
+            "outputs": outputs,
+            "inputs": with_values(callback["inputs"]),
+            "state": with_values(callback["state"]),
+            "changedPropIds": changed,
+        },
+    )
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f"update_image failed: {response.status_code}")
+    return response.get_json()
+
+
+def run_callback(record, dash_app, url):
+    """Runs the whole `update_image` callback, loading the url then saving a dragged
+    point, as sent by the browser once the drag is over."""
+
+    client = dash_app.server.test_client()
+    response = record(
+        "update_image.load", post_callback, client, dash_app, {"url.href": url}, []
+    )
+    layout_dct = response["response"]["figure-layout"]["data"]
+
+    shape = layout_dct["shapes"][0]
+    relayout_data = {
+        f"shapes[0].{coordinate}": shape[coordinate] + 0.1
+        for coordinate in ("x0", "x1", "y0", "y1")
+    }
+    record(
+        "update_image.drag",
+        post_callback,
+        client,
+        dash_app,
+        {
+            "url.href": url,
+            "relayout.data": relayout_data,
+            "figure-layout.data": layout_dct,
+        },
+        ["relayout.data"],
+    )
+
+
+def summary(durations):
+    return {
+        "runs": len(durations),
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.mean(durations),
+        "max": max(durations),
+    }
+
+
+def main():
+    args = parse_args()
+
+    assets = [f"A{i + 1:02d}" for i in range(args.assets)]
+    stages = [f"stage_{i}" for i in range(args.stages)]
+    redis_cl = redis_connection(args.redis)
+    delete_keys(redis_cl, f"{UUID}:*")
+
+    start = time.perf_counter()
+    populate(
+        redis_cl,
+        UUID,
+        PLOT,
+        X_NAME,
+        Y_NAME,
+        assets,
+        stages,
+        point_groups,
+        point_parameters,
+        args.samples // N_COPIES,
+        x_min,
+        x_max,
+        y_deviation,
+        n_copies=N_COPIES,
+        pyramid=not args.no_pyramid,
+        seed=args.seed,
+    )
+    populate_duration = time.perf_counter() - start
+
+    import dashapp
+
+    # The app reads from, and writes to, the benchmark server, whichever it is.
+    dashapp.redis_cl = redis_cl
+    dashapp.POINT_WRITER = PointWriter(redis_cl, dashapp.POINT_WRITE_DELAY)
+    dash_app = dashapp.create_dash_app()
+    url = benchmark_url(args, assets, stages)
+
+    # Warm up the imports and the caches of plotly and dash.
+    encoded_bytes, compressed_bytes = run_steps(
+        Recorder(), dashapp, url, redis_cl, args.gzip_level
+    )
+    run_callback(Recorder(), dash_app, url)
+
+    timer = Recorder()
+    for _ in range(args.repeat):
+        run_steps(timer, dashapp, url, redis_cl, args.gzip_level)
+        run_callback(timer, dash_app, url)
+
+    tracer = Recorder(trace_memory=True)
+    tracemalloc.start()
+    run_steps(tracer, dashapp, url, redis_cl, args.gzip_level)
+    run_callback(tracer, dash_app, url)
+    tracemalloc.stop()
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "parameters": {
+            **{k: v for k, v in vars(args).items() if k != "output"},
+            "url": url,
+        },
+        "n_samples": args.assets * args.stages * args.samples,
+        "populate": populate_duration,
+        "figure_bytes": {"encoded": encoded_bytes, "compressed": compressed_bytes},
+        "steps": {
+            name: {**summary(durations), "peak_memory": tracer.peaks[name]}
+            for name, durations in timer.durations.items()
+        },
+        # ru_maxrss is in kilobytes on linux.
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+    dumped = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(dumped + "\n")
+    else:
+        print(dumped)
+
+    for name, step in results["steps"].items():
+        print(
+            f"{name:<26} {1000 * step['median']:>10.2f} ms "
+            f"{step['peak_memory'] / 2**20:>10.1f} MiB",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmarks the storage of series with each layout and codec.
+
+A timestamp column and a sensor column are written to a local redis server, or to an
+in-process stand-in (fakeredis) when no server is given, with the list layout, the
+binary layout, and the binary layout encoded with several codecs. For each of them the
+size of the stored series, the time to read them (a single round trip), and the time
+to decode them once read are measured, along with the decoding throughput.
+
+Results are written as JSON, so that they can be compared between commits:
+
+    python benchmark_codecs.py --samples 1000000 -o codecs.json
+"""
+
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from benchmark import delete_keys, git_commit, redis_connection, summary  # noqa: E402
+from series import (  # noqa: E402
+    BINARY,
+    LIST,
+    READ_COMMANDS,
+    parse_read,
+    queue_read,
+    write_series,
+)
+
+# Prefix of the keys of the benchmarked series.
+PREFIX = "benchmark_codecs"
+
+# Codecs of each column, None standing for the binary layout without codec.
+CODECS = {
+    "timestamp": [None, "zlib", "delta,zlib", "delta,snappy"],
+    "sensor": [
+        None,
+        "zlib",
+        "quantize:0.01,zlib",
+        "quantize:0.01,delta,zlib",
+        "snappy",
+    ],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--samples", type=int, default=1_000_000, help="Samples of each series."
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per series.")
+    parser.add_argument(
+        "--redis",
+        help="Url of the redis server, such as redis://localhost:6379/0. The series "
+        "are written to an in-process fakeredis server when not given. Only the keys "
+        f"of the series, under {PREFIX}:, are deleted.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Output file, stdout by default.")
+    return parser.parse_args()
+
+
+def generate_columns(n_samples, seed=None):
+    """Returns a timestamp column, sampled every 10 minutes, and a sensor column, such
+    as a wind speed, measured with a few decimals."""
+
+    rng = np.random.default_rng(seed)
+    timestamp = 1.6e9 + 600.0 * np.arange(n_samples)
+    sensor = np.round(np.abs(8 + np.cumsum(rng.normal(0, 0.3, n_samples))) % 25, 2)
+    return {"timestamp": timestamp, "sensor": sensor}
+
+
+def variants(column):
+    yield LIST, None
+    for codec in CODECS[column]:
+        yield BINARY, codec
+
+
+def read_replies(redis_cl, key):
+    pipe = redis_cl.pipeline(transaction=False)
+    queue_read(pipe, key)
+    return pipe.execute(raise_on_error=False)
+
+
+def stored_bytes(redis_cl, key, layout):
+    """Returns the size of a stored series, as sent by redis."""
+
+    if layout == BINARY:
+        return redis_cl.strlen(key)
+    return sum(len(value) for value in redis_cl.lrange(key, 0, -1))
+
+
+def benchmark_variant(redis_cl, key, values, layout, codec, repeat):
+    try:
+        start = time.perf_counter()
+        write_series(redis_cl, key, values, layout, codec=codec)
+        write_duration = time.perf_counter() - start
+    except ValueError as error:
+        # Such as a codec whose package isn't installed.
+        return {"error": str(error)}
+
+    reads = []
+    decodes = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        replies = read_replies(redis_cl, key)
+        reads.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decoded = parse_read(*replies[:READ_COMMANDS])
+        decodes.append(time.perf_counter() - start)
+
+    return {
+        "bytes": stored_bytes(redis_cl, key, layout),
+        "bytes_per_sample": stored_bytes(redis_cl, key, layout) / len(values),
+        "max_error": float(np.max(np.abs(decoded - values))) if len(values) else 0.0,
+        "write": write_duration,
+        "read": summary(reads),
+        "decode": summary(decodes),
+        "decode_samples_per_second": len(values) / statistics.median(decodes),
+    }
+
+
+def main():
+    args = parse_args()
+    redis_cl = redis_connection(args.redis)
+    delete_keys(redis_cl, f"{PREFIX}:*")
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "numpy": np.__version__,
+        "parameters": {k: v for k, v in vars(args).items() if k != "output"},
+        "series": {},
+    }
+    for column, values in generate_columns(args.samples, args.seed).items():
+        for layout, codec in variants(column):
+            name = f"{column}:{layout}" + (f":{codec}" if codec else "")
+            results["series"][name] = benchmark_variant(
+                redis_cl, f"{PREFIX}:{name}", values, layout, codec, args.repeat
+            )
+            delete_keys(redis_cl, f"{PREFIX}:*")
+
+    dumped = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(dumped + "\n")
+    else:
+        print(dumped)
+
+    for name, result in results["series"].items():
+        if "error" in result:
+            print(f"{name:<40} {result['error']}", file=sys.stderr)
+            continue
+        print(
+            f"{name:<40} {result['bytes_per_sample']:>6.2f} B/sample "
+            f"{1000 * result['read']['median']:>9.2f} ms read "
+            f"{1000 * result['decode']['median']:>9.2f} ms decode "
+            f"{result['decode_samples_per_second'] / 1e6:>8.1f} M samples/s",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
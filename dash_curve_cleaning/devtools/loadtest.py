@@ -0,0 +1,469 @@
+"""
+Load tests the dash app with concurrent sessions.
+
+Every session opens the url of a synthetic farm, written with the same generator as
+"populate_redis_with_test_data", the way a browser does: it loads the page, the layout
+and the callbacks of the dash app, then calls `update_image` to load the figure. It then
+replays a sequence of point drags and zooms, as the browser sends them once they're
+over, waiting a random think time before each of them. The latency of every request is
+recorded by phase, that is by kind of request, and reported as throughput and
+p50/p95/p99 percentiles, along with the timings of the phases of the callback measured
+by the app itself (see /metrics).
+
+By default, the FastAPI app is served by uvicorn in this process, as a container serves
+it with a single worker, reading from a local redis server or from an in-process
+stand-in (fakeredis). The sessions then share the interpreter of the app, which is
+enough to compare commits, but use --target to load test a deployment instead, such as
+that of `make deploy`, when sizing its workers:
+
+    python loadtest.py --sessions 20 --actions 30 -o before.json
+    python loadtest.py --target http://localhost:8050 --redis redis://localhost:6379/0
+"""
+
+import argparse
+import datetime
+import gzip
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+# Load test the production layout of the app, unless told otherwise.
+os.environ.setdefault("DEBUG", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from benchmark import (  # noqa: E402
+    N_COPIES,
+    PLOT,
+    UUID,
+    X_NAME,
+    Y_NAME,
+    delete_keys,
+    git_commit,
+    redis_connection,
+)
+from populate_redis_with_test_data import (  # noqa: E402
+    point_groups,
+    point_parameters,
+    populate,
+    x_max,
+    x_min,
+    y_deviation,
+)
+from writer import PointWriter  # noqa: E402
+
+# Seconds a request may take before the session gives up on it.
+TIMEOUT = 60
+# Share of the zooms resetting the axis ranges, as a double click does.
+AUTORANGE_RATIO = 0.2
+# Phases of the requests calling `update_image`.
+CALLBACK_PHASES = ("load", "drag", "zoom")
+PERCENTILES = (50, 95, 99)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent sessions.")
+    parser.add_argument(
+        "--actions", type=int, default=20, help="Drags and zooms of each session."
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=1.0,
+        help="Mean think time in seconds before each action, 0 for none.",
+    )
+    parser.add_argument(
+        "--zoom-ratio",
+        type=float,
+        default=0.3,
+        help="Share of zooms among the actions.",
+    )
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=1.0,
+        help="Seconds over which the sessions are started.",
+    )
+    parser.add_argument(
+        "--uuids",
+        type=int,
+        default=1,
+        help="Number of farms, under distinct uuids, the sessions are spread over.",
+    )
+    parser.add_argument("--assets", type=int, default=3, help="Number of assets.")
+    parser.add_argument("--stages", type=int, default=1, help="Number of stages.")
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=100_000,
+        help="Number of samples of each series, that is of each asset and stage.",
+    )
+    parser.add_argument("--downsample", help="Downsampling method, none by default.")
+    parser.add_argument("--max-points", type=int, help="Points kept when downsampling.")
+    parser.add_argument("--render", default="auto", help="Render mode of the figure.")
+    parser.add_argument(
+        "--target",
+        help="Url of a running app, such as http://localhost:8050, reading from the "
+        "--redis server. The app is served in this process when not given.",
+    )
+    parser.add_argument(
+        "--redis",
+        help="Url of the redis server, such as redis://localhost:6379/0. The farms are "
+        "written to an in-process fakeredis server when not given. Only the keys of "
+        f"the farms, under {UUID}-*:, are deleted.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Output file, stdout by default.")
+    args = parser.parse_args()
+    if args.target and not args.redis:
+        parser.error("--target requires --redis, the server the app reads from.")
+    return args
+
+
+def serve(redis_cl):
+    """Serves the FastAPI app in a thread of this process, reading from, and writing
+    to, the given redis server. Returns the uvicorn server and its url."""
+
+    import uvicorn
+
+    import dashapp
+
+    dashapp.redis_cl = redis_cl
+    dashapp.POINT_WRITER = PointWriter(redis_cl, dashapp.POINT_WRITE_DELAY)
+    from app import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def farm_url(args, redis_cl, uuid, assets, stages, target):
+    """Writes a farm under the given uuid, returning the url displaying it."""
+
+    url = populate(
+        redis_cl,
+        uuid,
+        PLOT,
+        X_NAME,
+        Y_NAME,
+        assets,
+        stages,
+        point_groups,
+        point_parameters,
+        args.samples // N_COPIES,
+        x_min,
+        x_max,
+        y_deviation,
+        n_copies=N_COPIES,
+        seed=args.seed,
+        base_url=f"{target}/dash/",
+    )
+    params = {"render": args.render}
+    if args.downsample:
+        params["downsample"] = args.downsample
+    if args.max_points:
+        params["max_points"] = args.max_points
+    return f"{url}&{urlencode(params)}"
+
+
+class Client:
+    """Calls the app over a connection of its own, kept alive, like a browser."""
+
+    def __init__(self, target: str):
+        parts = urlsplit(target)
+        self.connection = http.client.HTTPConnection(
+            parts.hostname, parts.port or 80, timeout=TIMEOUT
+        )
+
+    def request(self, method, path, body=None):
+        headers = {"Accept-Encoding": "gzip"}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        try:
+            self.connection.request(method, path, data, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnects on the next request.
+            self.connection.close()
+            raise
+        if response.status not in (200, 204):
+            raise RuntimeError(f"{method} {path} failed: {response.status}")
+        if response.getheader("Content-Encoding") == "gzip":
+            content = gzip.decompress(content)
+        return content
+
+    def close(self):
+        self.connection.close()
+
+
+class Recorder:
+    """Records the latency of the requests of every session, by phase."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            with self._lock:
+                self.errors[name] += 1
+            raise
+        with self._lock:
+            self.latencies[name].append(time.perf_counter() - start)
+        return result
+
+
+def update_image_callback(dependencies):
+    """Returns the callback of `update_image`, as listed by the app."""
+
+    for callback in dependencies:
+        if callback.get("clientside_function"):
+            continue
+        if any(dependency["id"] == "relayout" for dependency in callback["inputs"]):
+            return callback
+    raise RuntimeError("update_image not found in the callbacks of the app.")
+
+
+def post_callback(client, prefix, callback, values, changed):
+    """Calls a callback the way the browser does, returning its response."""
+
+    outputs = []
+    for spec in callback["output"].strip(".").split("..."):
+        component_id, prop = spec.rsplit(".", 1)
+        outputs.append({"id": component_id, "property": prop})
+
+    def with_values(dependencies):
+        return [
+            dict(d, value=values.get(f"{d['id']}.{d['property']}"))
+            for d in dependencies
+        ]
+
+    content = client.request(
+        "POST",
+        prefix + "_dash-update-component",
+        {
+            "output": callback["output"],
+            "outputs": outputs,
+            "inputs": with_values(callback["inputs"]),
+            "state": with_values(callback["state"]),
+            "changedPropIds": changed,
+        },
+    )
+    # No content when the callback didn't update anything.
+    return json.loads(content)["response"] if content else {}
+
+
+def drag(rng, layout_dct):
+    """Returns the relayout event of a point dragged by a few percent of the axes."""
+
+    index = rng.randrange(len(layout_dct["shapes"]))
+    shape = layout_dct["shapes"][index]
+    shift = {}
+    for axis in ("x", "y"):
+        low, high = layout_dct[f"{axis}axis"]["range"]
+        shift[axis] = rng.uniform(-0.05, 0.05) * (high - low)
+    return {
+        f"shapes[{index}].{coordinate}": shape[coordinate] + shift[coordinate[0]]
+        for coordinate in ("x0", "x1", "y0", "y1")
+    }
+
+
+def zoom(rng, layout_dct):
+    """Returns the relayout event of a box zoom within the current ranges, or of a
+    reset of the ranges."""
+
+    if rng.random() < AUTORANGE_RATIO:
+        return {"xaxis.autorange": True, "yaxis.autorange": True}
+    relayout = {}
+    for axis in ("xaxis", "yaxis"):
+        low, high = layout_dct[axis]["range"]
+        width = (high - low) * rng.uniform(0.3, 0.9)
+        start = low + rng.uniform(0, high - low - width)
+        relayout[f"{axis}.range[0]"] = start
+        relayout[f"{axis}.range[1]"] = start + width
+    return relayout
+
+
+def run_session(record, target, url, args, seed):
+    """Opens the url, then drags points and zooms, until done or a request fails."""
+
+    rng = random.Random(seed)
+    client = Client(target)
+    parts = urlsplit(url)
+    prefix = parts.path
+    try:
+        record("page", client.request, "GET", f"{prefix}?{parts.query}")
+        record("layout", client.request, "GET", prefix + "_dash-layout")
+        dependencies = json.loads(
+            record("dependencies", client.request, "GET", prefix + "_dash-dependencies")
+        )
+        callback = update_image_callback(dependencies)
+        response = record(
+            "load", post_callback, client, prefix, callback, {"url.href": url}, []
+        )
+        layout_dct = response["figure-layout"]["data"]
+
+        for _ in range(args.actions):
+            if args.think > 0:
+                time.sleep(rng.expovariate(1 / args.think))
+            if rng.random() < args.zoom_ratio or not layout_dct["shapes"]:
+                name, relayout = "zoom", zoom(rng, layout_dct)
+            else:
+                name, relayout = "drag", drag(rng, layout_dct)
+            response = record(
+                name,
+                post_callback,
+                client,
+                prefix,
+                callback,
+                {
+                    "url.href": url,
+                    "relayout.data": relayout,
+                    "figure-layout.data": layout_dct,
+                },
+                ["relayout.data"],
+            )
+            if "figure-layout" in response:
+                layout_dct = response["figure-layout"]["data"]
+    except Exception:
+        traceback.print_exc(limit=1, file=sys.stderr)
+    finally:
+        client.close()
+
+
+def summary(latencies, errors, duration):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / duration,
+        "mean": float(np.mean(latencies)) if latencies else None,
+        **{
+            f"p{q}": float(np.percentile(latencies, q)) if latencies else None
+            for q in PERCENTILES
+        },
+        "max": max(latencies, default=None),
+    }
+
+
+def server_phases(target):
+    """Returns the timings of the phases of `update_image` measured by the app, since
+    it started. Behind several workers, those of the one serving the request."""
+
+    metrics = json.loads(Client(target).request("GET", "/metrics"))
+    return {
+        name: {key: histogram[key] for key in ("count", "mean", "p50", "p95", "p99")}
+        for name, histogram in metrics.items()
+        if name.startswith("update_image.")
+    }
+
+
+def main():
+    args = parse_args()
+
+    assets = [f"A{i + 1:02d}" for i in range(args.assets)]
+    stages = [f"stage_{i}" for i in range(args.stages)]
+    redis_cl = redis_connection(args.redis)
+    delete_keys(redis_cl, f"{UUID}-*:*")
+
+    server = None
+    target = args.target
+    if target is None:
+        server, target = serve(redis_cl)
+    target = target.rstrip("/")
+    urls = [
+        farm_url(args, redis_cl, f"{UUID}-{i}", assets, stages, target)
+        for i in range(args.uuids)
+    ]
+
+    record = Recorder()
+    sessions = [
+        threading.Thread(
+            target=run_session,
+            args=(record, target, urls[i % len(urls)], args, args.seed + i),
+        )
+        for i in range(args.sessions)
+    ]
+    start = time.perf_counter()
+    for session in sessions:
+        session.start()
+        time.sleep(args.ramp_up / args.sessions)
+    for session in sessions:
+        session.join()
+    duration = time.perf_counter() - start
+
+    phases = {
+        name: summary(record.latencies[name], record.errors[name], duration)
+        for name in sorted(set(record.latencies) | set(record.errors))
+    }
+    phases["update_image"] = summary(
+        [t for name in CALLBACK_PHASES for t in record.latencies[name]],
+        sum(record.errors[name] for name in CALLBACK_PHASES),
+        duration,
+    )
+    results = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            **{k: v for k, v in vars(args).items() if k != "output"},
+            "urls": urls,
+        },
+        "duration": duration,
+        "phases": phases,
+        "server_phases": server_phases(target),
+    }
+    if server is not None:
+        server.should_exit = True
+
+    dumped = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(dumped + "\n")
+    else:
+        print(dumped)
+
+    print(
+        f"{'phase':<14} {'requests':>8} {'errors':>6} {'req/s':>8} "
+        + " ".join(f"{f'p{q} ms':>9}" for q in PERCENTILES),
+        file=sys.stderr,
+    )
+    for name, phase in phases.items():
+        if not phase["requests"]:
+            continue
+        print(
+            f"{name:<14} {phase['requests']:>8} {phase['errors']:>6} "
+            f"{phase['throughput']:>8.2f} "
+            + " ".join(f"{1000 * phase[f'p{q}']:>9.1f}" for q in PERCENTILES),
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
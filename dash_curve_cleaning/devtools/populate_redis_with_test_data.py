@@ -1,44 +1,96 @@
 """
 This script populates the Redis server with test data, useful to debug
-the Dash app.
+the Dash app. It writes through the producer API of the app (see app/ingest.py),
+and prints the url displaying the data.
 """
 
-import random
+import sys
+from pathlib import Path
 
+import numpy as np
 import redis
 
+# Reuse the writers of the app, so the stored layout always matches the reader.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
 
-def generate_data(n_points, x_min, x_max, y_deviation, n_copies=10):
-    x_original = [random.randint(x_min, x_max) for _ in range(n_points)]
-    y_original = [x_ + random.randint(-y_deviation, y_deviation) for x_ in x_original]
+from ingest import ingest  # noqa: E402
+from series import BINARY  # noqa: E402
 
-    x = []
-    y = []
-    for _ in range(n_copies):
-        x.extend(x_original)
-        y.extend(y_original)
 
-    return x, y
+def generate_data(n_points, x_min, x_max, y_deviation, n_copies=10, seed=None):
+    rng = np.random.default_rng(seed)
+    x_original = rng.integers(x_min, x_max, size=n_points, endpoint=True)
+    y_original = x_original + rng.integers(-y_deviation, y_deviation, size=n_points, endpoint=True)
 
+    x = np.tile(x_original, n_copies).astype(np.float64)
+    y = np.tile(y_original, n_copies).astype(np.float64)
 
-def generate_url(host, port, uuid, x_name, y_name, assets, point_groups, stages):
-    point_groups_str = '&'.join([f"points_{i}={','.join(group)}" for i, group in enumerate(point_groups)])
-    point_group_names = ','.join(f"points_{i}" for i, group in enumerate(point_groups))
-    return f"http://{host}:{port}/dash?uuid={uuid}&assets={','.join(assets)}&x_name={x_name}&y_name={y_name}&{point_groups_str}&stages={','.join(stages)}&point_group_names={point_group_names}"
+    return x, y
 
 
-redis_cl = redis.Redis(
-    # host=os.getenv('REDIS_HOST'),
-    # port=int(os.getenv('REDIS_PORT')),
-    # password=os.getenv('REDIS_PASSWORD'),
-)
+def populate(
+    redis_cl,
+    uuid,
+    plot,
+    x_name,
+    y_name,
+    assets,
+    stages,
+    point_groups,
+    point_parameters,
+    n_points,
+    x_min,
+    x_max,
+    y_deviation,
+    n_copies=10,
+    layout=BINARY,
+    dtype='<f8',
+    pyramid=True,
+    seed=None,
+    codec=None,
+    base_url='http://0.0.0.0:8050/dash',
+):
+    """Writes the series of every asset and stage, and the point parameters, returning
+    the url displaying them."""
+
+    rng = np.random.default_rng(seed)
+    data = {}
+    for asset in assets:
+        for stage in stages:
+            x, y = generate_data(n_points, x_min, x_max, y_deviation, n_copies, rng)
+            data[(asset, stage)] = {x_name: x, y_name: y}
+
+    return ingest(
+        redis_cl,
+        uuid,
+        plot,
+        data,
+        x_name,
+        y_name,
+        {f"points_{i}": group for i, group in enumerate(point_groups)},
+        {name: (point['x'], point['y']) for name, point in point_parameters.items()},
+        layout=layout,
+        dtype=dtype,
+        codec=codec,
+        pyramid=pyramid,
+        base_url=base_url,
+    )
 
-redis_cl.flushall()
 
 ### EXPERIMENT PARAMETERS ###
 host = '0.0.0.0'
 port = 8050
 uuid = '12345'
+plot = 'power_curve'
+
+# Layout used to store the series, either 'binary' or 'list'.
+layout = BINARY
+# Dtype of the binary layout, either '<f4' or '<f8'.
+dtype = '<f8'
+# Whether to also write the level of detail pyramid of each series.
+pyramid = True
+# Codec of the binary layout, such as 'delta,zlib', see app/compression.py.
+codec = None
 
 n_points = 100
 x_min = 0
@@ -78,18 +130,33 @@ point_parameters = {
 
 }
 
-for asset in assets:
-    x, y = generate_data(n_points, x_min, x_max, y_deviation)
-    redis_cl.rpush(f"{uuid}:{asset}:{x_name}:original", *x)
-    redis_cl.rpush(f"{uuid}:{asset}:{y_name}:original", *y)
-
-for point_name, parameters in point_parameters.items():
-    redis_cl.mset(
-        {
-            f"{uuid}:{point_name}.x": parameters['x'],
-            f"{uuid}:{point_name}.y": parameters['y'],
-        }
+if __name__ == '__main__':
+    redis_cl = redis.Redis(
+        # host=os.getenv('REDIS_HOST'),
+        # port=int(os.getenv('REDIS_PORT')),
+        # password=os.getenv('REDIS_PASSWORD'),
     )
 
-url = generate_url(host, port, uuid, x_name, y_name, assets, point_groups, stages)
-print(url)
+    redis_cl.flushall()
+
+    url = populate(
+        redis_cl,
+        uuid,
+        plot,
+        x_name,
+        y_name,
+        assets,
+        stages,
+        point_groups,
+        point_parameters,
+        n_points,
+        x_min,
+        x_max,
+        y_deviation,
+        layout=layout,
+        dtype=dtype,
+        pyramid=pyramid,
+        codec=codec,
+        base_url=f'http://{host}:{port}/dash',
+    )
+    print(url)
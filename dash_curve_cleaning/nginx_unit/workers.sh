@@ -0,0 +1,17 @@
+#!/bin/sh
+# Sets the number of processes and threads serving the app from the environment, when
+# given, in place of those of config.json. Run by the nginx unit entrypoint, after
+# config.json has been applied.
+set -e
+
+if [ -n "${UNIT_PROCESSES}" ]; then
+    curl -fsS -X PUT --data-binary "${UNIT_PROCESSES}" \
+        --unix-socket /var/run/control.unit.sock \
+        http://localhost/config/applications/fastapi/processes
+fi
+
+if [ -n "${UNIT_THREADS}" ]; then
+    curl -fsS -X PUT --data-binary "${UNIT_THREADS}" \
+        --unix-socket /var/run/control.unit.sock \
+        http://localhost/config/applications/fastapi/threads
+fi
@@ -0,0 +1,21 @@
+"""Fixtures of the tests of the dash app, whose modules are imported from app/ like the
+app does."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "app"))
+
+
+@pytest.fixture
+def redis_server():
+    """An in-process fakeredis server of its own."""
+    return pytest.importorskip("fakeredis").FakeServer()
+
+
+@pytest.fixture
+def redis_cl(redis_server):
+    """Client of an in-process fakeredis server of its own."""
+    return pytest.importorskip("fakeredis").FakeRedis(server=redis_server)
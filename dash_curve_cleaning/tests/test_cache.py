@@ -0,0 +1,189 @@
+import errno
+import os
+from collections import namedtuple
+
+import numpy as np
+
+import cache
+from cache import NPY_HEADER, SeriesCache, SharedSeriesCache
+
+SERIES = np.arange(1000.0)
+# Room for two series.
+MAX_BYTES = 2 * (SERIES.nbytes + NPY_HEADER)
+
+
+def files(directory):
+    return sorted(path.name for path in directory.iterdir())
+
+
+def age(directory):
+    """Makes the cached files look as if they were last used a while ago, oldest
+    first."""
+    for i, path in enumerate(sorted(directory.iterdir(), key=os.path.getmtime)):
+        os.utime(path, (i, i))
+
+
+class TestSeriesCache:
+    def test_lru_eviction(self):
+        series_cache = SeriesCache(max_bytes=2 * SERIES.nbytes)
+        series_cache.put("a", "1", SERIES)
+        series_cache.put("b", "1", SERIES)
+        assert series_cache.get("a", "1") is SERIES
+
+        series_cache.put("c", "1", SERIES)
+
+        assert "a" in series_cache
+        assert "b" not in series_cache
+        assert "c" in series_cache
+
+    def test_signature(self):
+        series_cache = SeriesCache()
+        series_cache.put("a", "1", SERIES)
+
+        assert series_cache.get("a", "2") is None
+        assert series_cache.get("a", None) is None
+        assert series_cache.peek("a") == ("1", SERIES)
+
+
+class TestSharedSeriesCache:
+    def test_round_trip(self, tmp_path):
+        SharedSeriesCache(str(tmp_path)).put("a", "1", SERIES)
+
+        values = SharedSeriesCache(str(tmp_path)).get("a", "1")
+
+        np.testing.assert_array_equal(values, SERIES)
+        assert not values.flags.writeable
+        assert SharedSeriesCache(str(tmp_path)).get("a", "2") is None
+
+    def test_directory_is_created_on_first_write(self, tmp_path):
+        directory = tmp_path / "shared"
+        shared = SharedSeriesCache(str(directory))
+
+        assert not directory.exists()
+        assert "a" not in shared
+        assert shared.get("a", "1") is None
+
+        shared.put("a", "1", SERIES)
+        assert "a" in shared
+
+    def test_other_signatures_are_replaced(self, tmp_path):
+        shared = SharedSeriesCache(str(tmp_path))
+        shared.put("a", "1", SERIES)
+
+        shared.put("a", "2", SERIES + 1)
+
+        assert len(files(tmp_path)) == 1
+        assert shared.get("a", "1") is None
+        np.testing.assert_array_equal(shared.get("a", "2"), SERIES + 1)
+
+    def test_lru_eviction(self, tmp_path):
+        shared = SharedSeriesCache(str(tmp_path), MAX_BYTES)
+        shared.put("a", "1", SERIES)
+        shared.put("b", "1", SERIES)
+        age(tmp_path)
+        assert shared.get("a", "1") is not None
+
+        shared.put("c", "1", SERIES)
+
+        assert "a" in shared
+        assert "b" not in shared
+        assert "c" in shared
+
+    def test_room_is_made_before_writing(self, tmp_path, monkeypatch):
+        shared = SharedSeriesCache(str(tmp_path), MAX_BYTES)
+        shared.put("a", "1", SERIES)
+        shared.put("b", "1", SERIES)
+        age(tmp_path)
+        save = np.save
+
+        def checked_save(file, values):
+            # Only the files of the other series are there while writing.
+            assert sum(path.stat().st_size for path in tmp_path.glob("*.npy")) <= (
+                MAX_BYTES - SERIES.nbytes - NPY_HEADER
+            )
+            save(file, values)
+
+        monkeypatch.setattr(cache.np, "save", checked_save)
+        shared.put("c", "1", SERIES)
+
+        assert "a" not in shared
+        assert "c" in shared
+
+    def test_file_budget(self, tmp_path):
+        shared = SharedSeriesCache(str(tmp_path), MAX_BYTES)
+
+        # Series larger than the cache aren't cached.
+        shared.put("a", "1", np.arange(10000.0))
+        assert files(tmp_path) == []
+
+        for key in "abcde":
+            shared.put(key, "1", SERIES)
+        assert len(files(tmp_path)) == 2
+        assert sum(path.stat().st_size for path in tmp_path.iterdir()) <= MAX_BYTES
+
+    def test_budget_is_capped_at_the_device_size(self, tmp_path, monkeypatch):
+        usage = namedtuple("usage", "total used free")
+        monkeypatch.setattr(
+            cache.shutil, "disk_usage", lambda path: usage(MAX_BYTES, 0, MAX_BYTES)
+        )
+        shared = SharedSeriesCache(str(tmp_path), 100 * MAX_BYTES)
+
+        for key in "abc":
+            shared.put(key, "1", SERIES)
+
+        assert len(files(tmp_path)) == 2
+
+    def test_full_device(self, tmp_path, monkeypatch):
+        shared = SharedSeriesCache(str(tmp_path))
+        shared.put("a", "1", SERIES)
+        shared.put("b", "1", SERIES)
+        age(tmp_path)
+        save = np.save
+        calls = []
+
+        def full_once(file, values):
+            calls.append(file)
+            if len(calls) == 1:
+                raise OSError(errno.ENOSPC, "No space left on device")
+            save(file, values)
+
+        # The room left on the device is taken up by other files, but for a page.
+        usage = namedtuple("usage", "total used free")
+        monkeypatch.setattr(
+            cache.shutil,
+            "disk_usage",
+            lambda path: usage(2**40, 2**40 - NPY_HEADER, NPY_HEADER),
+        )
+        monkeypatch.setattr(cache.np, "save", full_once)
+        shared.put("c", "1", SERIES)
+
+        # The least recently used series made room, and the write was retried.
+        assert len(calls) == 2
+        assert "a" not in shared
+        assert "b" in shared
+        np.testing.assert_array_equal(shared.get("c", "1"), SERIES)
+        assert len(files(tmp_path)) == 2
+
+    def test_failed_write(self, tmp_path, monkeypatch):
+        shared = SharedSeriesCache(str(tmp_path))
+        shared.put("a", "1", SERIES)
+
+        def failed_save(file, values):
+            file.write(b"partial")
+            raise OSError(errno.EIO, "Input/output error")
+
+        monkeypatch.setattr(cache.np, "save", failed_save)
+        shared.put("b", "1", SERIES)
+
+        # Neither the partial file nor the series are left, the other series are kept.
+        assert "b" not in shared
+        assert shared.get("b", "1") is None
+        assert files(tmp_path) == [shared._path("a", "1").name]
+
+    def test_unwritable_directory(self, tmp_path):
+        (tmp_path / "file").write_text("")
+        shared = SharedSeriesCache(str(tmp_path / "file" / "shared"))
+
+        shared.put("a", "1", SERIES)
+
+        assert shared.get("a", "1") is None
@@ -0,0 +1,147 @@
+import sys
+
+import numpy as np
+import pytest
+
+import compression
+from series import decode_series, encode_series, read_series, write_series
+
+LOSSLESS_CODECS = ["zlib", "delta", "delta,zlib", "snappy", "delta,snappy"]
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(0)
+    values = np.concatenate(
+        [
+            rng.normal(0, 1e3, 1000),
+            1.6e9 + 600.0 * np.arange(1000),
+            [0.0, -0.0, np.nan, np.inf, -np.inf, 5e-324, np.finfo(np.float64).max],
+        ]
+    )
+    return values
+
+
+@pytest.fixture
+def without_snappy(monkeypatch):
+    # A module set to None in sys.modules fails to import.
+    monkeypatch.setitem(sys.modules, "snappy", None)
+
+
+class TestLossless:
+    @pytest.mark.parametrize("codec", LOSSLESS_CODECS)
+    @pytest.mark.parametrize("dtype", ["<f8", "<f4"])
+    def test_round_trip(self, values, codec, dtype):
+        if "snappy" in codec:
+            pytest.importorskip("snappy")
+        with np.errstate(over="ignore"):
+            values = values.astype(dtype)
+
+        blob = compression.encode(values, codec)
+
+        actual_result = compression.decode(blob, codec, dtype)
+        assert actual_result.dtype == np.dtype(dtype)
+        # Bit for bit, NaNs and signed zeros included.
+        assert actual_result.tobytes() == values.tobytes()
+
+    def test_delta_compresses_timestamps(self):
+        timestamps = 1.6e9 + 600.0 * np.arange(10_000)
+
+        with_delta = compression.encode(timestamps, "delta,zlib")
+        without_delta = compression.encode(timestamps, "zlib")
+
+        assert len(with_delta) < len(without_delta) / 10
+
+    def test_empty(self):
+        blob = compression.encode(np.empty(0), "delta,zlib")
+
+        assert len(compression.decode(blob, "delta,zlib", "<f8")) == 0
+
+
+class TestQuantize:
+    @pytest.mark.parametrize("step", [0.01, 0.5, 3.0])
+    @pytest.mark.parametrize("codec", ["quantize:{}", "quantize:{},delta,zlib"])
+    def test_error_bound(self, values, step, codec):
+        codec = codec.format(step)
+        values = values[~(np.abs(values) > 1e15)]
+
+        actual_result = compression.decode(
+            compression.encode(values, codec), codec, "<f8"
+        )
+
+        finite = np.isfinite(values)
+        error = np.abs(actual_result[finite] - values[finite])
+        # Up to the rounding error of the decoded samples themselves.
+        bound = step / 2 + np.spacing(np.abs(values[finite]) + step)
+        assert np.all(error <= bound)
+
+    def test_not_finite(self):
+        values = np.array([1.0, np.nan, np.inf, -np.inf])
+
+        actual_result = compression.decode(
+            compression.encode(values, "quantize:0.1"), "quantize:0.1", "<f8"
+        )
+
+        assert actual_result[0] == 1.0
+        assert np.isnan(actual_result[1:]).all()
+
+    def test_float32(self, values):
+        values = values[:1000].astype("<f4")
+
+        actual_result = compression.decode(
+            compression.encode(values, "quantize:0.01"), "quantize:0.01", "<f4"
+        )
+
+        assert actual_result.dtype == np.float32
+        bound = 0.005 + np.spacing(np.abs(values))
+        assert np.all(np.abs(actual_result - values) <= bound)
+
+    def test_too_large(self):
+        with pytest.raises(ValueError):
+            compression.encode(np.array([1.0, 1e300]), "quantize:0.01")
+
+
+class TestParseCodec:
+    def test_steps(self):
+        assert compression.parse_codec("quantize:0.01, delta,zlib") == [
+            ("quantize", 0.01),
+            ("delta", None),
+            ("zlib", None),
+        ]
+
+    @pytest.mark.parametrize(
+        "codec",
+        ["lz4", "quantize", "quantize:0", "zlib,delta", "delta,delta", "zlib,snappy"],
+    )
+    def test_invalid(self, codec):
+        with pytest.raises(ValueError):
+            compression.parse_codec(codec)
+
+
+class TestSnappyFallback:
+    def test_available(self, without_snappy):
+        assert compression.available("quantize:0.01,delta,snappy") == (
+            "quantize:0.01,delta,zlib"
+        )
+        assert compression.available("delta,zlib") == "delta,zlib"
+
+    def test_available_with_snappy(self):
+        pytest.importorskip("snappy")
+
+        assert compression.available("delta,snappy") == "delta,snappy"
+
+    def test_encode_series(self, values, without_snappy):
+        blob, meta = encode_series(values, codec="delta,snappy")
+
+        assert meta["codec"] == "delta,zlib"
+        assert decode_series(blob, meta).tobytes() == values.tobytes()
+
+    def test_write_series(self, redis_cl, values, without_snappy):
+        write_series(redis_cl, "key", values, codec="snappy")
+
+        assert redis_cl.hget("key:meta", "codec") == b"zlib"
+        assert read_series(redis_cl, "key").tobytes() == values.tobytes()
+
+    def test_snappy_series_cant_be_decoded(self, without_snappy):
+        with pytest.raises(ValueError):
+            compression.decode(b"", "snappy", "<f8")
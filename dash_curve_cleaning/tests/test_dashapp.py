@@ -0,0 +1,319 @@
+import copy
+import json
+from typing import Dict, Tuple
+
+import numpy as np
+import pytest
+from plotly.utils import PlotlyJSONEncoder
+
+from cache import SeriesCache
+from datastore import RedisStore
+from downsampling import Downsampler
+from series import (
+    append_series,
+    read_series,
+    series_key,
+    write_pyramid,
+    write_series,
+)
+from sync import PointBoard
+from writer import PointWriter
+
+dashapp = pytest.importorskip("dashapp")
+
+FigureModel = dashapp.FigureModel
+
+
+class TestData:
+    def test_samples_are_not_shared(self):
+        first, second = FigureModel.Data(), FigureModel.Data()
+
+        assert first.x is not second.x
+        assert first.y is not second.y
+
+    def test_samples_are_kept_as_is(self):
+        x = np.arange(3.0)
+
+        trace = FigureModel.Data(x=x, y=x)
+
+        assert trace.dict()["x"] is x
+
+
+UUID = "12345"
+PLOT = "power_curve"
+URL = (
+    f"http://localhost/dash/?uuid={UUID}&plot={PLOT}&assets=A01,A02"
+    "&x_name=active_power&y_name=wind_speed&stages=original,clean"
+    "&point_group_names=points_0&points_0=p1,p2,p3"
+)
+POINTS = {"p1.x": 1, "p1.y": 1, "p2.x": 5, "p2.y": 6, "p3.x": 10}
+ZOOM = {
+    "xaxis.range[0]": 2,
+    "xaxis.range[1]": 6,
+    "yaxis.range[0]": 1,
+    "yaxis.range[1]": 7,
+}
+AUTORANGE = {"xaxis.autorange": True, "yaxis.autorange": True}
+
+
+def plain(obj):
+    """Returns an object as the browser gets it."""
+    return json.loads(json.dumps(obj, cls=PlotlyJSONEncoder))
+
+
+def apply_patch(figure_dct: Dict, patch) -> Dict:
+    """Applies a partial update of a figure to its dictionary, as the browser does."""
+
+    for operation in patch.to_plotly_json()["operations"]:
+        *location, name = operation["location"]
+        parent = figure_dct
+        for key in location:
+            parent = parent[key]
+        value = plain(operation["params"].get("value"))
+        if operation["operation"] == "Assign":
+            parent[name] = value
+        elif operation["operation"] == "Extend":
+            parent[name].extend(value)
+        else:
+            raise ValueError(f"Unexpected operation {operation['operation']}.")
+    return figure_dct
+
+
+@pytest.fixture
+def redis_data(redis_cl, monkeypatch):
+    monkeypatch.setattr(dashapp, "redis_cl", redis_cl)
+    monkeypatch.setattr(dashapp, "SERIES_CACHE", SeriesCache())
+    monkeypatch.setattr(dashapp, "POINT_WRITER", PointWriter(redis_cl))
+    # The samples are compared as lists.
+    monkeypatch.setattr(dashapp, "TYPED_ARRAYS", False)
+
+    rng = np.random.default_rng(0)
+    for asset in ("A01", "A02"):
+        for stage in ("original", "clean"):
+            x = rng.uniform(0, 20, 5000)
+            y = x + rng.normal(0, 1, 5000)
+            write_series(
+                redis_cl, series_key(UUID, PLOT, asset, "active_power", stage), x
+            )
+            write_series(
+                redis_cl, series_key(UUID, PLOT, asset, "wind_speed", stage), y
+            )
+    redis_cl.mset({f"{UUID}:{name}": value for name, value in POINTS.items()})
+    return redis_cl
+
+
+def load(redis_cl, url: str, downsampler=None) -> Tuple[Dict, Dict]:
+    """Loads a url, returning the figure as sent to the browser, and its layout."""
+
+    figure_dct, figure = dashapp.load_figure(
+        dashapp.Url(url),
+        downsampler,
+        RedisStore(redis_cl, dashapp.SERIES_CACHE, validate=True),
+    )
+    return plain(figure_dct), figure.layout.dict()
+
+
+def relayout(
+    redis_cl, url: str, layout_dct: Dict, relayout_data: Dict, downsampler=None
+):
+    """Handles a relayout event of a figure, returning the partial update of the figure
+    and its new layout."""
+
+    patch, figure = dashapp.patch_figure(
+        dashapp.Url(url),
+        downsampler,
+        RedisStore(redis_cl, dashapp.SERIES_CACHE),
+        copy.deepcopy(layout_dct),
+        relayout_data,
+    )
+    return patch, figure.layout.dict()
+
+
+def without_meta(figure_dct: Dict) -> Dict:
+    # The meta of the layout holds the session of the figure, and is only read from
+    # the layout kept by the browser.
+    figure_dct["layout"].pop("meta")
+    return figure_dct
+
+
+class TestPatchFigure:
+    @pytest.mark.parametrize("downsample", [False, True])
+    def test_drag_matches_a_reload(self, redis_data, downsample):
+        url = URL + ("&downsample=lttb&max_points=500" if downsample else "")
+        downsampler = Downsampler("lttb", 500) if downsample else None
+        figure_dct, layout_dct = load(redis_data, url, downsampler)
+
+        drag = {"shapes[1].x0": 7, "shapes[1].x1": 7.2, "shapes[1].y0": 8}
+        patch, _ = relayout(redis_data, url, layout_dct, drag, downsampler)
+        dashapp.POINT_WRITER.flush(UUID)
+
+        # Only the point and the line connecting the points were sent.
+        locations = [op["location"] for op in patch.to_plotly_json()["operations"]]
+        assert locations == [
+            ["layout", "shapes", 1],
+            ["data", 4, "x"],
+            ["data", 4, "y"],
+        ]
+        reloaded_dct, _ = load(redis_data, url, downsampler)
+        assert without_meta(apply_patch(figure_dct, patch)) == without_meta(
+            reloaded_dct
+        )
+
+    def test_nothing_changed(self, redis_data):
+        _, layout_dct = load(redis_data, URL)
+
+        patch, _ = relayout(redis_data, URL, layout_dct, {"dragmode": "pan"})
+
+        assert patch is None
+
+    def test_zoom_resamples_the_viewport(self, redis_data):
+        url = URL + "&downsample=lttb&max_points=500"
+        downsampler = Downsampler("lttb", 500)
+        figure_dct, layout_dct = load(redis_data, url, downsampler)
+
+        patch, layout_dct = relayout(redis_data, url, layout_dct, ZOOM, downsampler)
+        zoomed_dct = apply_patch(copy.deepcopy(figure_dct), patch)
+
+        traces = [
+            (stage, asset)
+            for stage in ("original", "clean")
+            for asset in ("A01", "A02")
+        ]
+        for trace, (stage, asset) in zip(zoomed_dct["data"], traces):
+            x, y = downsampler(
+                read_series(
+                    redis_data, series_key(UUID, PLOT, asset, "active_power", stage)
+                ),
+                read_series(
+                    redis_data, series_key(UUID, PLOT, asset, "wind_speed", stage)
+                ),
+                (2, 6),
+                (1, 7),
+            )
+            assert trace["x"] == x.tolist()
+            assert trace["y"] == y.tolist()
+
+        # Back to the full extent, the figure is the loaded one.
+        patch, _ = relayout(redis_data, url, layout_dct, AUTORANGE, downsampler)
+        assert apply_patch(zoomed_dct, patch) == figure_dct
+
+    def test_zoom_rebins_densities(self, redis_data):
+        url = URL + "&render=density"
+        figure_dct, layout_dct = load(redis_data, url)
+
+        patch, zoomed_layout_dct = relayout(redis_data, url, layout_dct, ZOOM)
+        zoomed_dct = apply_patch(copy.deepcopy(figure_dct), patch)
+        assert zoomed_dct["data"][0] != figure_dct["data"][0]
+
+        patch, _ = relayout(redis_data, url, zoomed_layout_dct, AUTORANGE)
+        assert apply_patch(zoomed_dct, patch) == figure_dct
+
+
+class TestSyncFigure:
+    def test_moves_match_a_reload(self, redis_data, monkeypatch):
+        board = PointBoard()
+        monkeypatch.setattr(dashapp, "POINT_BOARD", board)
+        figure_dct, layout_dct = load(redis_data, URL)
+
+        # Another session moves a point.
+        moved = {f"{UUID}:p2.x": 8.0, f"{UUID}:p2.y": 9.0}
+        redis_data.mset(moved)
+        board.update(UUID, moved)
+        store = RedisStore(redis_data)
+        patch, _ = dashapp.sync_figure(
+            dashapp.Url(URL), store, copy.deepcopy(layout_dct)
+        )
+
+        reloaded_dct, _ = load(redis_data, URL)
+        assert without_meta(apply_patch(figure_dct, patch)) == without_meta(
+            reloaded_dct
+        )
+
+    def test_nothing_moved(self, redis_data, monkeypatch):
+        board = PointBoard()
+        monkeypatch.setattr(dashapp, "POINT_BOARD", board)
+        _, layout_dct = load(redis_data, URL)
+
+        board.update(UUID, {f"{UUID}:p2.x": 5.0, f"{UUID}:p2.y": 6.0})
+        store = RedisStore(redis_data)
+        patch, _ = dashapp.sync_figure(dashapp.Url(URL), store, layout_dct)
+
+        assert patch is None
+        assert store.round_trips == 0
+
+
+class TestMergedTraces:
+    def test_merged_assets(self, redis_data):
+        figure_dct, _ = load(redis_data, URL + "&traces=asset")
+        merged_dct, _ = load(redis_data, URL + "&traces=stage")
+
+        # A trace per stage, drawn with WebGL, holding the samples of its assets one
+        # after the other.
+        for i in range(2):
+            trace = merged_dct["data"][i]
+            assets = figure_dct["data"][2 * i : 2 * i + 2]
+            assert trace["type"] == "scattergl"
+            assert trace["x"] == assets[0]["x"] + assets[1]["x"]
+            assert trace["y"] == assets[0]["y"] + assets[1]["y"]
+            assert trace["customdata"] == [0] * 5000 + [1] * 5000
+        # The lines connecting the points follow.
+        assert merged_dct["data"][2:] == figure_dct["data"][4:]
+
+
+class TestTailFigure:
+    def append(self, redis_cl, n: int = 10):
+        rng = np.random.default_rng(1)
+        for asset in ("A01", "A02"):
+            for stage in ("original", "clean"):
+                x = rng.uniform(5, 10, n)
+                append_series(
+                    redis_cl, series_key(UUID, PLOT, asset, "active_power", stage), x
+                )
+                append_series(
+                    redis_cl, series_key(UUID, PLOT, asset, "wind_speed", stage), x
+                )
+
+    def tail(self, redis_cl, url: str, layout_dct: Dict, downsampler=None):
+        patch, figure = dashapp.tail_figure(
+            dashapp.Url(url),
+            downsampler,
+            RedisStore(redis_cl, dashapp.SERIES_CACHE),
+            copy.deepcopy(layout_dct),
+        )
+        return patch, figure.layout.dict()
+
+    def test_appended_samples(self, redis_data, monkeypatch):
+        # The samples of the traces are extended, and sent as lists.
+        monkeypatch.setattr(dashapp, "REFRESH_INTERVAL", 1)
+        figure_dct, layout_dct = load(redis_data, URL)
+        self.append(redis_data)
+
+        patch, layout_dct = self.tail(redis_data, URL, layout_dct)
+
+        reloaded_dct, _ = load(redis_data, URL)
+        assert without_meta(apply_patch(figure_dct, patch)) == without_meta(
+            reloaded_dct
+        )
+        # Nothing was appended since.
+        assert self.tail(redis_data, URL, layout_dct)[0] is None
+
+    def test_appended_samples_of_a_pyramid(self, redis_data):
+        url = URL + "&downsample=lttb&max_points=100000"
+        downsampler = Downsampler("lttb", 100_000)
+        for key in redis_data.keys(f"{UUID}:{PLOT}:*"):
+            key = key.decode()
+            if key.count(":") == 4:
+                write_pyramid(redis_data, key, read_series(redis_data, key))
+        figure_dct, layout_dct = load(redis_data, url, downsampler)
+        assert redis_data.exists(
+            f"{series_key(UUID, PLOT, 'A01', 'active_power', 'original')}:lod"
+        )
+
+        self.append(redis_data)
+        patch, layout_dct = self.tail(redis_data, url, layout_dct, downsampler)
+
+        patched_dct = apply_patch(figure_dct, patch)
+        assert [len(trace["x"]) for trace in patched_dct["data"][:4]] == [5010] * 4
+        reloaded_dct, _ = load(redis_data, url, downsampler)
+        assert without_meta(patched_dct) == without_meta(reloaded_dct)
+        assert self.tail(redis_data, url, layout_dct, downsampler)[0] is None
@@ -0,0 +1,127 @@
+import numpy as np
+
+from cache import SeriesCache, SharedSeriesCache
+from datastore import RedisStore
+from series import BINARY, LIST, append_series, meta_key, write_series
+
+KEY = "12345:power_curve:A01:active_power:original"
+POINT_KEY = "12345:point_1.x"
+
+
+class TestPrefetchCached:
+    def load(self, redis_cl, cache, validate=True):
+        store = RedisStore(redis_cl, cache, validate=validate)
+        store.prefetch(series_keys=[KEY], point_keys=[POINT_KEY])
+        return store
+
+    def test_unchanged_series_isnt_read_again(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        redis_cl.set(POINT_KEY, 3.5)
+        cache = SeriesCache()
+        first = self.load(redis_cl, cache).series(KEY)
+
+        store = self.load(redis_cl, cache)
+
+        # Only the signature is read, along with the points.
+        assert store.round_trips == 1
+        assert store.series(KEY) is first
+        assert store.point(POINT_KEY) == 3.5
+        assert store.round_trips == 1
+
+    def test_rewritten_series_is_read_again(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        cache = SeriesCache()
+        self.load(redis_cl, cache)
+        write_series(redis_cl, KEY, np.arange(10.0, 20.0))
+
+        store = self.load(redis_cl, cache)
+
+        assert store.round_trips == 2
+        np.testing.assert_array_equal(store.series(KEY), np.arange(10.0, 20.0))
+
+    def test_appended_series_is_read_again(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        cache = SeriesCache()
+        self.load(redis_cl, cache)
+        append_series(redis_cl, KEY, [10.0])
+
+        store = self.load(redis_cl, cache)
+
+        assert store.round_trips == 2
+        np.testing.assert_array_equal(store.series(KEY), np.arange(11.0))
+
+    def test_list_series_is_always_read(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0), LIST)
+        cache = SeriesCache()
+        self.load(redis_cl, cache)
+        write_series(redis_cl, KEY, np.arange(10.0, 20.0), LIST)
+
+        store = self.load(redis_cl, cache)
+
+        assert store.round_trips == 2
+        np.testing.assert_array_equal(store.series(KEY), np.arange(10.0, 20.0))
+
+    def test_cached_series_isnt_validated_unless_asked(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0), LIST)
+        redis_cl.set(POINT_KEY, 3.5)
+        cache = SeriesCache()
+        first = self.load(redis_cl, cache).series(KEY)
+        write_series(redis_cl, KEY, np.arange(10.0, 20.0), LIST)
+
+        store = RedisStore(redis_cl, cache)
+        store.prefetch(series_keys=[KEY])
+
+        assert store.round_trips == 0
+        assert store.series(KEY) is first
+
+    def test_shared_cache(self, redis_cl, tmp_path):
+        write_series(redis_cl, KEY, np.arange(10.0), BINARY)
+        self.load(redis_cl, SeriesCache(shared=SharedSeriesCache(str(tmp_path))))
+
+        # Another process, sharing the cache directory.
+        store = self.load(
+            redis_cl, SeriesCache(shared=SharedSeriesCache(str(tmp_path)))
+        )
+
+        assert store.round_trips == 1
+        np.testing.assert_array_equal(store.series(KEY), np.arange(10.0))
+
+    def test_rewritten_series_is_read_again_from_the_shared_cache(
+        self, redis_cl, tmp_path
+    ):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        self.load(redis_cl, SeriesCache(shared=SharedSeriesCache(str(tmp_path))))
+        write_series(redis_cl, KEY, np.arange(10.0, 20.0))
+
+        # Another process, sharing the cache directory.
+        store = self.load(
+            redis_cl, SeriesCache(shared=SharedSeriesCache(str(tmp_path)))
+        )
+
+        assert store.round_trips == 2
+        np.testing.assert_array_equal(store.series(KEY), np.arange(10.0, 20.0))
+
+    def test_series_without_version_is_always_read(self, redis_cl, tmp_path):
+        # As written by another tool, rewritten with as many samples.
+        cache = SeriesCache(shared=SharedSeriesCache(str(tmp_path)))
+        write_series(redis_cl, KEY, np.arange(10.0))
+        redis_cl.hdel(meta_key(KEY), "version")
+        self.load(redis_cl, cache)
+        write_series(redis_cl, KEY, np.arange(10.0, 20.0))
+        redis_cl.hdel(meta_key(KEY), "version")
+
+        store = self.load(redis_cl, cache)
+
+        assert store.round_trips == 2
+        np.testing.assert_array_equal(store.series(KEY), np.arange(10.0, 20.0))
+        assert list(tmp_path.iterdir()) == []
+
+    def test_uncached_series_is_read_with_the_points(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        redis_cl.set(POINT_KEY, 3.5)
+
+        store = self.load(redis_cl, SeriesCache())
+
+        assert store.round_trips == 1
+        np.testing.assert_array_equal(store.series(KEY), np.arange(10.0))
+        assert store.point(POINT_KEY) == 3.5
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from density import (
+    AUTO,
+    DENSITY,
+    SCATTER,
+    bin_centers,
+    bin_counts,
+    colorscale,
+    log_density,
+    use_density,
+)
+
+
+class TestUseDensity:
+    def test_auto(self):
+        assert use_density(AUTO, [10, 200], 100)
+        assert not use_density(AUTO, [10, 100], 100)
+        assert not use_density(AUTO, [], 100)
+
+    def test_downsampled(self):
+        assert not use_density(AUTO, [10, 200], 100, downsampled=True)
+        assert use_density(DENSITY, [10], 100, downsampled=True)
+
+    def test_explicit_mode(self):
+        assert use_density(DENSITY, [10], 100)
+        assert not use_density(SCATTER, [200], 100)
+
+    def test_invalid_mode(self):
+        with pytest.raises(Exception):
+            use_density("heatmap", [10], 100)
+
+
+class TestBinCounts:
+    def test_against_brute_force(self):
+        rng = np.random.default_rng(0)
+        series = [
+            (rng.uniform(-1, 11, 5000), rng.uniform(-1, 6, 5000)) for _ in range(3)
+        ]
+        x_range, y_range = (0.0, 10.0), (0.0, 5.0)
+
+        counts = bin_counts(series, x_range, y_range, 20, 10)
+
+        expected_result = np.zeros((10, 20), dtype=np.int64)
+        for x, y in series:
+            for xi, yi in zip(x, y):
+                if 0 <= xi < 10 and 0 <= yi < 5:
+                    expected_result[int(yi // 0.5), int(xi // 0.5)] += 1
+        np.testing.assert_array_equal(counts, expected_result)
+
+    def test_total(self):
+        x = np.array([0.0, 0.5, 0.99, 1.0, -0.1, np.nan, 0.5])
+        y = np.array([0.0, 0.5, 0.99, 0.5, 0.5, 0.5, np.inf])
+
+        counts = bin_counts([(x, y)], (0.0, 1.0), (0.0, 1.0), 4, 4)
+
+        # The samples on or past the upper bounds of the ranges, and those that
+        # aren't finite, are left out.
+        assert counts.shape == (4, 4)
+        assert counts.sum() == 3
+        assert counts[0, 0] == counts[2, 2] == counts[3, 3] == 1
+
+
+def test_bin_centers():
+    np.testing.assert_allclose(bin_centers((0.0, 2.0), 4), [0.25, 0.75, 1.25, 1.75])
+
+
+def test_log_density():
+    z = log_density(np.array([[0, 1], [10, 100]]))
+
+    assert np.isnan(z[0, 0])
+    np.testing.assert_allclose(z[0, 1:], [0.0])
+    np.testing.assert_allclose(z[1], [1.0, 2.0])
+
+
+def test_colorscale():
+    assert colorscale("#1f77b4") == [
+        [0, "rgba(31,119,180,0.2)"],
+        [1, "rgba(31,119,180,1)"],
+    ]
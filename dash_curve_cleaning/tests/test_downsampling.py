@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from downsampling import AGGREGATORS, Downsampler
+
+N_OUT = 500
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 20, 10_000)
+    y = x + rng.normal(0, 1, 10_000)
+    return x, y
+
+
+def pairs(x, y):
+    return set(zip(x.tolist(), y.tolist()))
+
+
+class TestDownsampler:
+    @pytest.mark.parametrize("method", list(AGGREGATORS))
+    def test_output_length(self, samples, method):
+        x, y = Downsampler(method, N_OUT)(*samples)
+
+        assert len(x) == len(y) == N_OUT
+        assert pairs(x, y) <= pairs(*samples)
+        # The samples are drawn in the order of x.
+        assert np.all(np.diff(x) >= 0)
+
+    @pytest.mark.parametrize("method", ["lttb", "minmaxlttb"])
+    def test_endpoints(self, samples, method):
+        x, y = Downsampler(method, N_OUT)(*samples)
+
+        assert x[0] == samples[0].min()
+        assert x[-1] == samples[0].max()
+
+    def test_minmax_keeps_the_outliers(self, samples):
+        x, y = Downsampler("minmax", N_OUT)(*samples)
+
+        assert y.min() == samples[1].min()
+        assert y.max() == samples[1].max()
+
+    @pytest.mark.parametrize("method", list(AGGREGATORS))
+    def test_viewport(self, samples, method):
+        x, y = Downsampler(method, N_OUT)(*samples, (2.0, 6.0), (1.0, 7.0))
+
+        inside = (
+            (samples[0] >= 2)
+            & (samples[0] <= 6)
+            & (samples[1] >= 1)
+            & (samples[1] <= 7)
+        )
+        assert len(x) == N_OUT
+        assert pairs(x, y) <= pairs(samples[0][inside], samples[1][inside])
+
+    def test_few_samples_are_kept(self, samples):
+        x, y = Downsampler(n_out=N_OUT)(*samples, (2.0, 2.5))
+
+        inside = (samples[0] >= 2) & (samples[0] <= 2.5)
+        assert inside.sum() <= N_OUT
+        np.testing.assert_array_equal(x, samples[0][inside])
+        np.testing.assert_array_equal(y, samples[1][inside])
+
+    def test_invalid_method(self):
+        with pytest.raises(Exception):
+            Downsampler("mean")
@@ -0,0 +1,179 @@
+import numpy as np
+import pytest
+
+from envelope import (
+    ABOVE,
+    BELOW,
+    CORNER,
+    HORIZONTAL,
+    POLYLINE,
+    VERTICAL,
+    ClassificationCache,
+    boundary,
+    removed,
+)
+
+# A polyline from (0, 0) to (2, 2), then flat to (4, 2).
+POINTS = [(2.0, 2.0, False, False), (0.0, 0.0, False, False), (4.0, 2.0, False, False)]
+SAMPLES = {
+    # x, y: above, below
+    (1.0, 1.5): (True, False),
+    (1.0, 0.5): (False, True),
+    (3.0, 2.5): (True, False),
+    (3.0, 1.0): (False, True),
+    (1.0, 1.0): (False, False),
+    # Outside of the x extent of the polyline.
+    (-1.0, 5.0): (False, False),
+    (5.0, -5.0): (False, False),
+}
+
+
+def samples():
+    x, y = np.array(list(SAMPLES)).T
+    return x, y
+
+
+class TestBoundary:
+    def test_polyline_is_ordered_by_x(self):
+        assert boundary(POINTS, ABOVE) == (
+            POLYLINE,
+            ABOVE,
+            (0.0, 2.0, 4.0),
+            (0.0, 2.0, 2.0),
+        )
+
+    def test_single_point(self):
+        assert boundary([(1.0, 2.0, True, False)], ABOVE) == (HORIZONTAL, ABOVE, 2.0)
+        assert boundary([(1.0, 2.0, False, True)], BELOW) == (VERTICAL, BELOW, 1.0)
+        assert boundary([(1.0, 2.0, False, False)], ABOVE) == (CORNER, ABOVE, 1.0, 2.0)
+        assert boundary([(1.0, 2.0, True, True)], ABOVE) is None
+
+    def test_invalid_side(self):
+        with pytest.raises(Exception):
+            boundary(POINTS, "left")
+
+
+class TestRemoved:
+    @pytest.mark.parametrize("side", [ABOVE, BELOW])
+    def test_polyline(self, side):
+        expected_result = [removed_by[side == BELOW] for removed_by in SAMPLES.values()]
+
+        actual_result = removed(*samples(), [boundary(POINTS, side)])
+
+        assert actual_result.tolist() == expected_result
+
+    def test_horizontal(self):
+        x = np.array([0.0, 10.0, 0.0])
+        y = np.array([3.0, 3.0, 1.0])
+
+        assert removed(x, y, [(HORIZONTAL, ABOVE, 2.0)]).tolist() == [
+            True,
+            True,
+            False,
+        ]
+
+    def test_vertical(self):
+        x = np.array([3.0, 1.0])
+        y = np.array([0.0, 0.0])
+
+        assert removed(x, y, [(VERTICAL, ABOVE, 2.0)]).tolist() == [True, False]
+        assert removed(x, y, [(VERTICAL, BELOW, 2.0)]).tolist() == [False, True]
+
+    def test_corner(self):
+        x = np.array([3.0, 3.0, 1.0, 1.0])
+        y = np.array([3.0, 1.0, 3.0, 1.0])
+
+        assert removed(x, y, [(CORNER, ABOVE, 2.0, 2.0)]).tolist() == [
+            True,
+            False,
+            False,
+            False,
+        ]
+        assert removed(x, y, [(CORNER, BELOW, 2.0, 2.0)]).tolist() == [
+            False,
+            True,
+            True,
+            True,
+        ]
+
+    def test_any_boundary_removes(self):
+        boundaries = [boundary(POINTS, ABOVE), (VERTICAL, BELOW, 0.5)]
+
+        actual_result = removed(*samples(), boundaries)
+
+        expected_result = [above for above, _ in SAMPLES.values()]
+        expected_result[-2] = True
+        assert actual_result.tolist() == expected_result
+
+    def test_no_boundaries(self):
+        assert not removed(*samples(), []).any()
+
+
+class TestClassificationCache:
+    def test_cached(self):
+        cache = ClassificationCache()
+        x, y = samples()
+        boundaries = [boundary(POINTS, ABOVE)]
+        first = cache.removed("12345", "key", x, y, boundaries)
+
+        # Samples of the same key aren't classified again.
+        assert cache.removed("12345", "key", y, x, boundaries) is first
+        cache.drop("12345")
+        assert cache.removed("12345", "key", y, x, boundaries) is not first
+
+    def test_bounded(self):
+        cache = ClassificationCache(max_entries=2)
+        x, y = samples()
+        for side in (ABOVE, BELOW, ABOVE):
+            cache.removed("12345", side, x, y, [boundary(POINTS, side)])
+
+        assert len(cache._entries) == 2
+
+
+class TestFigureBoundaries:
+    @pytest.fixture
+    def figure(self, redis_cl):
+        dashapp = pytest.importorskip("dashapp")
+        from datastore import RedisStore
+
+        redis_cl.mset(
+            {
+                "12345:p1.x": 0.0,
+                "12345:p1.y": 0.0,
+                "12345:p2.x": 2.0,
+                "12345:p2.y": 2.0,
+                "12345:p3.x": 4.0,
+                "12345:p3.y": 2.0,
+                "12345:p4.y": 1.0,
+            }
+        )
+        figure = dashapp.FigureModel(
+            assets=["A01"],
+            x_name="active_power",
+            y_name="wind_speed",
+            point_names=["p1", "p2", "p3", "p4"],
+            point_groups={"points_0": ["p1", "p2", "p3"], "points_1": ["p4"]},
+            layout=dashapp.create_empty_plotly_figure().to_plotly_json()["layout"],
+        )
+        figure.set_ranges(0.0, 4.0, 0.0, 2.0)
+        figure.populate_points(RedisStore(redis_cl), "12345")
+        return figure
+
+    def test_boundaries_follow_the_lines(self, figure):
+        boundaries = figure.boundaries([ABOVE, ABOVE])
+
+        x, y, _ = figure._get_line_points(["p1", "p2", "p3"], 0)
+        assert boundaries[0] == (POLYLINE, ABOVE, tuple(x), tuple(y))
+        _, y, _ = figure._get_line_points(["p4"], 3)
+        assert boundaries[1] == (HORIZONTAL, ABOVE, y[0])
+
+    def test_samples_are_classified_against_the_lines(self, figure):
+        x, y, _ = figure._get_line_points(["p1", "p2", "p3"], 0)
+        # Just above and below the drawn line, between the last two points.
+        sample_x = np.array([3.0, 3.0])
+        line_y = np.interp(3.0, x, y)
+        sample_y = np.array([line_y + 1e-6, line_y - 1e-6])
+
+        actual_result = removed(sample_x, sample_y, figure.boundaries([ABOVE, BELOW]))
+
+        assert actual_result.tolist() == [True, False]
@@ -0,0 +1,204 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from ingest import drop_staging
+from selection import exclude, exclusions_key
+from series import LIST, meta_key, pyramid_key, read_series, series_key
+from sync import points_channel
+from writer import version_key, writers_key
+
+UUID = "12345"
+PLOT = "power_curve"
+X = series_key(UUID, PLOT, "A01", "active_power", "original")
+Y = series_key(UUID, PLOT, "A01", "wind_speed", "original")
+
+
+def data(offset: float = 0.0):
+    return {
+        ("A01", "original"): {
+            "active_power": np.arange(100.0) + offset,
+            "wind_speed": np.arange(100.0, 200.0) + offset,
+        }
+    }
+
+
+def write(redis_cl, data, **kwargs):
+    return ingest.ingest(
+        redis_cl,
+        uuid=UUID,
+        plot=PLOT,
+        data=data,
+        x_name="active_power",
+        y_name="wind_speed",
+        point_groups={"points_0": ["point_1"]},
+        **kwargs,
+    )
+
+
+def staging_keys(redis_cl):
+    return list(redis_cl.scan_iter("staging:*"))
+
+
+class TestIngest:
+    def test_write(self, redis_cl):
+        url = write(redis_cl, data(), points={"point_1": (1.0, None)})
+
+        np.testing.assert_array_equal(read_series(redis_cl, X), np.arange(100.0))
+        np.testing.assert_array_equal(read_series(redis_cl, Y), np.arange(100.0, 200.0))
+        assert redis_cl.exists(pyramid_key(X))
+        assert float(redis_cl.get(f"{UUID}:point_1.x")) == 1.0
+        assert redis_cl.get(f"{UUID}:point_1.y") is None
+        assert "assets=A01" in url and "stages=original" in url
+        assert staging_keys(redis_cl) == []
+
+    def test_non_numeric_columns_are_skipped(self, redis_cl, monkeypatch):
+        warnings = []
+        monkeypatch.setattr(ingest.wp, "warning", warnings.append)
+        frame = pd.DataFrame(
+            {
+                "active_power": np.arange(10.0),
+                "wind_speed": np.arange(10, 20),
+                "timestamp": pd.date_range("2024-01-01", periods=10, freq="min"),
+                "label": ["a"] * 10,
+            }
+        )
+
+        write(redis_cl, {("A01", "original"): frame})
+
+        np.testing.assert_array_equal(read_series(redis_cl, Y), np.arange(10, 20))
+        for name in ("timestamp", "label"):
+            assert not redis_cl.exists(series_key(UUID, PLOT, "A01", name, "original"))
+        assert len(warnings) == 2
+
+    def test_variables(self, redis_cl):
+        frame = {**data()[("A01", "original")], "pitch": np.zeros(100)}
+
+        write(redis_cl, {("A01", "original"): frame}, variables=["wind_speed"])
+
+        assert redis_cl.exists(X, Y) == 2
+        assert not redis_cl.exists(series_key(UUID, PLOT, "A01", "pitch", "original"))
+
+    @pytest.mark.parametrize(
+        "frame, variables",
+        [
+            ({"active_power": np.zeros(3)}, None),
+            ({"active_power": np.zeros(3), "wind_speed": ["a", "b", "c"]}, None),
+            ({"active_power": np.zeros(3), "wind_speed": np.zeros(3)}, ["pitch"]),
+            (
+                {
+                    "active_power": np.zeros(3),
+                    "wind_speed": np.zeros(3),
+                    "x": ["a"] * 3,
+                },
+                ["x"],
+            ),
+            ({"active_power": np.zeros(3), "wind_speed": np.zeros(4)}, None),
+        ],
+    )
+    def test_invalid_data(self, redis_cl, frame, variables):
+        with pytest.raises(ValueError):
+            write(redis_cl, {("A01", "original"): frame}, variables=variables)
+
+    def test_interrupted_ingest_keeps_the_previous_data(self, redis_cl, monkeypatch):
+        write(redis_cl, data())
+
+        def failed_swap(*args):
+            raise ConnectionError("Lost the connection.")
+
+        monkeypatch.setattr(ingest, "_swap", failed_swap)
+        with pytest.raises(ConnectionError):
+            write(redis_cl, data(1000.0))
+
+        np.testing.assert_array_equal(read_series(redis_cl, X), np.arange(100.0))
+        assert staging_keys(redis_cl) == []
+
+    def test_crashed_ingest_keeps_the_previous_data(self, redis_cl, monkeypatch):
+        write(redis_cl, data())
+
+        def crash(*args):
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr(ingest, "_swap", crash)
+        with pytest.raises(KeyboardInterrupt):
+            write(redis_cl, data(1000.0))
+
+        np.testing.assert_array_equal(read_series(redis_cl, X), np.arange(100.0))
+        n_staging = len(staging_keys(redis_cl))
+        assert n_staging > 0
+        assert drop_staging(redis_cl) == n_staging
+        assert staging_keys(redis_cl) == []
+        np.testing.assert_array_equal(read_series(redis_cl, X), np.arange(100.0))
+
+    def test_stale_keys_are_removed(self, redis_cl):
+        write(redis_cl, data())
+        exclude(
+            redis_cl, {exclusions_key(UUID, PLOT, "A01", "original"): np.array([1, 2])}
+        )
+
+        # Without pyramid, with the list layout, which has no header.
+        write(redis_cl, data(1000.0), layout=LIST, pyramid=False)
+
+        np.testing.assert_array_equal(read_series(redis_cl, X), np.arange(100.0) + 1000)
+        for key in (
+            meta_key(X),
+            pyramid_key(X),
+            meta_key(pyramid_key(X)),
+            exclusions_key(UUID, PLOT, "A01", "original"),
+        ):
+            assert not redis_cl.exists(key)
+
+
+class TestSwap:
+    def test_rename_and_publish(self, redis_cl):
+        redis_cl.set("staging:1:key", "new")
+        redis_cl.set("key", "old")
+        redis_cl.set("stale", "old")
+        redis_cl.set(version_key(UUID), 3)
+        redis_cl.hset(writers_key(UUID), 4, "a")
+        pubsub = redis_cl.pubsub()
+        pubsub.subscribe(points_channel(UUID))
+        assert pubsub.get_message(timeout=1)["type"] == "subscribe"
+
+        points = {f"{UUID}:point_1.x": 1.5}
+        ingest._swap(redis_cl, UUID, {"staging:1:key": "key"}, {"stale"}, points)
+
+        assert redis_cl.get("key") == b"new"
+        assert redis_cl.exists("staging:1:key", "stale") == 0
+        assert float(redis_cl.get(f"{UUID}:point_1.x")) == 1.5
+        assert int(redis_cl.get(version_key(UUID))) == 4
+        # Not written by a session.
+        assert redis_cl.hget(writers_key(UUID), 4) is None
+        message = pubsub.get_message(timeout=1)
+        assert json.loads(message["data"]) == {**points, version_key(UUID): 4}
+
+    def test_retry_if_points_are_saved_meanwhile(self, redis_cl, redis_server):
+        fakeredis = pytest.importorskip("fakeredis")
+        other = fakeredis.FakeRedis(server=redis_server)
+        redis_cl.set("staging:1:key", "new")
+        pipeline = redis_cl.pipeline
+
+        def saving_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            multi = pipe.multi
+
+            def saving_multi():
+                # Another session saves its points, once.
+                if not other.exists("saved"):
+                    other.set("saved", 1)
+                    other.incr(version_key(UUID))
+                multi()
+
+            pipe.multi = saving_multi
+            return pipe
+
+        redis_cl.pipeline = saving_pipeline
+        ingest._swap(
+            redis_cl, UUID, {"staging:1:key": "key"}, set(), {f"{UUID}:point_1.x": 1.5}
+        )
+
+        assert redis_cl.get("key") == b"new"
+        assert int(redis_cl.get(version_key(UUID))) == 2
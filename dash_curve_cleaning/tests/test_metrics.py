@@ -0,0 +1,101 @@
+import pytest
+
+import metrics
+from metrics import COUNT, Histogram, Registry, collect, observe, phase
+
+
+class TestHistogram:
+    def test_buckets(self):
+        histogram = Histogram((1, 2, 5))
+        for value in (0.5, 1, 1.5, 3, 10):
+            histogram.observe(value)
+
+        dct = histogram.dict()
+
+        assert dct["buckets"] == {"1": 2, "2": 3, "5": 4, "+Inf": 5}
+        assert dct["count"] == 5
+        assert dct["sum"] == 16
+        assert dct["mean"] == 3.2
+        assert dct["max"] == 10
+
+    def test_quantiles(self):
+        histogram = Histogram((1, 2, 5))
+        for value in [0.5] * 50 + [1.5] * 45 + [3] * 4 + [10]:
+            histogram.observe(value)
+
+        assert histogram.quantile(0.5) == 1
+        assert histogram.quantile(0.95) == 2
+        assert histogram.quantile(0.99) == 5
+        # Past the last bucket, the maximum is the only known bound.
+        assert histogram.quantile(1.0) == 10
+
+    def test_empty(self):
+        dct = Histogram((1,)).dict()
+
+        assert dct["count"] == 0
+        assert dct["mean"] == 0.0
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    return registry
+
+
+class TestCollect:
+    def test_phases(self, registry):
+        with collect("callback") as phases:
+            with phase("read"):
+                pass
+            with phase("draw"):
+                pass
+            # Phases of the same name add up.
+            with phase("read"):
+                pass
+
+        assert set(phases) == {"read", "draw", "total"}
+        assert phases["total"] >= phases["read"] + phases["draw"]
+        snapshot = registry.snapshot()
+        assert list(snapshot) == ["callback.draw", "callback.read", "callback.total"]
+        assert all(hist["count"] == 1 for hist in snapshot.values())
+
+    def test_phase_outside_of_collect(self, registry):
+        with phase("read"):
+            pass
+
+        assert registry.snapshot() == {}
+
+    def test_recorded_on_error(self, registry):
+        with pytest.raises(ValueError):
+            with collect("callback"):
+                with phase("read"):
+                    raise ValueError
+
+        assert set(registry.snapshot()) == {"callback.read", "callback.total"}
+
+    def test_observe(self, registry):
+        observe("callback.round_trips", 2, COUNT)
+        observe("callback.round_trips", 3, COUNT)
+
+        hist = registry.snapshot()["callback.round_trips"]
+        assert hist["count"] == 2
+        assert hist["buckets"]["2"] == 1
+        assert hist["buckets"]["3"] == 2
+
+    def test_reset(self, registry):
+        observe("callback.total", 0.1)
+        registry.reset()
+
+        assert registry.snapshot() == {}
+
+
+def test_metrics_endpoint():
+    testclient = pytest.importorskip("fastapi.testclient")
+    app = pytest.importorskip("app")
+    observe("test.total", 0.1)
+
+    response = testclient.TestClient(app.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.json()["test.total"]["count"] >= 1
@@ -0,0 +1,73 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+from plotly.io.json import to_json_plotly
+
+import payload
+from payload import compact_samples, typed_array
+
+
+def decode(array) -> np.ndarray:
+    """Decodes a typed array as plotly.js does."""
+    values = np.frombuffer(base64.b64decode(array["bdata"]), dtype=array["dtype"])
+    if "shape" in array:
+        values = values.reshape([int(n) for n in array["shape"].split(",")])
+    return values
+
+
+@pytest.mark.parametrize(
+    "version, supported",
+    [("2.27.1", False), ("2.28.0", True), ("2.35.2", True), ("3.0.1", True)],
+)
+def test_typed_arrays_supported(monkeypatch, version, supported):
+    monkeypatch.setattr(payload, "get_plotlyjs_version", lambda: version)
+    assert payload.typed_arrays_supported() is supported
+
+
+class TestTypedArray:
+    @pytest.mark.parametrize("dtype", ["float64", "float32", "int32", "uint16"])
+    def test_round_trip(self, dtype):
+        rng = np.random.default_rng(0)
+        values = (rng.random(5000) * 60000).astype(dtype)
+
+        array = typed_array(values)
+
+        assert array["dtype"] == payload.DTYPES[dtype]
+        np.testing.assert_array_equal(decode(array), values)
+
+    def test_int64_are_narrowed(self):
+        values = np.arange(-70000, 70000, 7, dtype=np.int64)
+
+        array = typed_array(values)
+
+        assert array["dtype"] == "i4"
+        np.testing.assert_array_equal(decode(array), values)
+
+    def test_shape(self):
+        values = np.random.default_rng(0).random((100, 3))
+
+        array = typed_array(values)
+
+        assert array["shape"] == "100,3"
+        np.testing.assert_array_equal(decode(array), values)
+
+    def test_short_decimals_are_kept(self):
+        values = np.arange(1000.0)
+        assert typed_array(values) is values
+
+    def test_unsupported_dtype(self):
+        values = np.array(["a", "b"])
+        assert typed_array(values) is values
+
+
+def test_compact_samples_round_trip():
+    x = np.random.default_rng(0).random(1000)
+    trace = compact_samples({"type": "scattergl", "x": x, "y": np.arange(1000.0)})
+
+    # As encoded by dash.
+    sent = json.loads(to_json_plotly(trace))
+
+    np.testing.assert_array_equal(decode(sent["x"]), x)
+    assert sent["y"] == list(range(1000))
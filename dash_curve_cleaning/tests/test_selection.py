@@ -0,0 +1,225 @@
+import numpy as np
+import pytest
+
+import selection
+from selection import (
+    GridIndex,
+    IndexCache,
+    exclude,
+    excluded,
+    exclusions_key,
+    inside_polygon,
+)
+from series import series_key, write_series
+
+UUID = "12345"
+PLOT = "power_curve"
+
+
+def brute_force_box(x, y, x_range, y_range):
+    return [
+        i
+        for i, (xi, yi) in enumerate(zip(x, y))
+        if min(x_range) <= xi <= max(x_range) and min(y_range) <= yi <= max(y_range)
+    ]
+
+
+def brute_force_lasso(x, y, xs, ys):
+    # Ray casting, one sample at a time.
+    selected = []
+    for i, (xi, yi) in enumerate(zip(x, y)):
+        inside = False
+        j = len(xs) - 1
+        for k in range(len(xs)):
+            if (ys[k] > yi) != (ys[j] > yi):
+                x_cross = xs[k] + (yi - ys[k]) * (xs[j] - xs[k]) / (ys[j] - ys[k])
+                if xi < x_cross:
+                    inside = not inside
+            j = k
+        if inside:
+            selected.append(i)
+    return selected
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 25, 3000)
+    y = 2 * x + rng.normal(0, 5, 3000)
+    # Duplicates, and samples that aren't finite.
+    x[:10] = x[10:20]
+    y[:10] = y[10:20]
+    x[20:25] = np.nan
+    y[25:30] = np.inf
+    return x, y
+
+
+class TestGridIndex:
+    @pytest.mark.parametrize("cells", [1, 7, 256])
+    def test_box(self, samples, cells):
+        x, y = samples
+        index = GridIndex(x, y, cells)
+        rng = np.random.default_rng(1)
+
+        for _ in range(50):
+            x_range = tuple(rng.uniform(-5, 30, 2))
+            y_range = tuple(rng.uniform(-20, 70, 2))
+
+            assert index.box(x_range, y_range).tolist() == brute_force_box(
+                x, y, x_range, y_range
+            )
+
+    def test_box_edges(self, samples):
+        x, y = samples
+        index = GridIndex(x, y)
+        finite = np.isfinite(x) & np.isfinite(y)
+        x_range = (x[finite].min(), x[finite].max())
+        y_range = (y[finite].min(), y[finite].max())
+
+        assert index.box(x_range, y_range).tolist() == np.flatnonzero(finite).tolist()
+        assert len(index.box((100, 200), y_range)) == 0
+
+    @pytest.mark.parametrize("cells", [1, 7, 256])
+    def test_lasso(self, samples, cells):
+        x, y = samples
+        index = GridIndex(x, y, cells)
+        rng = np.random.default_rng(1)
+
+        for _ in range(20):
+            # Star shaped polygons, concave, around a random center.
+            n = rng.integers(3, 12)
+            angles = np.sort(rng.uniform(0, 2 * np.pi, n))
+            radii = rng.uniform(1, 10, n)
+            center = rng.uniform([0, 0], [25, 50])
+            xs = (center[0] + radii * np.cos(angles)).tolist()
+            ys = (center[1] + 2 * radii * np.sin(angles)).tolist()
+
+            assert index.lasso(xs, ys).tolist() == brute_force_lasso(x, y, xs, ys)
+
+    def test_lasso_of_a_square(self):
+        x = np.array([1.0, 3.0, 1.5, 0.5])
+        y = np.array([1.0, 1.0, 2.5, 3.5])
+
+        actual_result = inside_polygon(x, y, [0, 2, 2, 0], [0, 0, 3, 3])
+
+        assert actual_result.tolist() == [True, False, True, False]
+
+    def test_degenerate_lasso(self, samples):
+        index = GridIndex(*samples)
+
+        assert len(index.lasso([0, 10], [0, 10])) == 0
+
+    def test_constant_samples(self):
+        x = np.full(100, 5.0)
+        y = np.arange(100.0)
+        index = GridIndex(x, y)
+
+        assert index.box((4, 6), (10, 19)).tolist() == list(range(10, 20))
+        assert len(index.box((6, 7), (10, 19))) == 0
+
+    def test_no_samples(self):
+        index = GridIndex(np.empty(0), np.empty(0))
+
+        assert len(index.box((0, 1), (0, 1))) == 0
+        assert len(index.lasso([0, 1, 1], [0, 0, 1])) == 0
+
+
+class TestIndexCache:
+    def test_cached(self, samples):
+        cache = IndexCache()
+        index = cache.index(UUID, "key", *samples)
+
+        assert cache.index(UUID, "key", *samples) is index
+        cache.drop(UUID)
+        assert cache.index(UUID, "key", *samples) is not index
+
+
+class TestExclusions:
+    def test_reload(self, redis_cl, monkeypatch):
+        monkeypatch.setattr(selection, "CHUNK_SIZE", 7)
+        key = exclusions_key(UUID, PLOT, "A01", "original")
+        indices = np.arange(0, 100, 3)
+
+        assert exclude(redis_cl, {key: indices}) == len(indices)
+        assert exclude(redis_cl, {key: indices[:10]}) == 0
+
+        np.testing.assert_array_equal(excluded(redis_cl, [key])[key], indices)
+
+    def test_nothing_excluded(self, redis_cl):
+        key = exclusions_key(UUID, PLOT, "A01", "original")
+
+        assert len(excluded(redis_cl, [key])[key]) == 0
+
+
+class TestSelectSamples:
+    URL = (
+        f"http://localhost/dash/?uuid={UUID}&plot={PLOT}&assets=A01,A02"
+        "&x_name=active_power&y_name=wind_speed&points_0=p1&point_group_names=points_0"
+        "&stages=original"
+    )
+
+    @pytest.fixture
+    def dashapp(self, redis_cl, samples, monkeypatch):
+        dashapp = pytest.importorskip("dashapp")
+        from cache import SeriesCache
+
+        monkeypatch.setattr(dashapp, "redis_cl", redis_cl)
+        monkeypatch.setattr(dashapp, "SERIES_CACHE", SeriesCache())
+        monkeypatch.setattr(dashapp, "INDEX_CACHE", IndexCache())
+        x, y = samples
+        for asset, offset in (("A01", 0.0), ("A02", 10.0)):
+            write_series(
+                redis_cl, series_key(UUID, PLOT, asset, "active_power", "original"), x
+            )
+            write_series(
+                redis_cl,
+                series_key(UUID, PLOT, asset, "wind_speed", "original"),
+                y + offset,
+            )
+        return dashapp
+
+    def select(self, dashapp, selected_data, persist):
+        url = dashapp.Url(self.URL)
+        layout = dashapp.create_empty_plotly_figure().to_plotly_json()["layout"]
+        return dashapp.select_samples(url, layout, selected_data, persist)
+
+    def test_exclusions_survive_a_reload(
+        self, dashapp, redis_server, samples, monkeypatch
+    ):
+        x, y = samples
+        lasso = {"points": [], "lassoPoints": {"x": [2, 20, 10], "y": [0, 10, 40]}}
+
+        text = self.select(dashapp, lasso, persist=True)
+
+        expected = {
+            "A01": brute_force_lasso(x, y, [2, 20, 10], [0, 10, 40]),
+            "A02": brute_force_lasso(x, y + 10, [2, 20, 10], [0, 10, 40]),
+        }
+        total = sum(len(indices) for indices in expected.values())
+        assert (
+            text.splitlines()[-1]
+            == f"{total} samples newly excluded from the cleaning."
+        )
+
+        # The exclusions are read again, by another process.
+        monkeypatch.setattr(dashapp, "INDEX_CACHE", IndexCache())
+        other_cl = pytest.importorskip("fakeredis").FakeRedis(server=redis_server)
+        keys = {
+            asset: exclusions_key(UUID, PLOT, asset, "original") for asset in expected
+        }
+        reloaded = excluded(other_cl, list(keys.values()))
+        for asset, indices in expected.items():
+            assert reloaded[keys[asset]].tolist() == indices
+
+        text = self.select(dashapp, lasso, persist=True)
+        assert text.splitlines()[-1] == "0 samples newly excluded from the cleaning."
+
+    def test_box_without_exclusion(self, dashapp, redis_cl, samples):
+        x, y = samples
+        box = {"points": [], "range": {"x": [5, 10], "y": [10, 20]}}
+
+        text = self.select(dashapp, box, persist=False)
+
+        count = len(brute_force_box(x, y, (5, 10), (10, 20)))
+        assert text.splitlines()[0] == f"A01:original  selected {count}"
+        assert not redis_cl.exists(exclusions_key(UUID, PLOT, "A01", "original"))
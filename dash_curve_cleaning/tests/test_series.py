@@ -0,0 +1,239 @@
+import numpy as np
+import pytest
+
+import series
+from series import (
+    BINARY,
+    LIST,
+    Pyramid,
+    append_series,
+    meta_key,
+    parse_read_pyramid,
+    parse_read_tail,
+    pyramid_key,
+    pyramid_order,
+    queue_read_pyramid,
+    queue_read_tail,
+    read_series,
+    write_pyramid,
+    write_series,
+)
+from stats import stats_key
+
+KEY = "12345:power_curve:A01:active_power:original"
+
+
+def read_tail(redis_cl, key, offset, itemsize):
+    pipe = redis_cl.pipeline(transaction=False)
+    queue_read_tail(pipe, key, offset, itemsize)
+    return parse_read_tail(*pipe.execute(raise_on_error=False), offset, itemsize)
+
+
+class TestLayouts:
+    @pytest.mark.parametrize("layout", [BINARY, LIST])
+    def test_round_trip(self, redis_cl, layout):
+        values = np.random.default_rng(0).normal(size=1000)
+
+        write_series(redis_cl, KEY, values, layout)
+
+        np.testing.assert_array_equal(read_series(redis_cl, KEY), values)
+
+    @pytest.mark.parametrize("layout", [BINARY, LIST])
+    def test_empty(self, redis_cl, layout):
+        write_series(redis_cl, KEY, [], layout)
+
+        assert len(read_series(redis_cl, KEY)) == 0
+
+    def test_float32(self, redis_cl):
+        values = np.random.default_rng(0).normal(size=1000)
+
+        write_series(redis_cl, KEY, values, BINARY, "<f4")
+
+        actual_result = read_series(redis_cl, KEY)
+        assert actual_result.dtype == np.float32
+        np.testing.assert_array_equal(actual_result, values.astype(np.float32))
+
+    @pytest.mark.parametrize("layout", [BINARY, LIST])
+    def test_rewrite_replaces_layout(self, redis_cl, layout):
+        other = LIST if layout == BINARY else BINARY
+        write_series(redis_cl, KEY, np.arange(10.0), other)
+
+        write_series(redis_cl, KEY, np.arange(5.0), layout)
+
+        np.testing.assert_array_equal(read_series(redis_cl, KEY), np.arange(5.0))
+        assert redis_cl.exists(meta_key(KEY)) == (layout == BINARY)
+
+    def test_version_changes(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        version = redis_cl.hget(meta_key(KEY), "version")
+
+        write_series(redis_cl, KEY, np.arange(10.0))
+
+        assert redis_cl.hget(meta_key(KEY), "version") != version
+
+    def test_invalid_layout(self, redis_cl):
+        with pytest.raises(ValueError):
+            write_series(redis_cl, KEY, np.arange(10.0), "csv")
+
+
+class TestChunkedWrites:
+    @pytest.mark.parametrize("layout", [BINARY, LIST])
+    def test_round_trip(self, redis_cl, monkeypatch, layout):
+        # 100 samples, sent 3 at a time.
+        monkeypatch.setattr(series, "CHUNK_BYTES", 24)
+        monkeypatch.setattr(series, "LIST_CHUNK_SIZE", 3)
+        values = np.random.default_rng(0).normal(size=100)
+
+        write_series(redis_cl, KEY, values, layout)
+
+        np.testing.assert_array_equal(read_series(redis_cl, KEY), values)
+
+    def test_chunks_split_samples(self, redis_cl, monkeypatch):
+        monkeypatch.setattr(series, "CHUNK_BYTES", 5)
+        values = np.random.default_rng(0).normal(size=100)
+
+        write_series(redis_cl, KEY, values)
+
+        np.testing.assert_array_equal(read_series(redis_cl, KEY), values)
+
+    def test_pyramid(self, redis_cl, monkeypatch):
+        monkeypatch.setattr(series, "CHUNK_BYTES", 64)
+        values = np.random.default_rng(0).normal(size=2000)
+
+        write_pyramid(redis_cl, KEY, values)
+
+        np.testing.assert_array_equal(
+            read_series(redis_cl, pyramid_key(KEY)), values[pyramid_order(2000)]
+        )
+
+
+class TestAppendSeries:
+    @pytest.mark.parametrize("layout", [BINARY, LIST])
+    def test_round_trip(self, redis_cl, layout):
+        write_series(redis_cl, KEY, np.arange(10.0), layout)
+
+        append_series(redis_cl, KEY, np.arange(10.0, 15.0))
+
+        np.testing.assert_array_equal(read_series(redis_cl, KEY), np.arange(15.0))
+
+    def test_binary_keeps_dtype_and_version(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0), BINARY, "<f4")
+        version = redis_cl.hget(meta_key(KEY), "version")
+
+        append_series(redis_cl, KEY, np.arange(10.0, 15.0))
+
+        actual_result = read_series(redis_cl, KEY)
+        assert actual_result.dtype == np.float32
+        np.testing.assert_array_equal(actual_result, np.arange(15.0))
+        assert redis_cl.hget(meta_key(KEY), "length") == b"15"
+        assert redis_cl.hget(meta_key(KEY), "version") == version
+
+    def test_encoded(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0), BINARY, codec="delta,zlib")
+
+        append_series(redis_cl, KEY, np.arange(10.0, 15.0))
+
+        np.testing.assert_array_equal(read_series(redis_cl, KEY), np.arange(15.0))
+
+    def test_creates_list(self, redis_cl):
+        append_series(redis_cl, KEY, [1.0, 2.0])
+
+        assert redis_cl.type(KEY) == b"list"
+        np.testing.assert_array_equal(read_series(redis_cl, KEY), [1.0, 2.0])
+
+    def test_updates_stats(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+
+        append_series(redis_cl, KEY, [-5.0, 20.0])
+
+        stats = series.parse_read_stats(redis_cl.hgetall(stats_key(KEY)))
+        assert stats.count == 12
+        assert stats.extent() == (-5.0, 20.0)
+
+    def test_drops_pyramid(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        write_pyramid(redis_cl, KEY, np.arange(10.0))
+
+        append_series(redis_cl, KEY, [10.0])
+
+        assert not redis_cl.exists(pyramid_key(KEY), meta_key(pyramid_key(KEY)))
+
+    @pytest.mark.parametrize("layout", [BINARY, LIST])
+    def test_read_tail(self, redis_cl, layout):
+        write_series(redis_cl, KEY, np.arange(10.0), layout)
+        append_series(redis_cl, KEY, np.arange(10.0, 15.0))
+
+        tail, itemsize = read_tail(redis_cl, KEY, 10, 8)
+
+        np.testing.assert_array_equal(tail, np.arange(10.0, 15.0))
+        assert itemsize == 8
+
+    def test_read_tail_of_another_dtype(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0), BINARY, "<f4")
+
+        tail, itemsize = read_tail(redis_cl, KEY, 5, 8)
+
+        assert tail is None
+        assert itemsize == 4
+        tail, _ = read_tail(redis_cl, KEY, 5, itemsize)
+        np.testing.assert_array_equal(tail, np.arange(5.0, 10.0))
+
+
+class TestPyramid:
+    def test_levels(self, redis_cl):
+        values = np.random.default_rng(0).normal(size=25_000)
+
+        write_pyramid(redis_cl, KEY, values)
+
+        pyramid = Pyramid(redis_cl.hgetall(meta_key(pyramid_key(KEY))))
+        assert pyramid.levels == [1_000, 10_000, 25_000]
+        assert pyramid.length == 25_000
+        assert pyramid.extent == (values.min(), values.max())
+        assert pyramid.level(500) == 1_000
+        assert pyramid.level(5_000) == 10_000
+        assert pyramid.level(50_000) == 25_000
+
+    def test_levels_are_prefixes_of_the_shuffled_series(self, redis_cl):
+        values = np.random.default_rng(0).normal(size=25_000)
+        write_pyramid(redis_cl, KEY, values)
+        pipe = redis_cl.pipeline(transaction=False)
+        queue_read_pyramid(pipe, KEY)
+
+        pyramid, coarsest = parse_read_pyramid(*pipe.execute())
+
+        shuffled = values[pyramid_order(len(values))]
+        np.testing.assert_array_equal(coarsest, shuffled[:1_000])
+        for level in pyramid.levels:
+            pipe = redis_cl.pipeline(transaction=False)
+            series.queue_read_level(pipe, KEY, pyramid, level)
+            (blob,) = pipe.execute()
+            np.testing.assert_array_equal(
+                series.parse_read_level(blob, pyramid), shuffled[:level]
+            )
+
+    def test_series_of_the_same_length_pair_up(self, redis_cl):
+        x = np.arange(5_000.0)
+        write_pyramid(redis_cl, "x", x)
+        write_pyramid(redis_cl, "y", 2 * x)
+
+        x_level = read_series(redis_cl, pyramid_key("x"))[:1_000]
+        y_level = read_series(redis_cl, pyramid_key("y"))[:1_000]
+
+        np.testing.assert_array_equal(y_level, 2 * x_level)
+
+    def test_no_pyramid(self, redis_cl):
+        write_series(redis_cl, KEY, np.arange(10.0))
+        pipe = redis_cl.pipeline(transaction=False)
+        queue_read_pyramid(pipe, KEY)
+
+        pyramid, values = parse_read_pyramid(*pipe.execute())
+
+        assert pyramid is None
+        assert len(values) == 0
+
+    def test_small_series(self, redis_cl):
+        write_pyramid(redis_cl, KEY, np.arange(10.0))
+
+        pyramid = Pyramid(redis_cl.hgetall(meta_key(pyramid_key(KEY))))
+
+        assert pyramid.levels == [10]
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from stats import RELATIVE_ACCURACY, SeriesStats, Sketch
+
+QUANTILES = [0.0, 0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1.0]
+
+
+def distributions():
+    rng = np.random.default_rng(0)
+    return {
+        "normal": rng.normal(5, 10, 20_000),
+        "lognormal": rng.lognormal(0, 3, 20_000),
+        "negative": -rng.exponential(100, 20_000),
+        "with_zeros": np.where(
+            rng.random(20_000) < 0.2, 0.0, rng.uniform(-1, 1e4, 20_000)
+        ),
+        "power": np.clip(rng.normal(1000, 600, 20_000), 0, 2500),
+    }
+
+
+def assert_accurate(sketch: Sketch, values: np.ndarray):
+    values = np.sort(values)
+    for q in QUANTILES:
+        # The sketch estimates the sample of rank q * (n - 1), rounded down, which is
+        # np.quantile with method="lower".
+        exact = values[int(np.floor(q * (len(values) - 1)))]
+        estimate = sketch.quantile(q)
+        assert abs(estimate - exact) <= RELATIVE_ACCURACY * abs(exact) + 1e-12, q
+
+
+class TestSketch:
+    @pytest.mark.parametrize("name", list(distributions()))
+    def test_quantiles(self, name):
+        values = distributions()[name]
+        sketch = Sketch()
+
+        sketch.add(values)
+
+        assert sketch.count == len(values)
+        assert_accurate(sketch, values)
+
+    @pytest.mark.parametrize("name", list(distributions()))
+    def test_merged_quantiles(self, name):
+        values = distributions()[name]
+        sketches = [Sketch() for _ in range(4)]
+        for sketch, part in zip(sketches, np.array_split(values, 4)):
+            sketch.add(part)
+
+        merged = sketches[0]
+        for sketch in sketches[1:]:
+            merged.merge(sketch)
+
+        assert merged.count == len(values)
+        assert_accurate(merged, values)
+
+    def test_merge_of_disjoint_ranges(self):
+        low = np.random.default_rng(0).uniform(1, 2, 1000)
+        high = np.random.default_rng(1).uniform(1e3, 1e4, 3000)
+        sketch, other = Sketch(), Sketch()
+        sketch.add(low)
+        other.add(high)
+
+        sketch.merge(other)
+
+        assert_accurate(sketch, np.concatenate([low, high]))
+
+    def test_dumps(self):
+        sketch = Sketch()
+        sketch.add(distributions()["with_zeros"])
+
+        loaded = Sketch.loads(sketch.dumps())
+
+        assert loaded.dumps() == sketch.dumps()
+        assert loaded.quantile(0.3) == sketch.quantile(0.3)
+
+    def test_empty(self):
+        assert Sketch().quantile(0.5) is None
+
+
+class TestSeriesStats:
+    def test_appended_samples(self):
+        values = distributions()["normal"]
+        stats = SeriesStats.from_values(values[:5000])
+
+        stats.add(values[5000:])
+
+        assert stats.count == len(values)
+        assert stats.extent() == (values.min(), values.max())
+        assert_accurate(stats.sketch, values)
+
+    def test_not_finite_samples(self):
+        stats = SeriesStats.from_values([1.0, np.nan, np.inf, 3.0])
+
+        assert stats.count == 4
+        assert stats.extent() == (1.0, 3.0)
+        assert stats.sketch.count == 2
+
+    def test_robust_extent(self):
+        values = np.concatenate([np.random.default_rng(0).normal(0, 1, 100_000), [1e6]])
+        stats = SeriesStats.from_values(values)
+
+        low, high = stats.robust_extent()
+
+        assert stats.extent()[1] == 1e6
+        assert -4 < low < -2
+        assert 2 < high < 4
+
+    def test_meta(self):
+        stats = SeriesStats.from_values(distributions()["lognormal"])
+
+        loaded = SeriesStats.from_meta(stats.to_meta())
+
+        assert loaded.to_meta() == stats.to_meta()
+
+    def test_no_samples(self):
+        stats = SeriesStats.from_values([])
+
+        assert stats.extent() is None
+        assert stats.robust_extent() is None
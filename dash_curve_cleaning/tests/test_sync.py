@@ -0,0 +1,61 @@
+import time
+
+from sync import PointBoard, decode_points, encode_points, points_channel
+
+UUID = "12345"
+X = f"{UUID}:point_1.x"
+Y = f"{UUID}:point_1.y"
+
+
+def test_points_round_trip():
+    assert decode_points(encode_points({X: 1, Y: 2.5})) == {X: 1.0, Y: 2.5}
+
+
+class TestPointBoard:
+    def test_latest_points(self):
+        board = PointBoard()
+        board.update(UUID, {X: 1.0, Y: 2.0})
+        board.update(UUID, {X: 3.0})
+
+        assert board.points(UUID) == {X: 3.0, Y: 2.0}
+        assert board.points("other") == {}
+
+    def test_points_are_copied(self):
+        board = PointBoard()
+        board.update(UUID, {X: 1.0})
+
+        board.points(UUID)[X] = 2.0
+
+        assert board.points(UUID) == {X: 1.0}
+
+    def test_least_recently_changed_uuids_are_dropped(self):
+        board = PointBoard(max_uuids=2)
+        for uuid in ("a", "b", "c"):
+            board.update(uuid, {f"{uuid}:point_1.x": 1.0})
+        board.update("b", {"b:point_1.x": 2.0})
+        board.update("d", {"d:point_1.x": 1.0})
+
+        assert board.points("a") == board.points("c") == {}
+        assert board.points("b") == {"b:point_1.x": 2.0}
+
+    def test_invalid_message(self):
+        board = PointBoard()
+
+        board._handle({"channel": points_channel(UUID).encode(), "data": b"[1, 2"})
+
+        assert board.points(UUID) == {}
+
+    def test_listen(self, redis_cl):
+        board = PointBoard()
+        thread = board.listen(redis_cl, sleep_time=0.01)
+        try:
+            assert board.listen(redis_cl) is thread
+            # Published once the subscription is active.
+            deadline = time.monotonic() + 5
+            while not board.points(UUID) and time.monotonic() < deadline:
+                redis_cl.publish(points_channel(UUID), encode_points({X: 1.5}))
+                time.sleep(0.02)
+
+            assert board.points(UUID) == {X: 1.5}
+        finally:
+            thread.stop()
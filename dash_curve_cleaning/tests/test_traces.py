@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from traces import (
+    AUTO,
+    PER_ASSET,
+    PER_STAGE,
+    SVG,
+    WEBGL,
+    merge_assets,
+    merged_indices,
+    merged_samples,
+    trace_type,
+)
+
+
+class TestMergeAssets:
+    def test_auto(self):
+        assert merge_assets(AUTO, 10, 3, 20)
+        assert not merge_assets(AUTO, 5, 4, 20)
+        # A single asset has nothing to merge.
+        assert not merge_assets(AUTO, 1, 30, 20)
+
+    def test_explicit_mode(self):
+        assert merge_assets(PER_STAGE, 1, 1, 20)
+        assert not merge_assets(PER_ASSET, 60, 3, 20)
+
+    def test_invalid_mode(self):
+        with pytest.raises(Exception):
+            merge_assets("turbine", 2, 2, 20)
+
+
+def test_trace_type():
+    assert trace_type(1000, 1000) == SVG
+    assert trace_type(1001, 1000) == WEBGL
+
+
+class TestMergedSamples:
+    def test_samples(self):
+        series = [
+            (np.array([1.0, 2.0]), np.array([3.0, 4.0])),
+            (np.array([5.0]), np.array([6.0])),
+            (np.array([]), np.array([])),
+            (np.array([7.0, 8.0, 9.0]), np.array([10.0, 11.0])),
+        ]
+
+        merged = merged_samples(series)
+
+        # The unpaired sample of the last asset is left out.
+        assert merged["x"].tolist() == [1, 2, 5, 7, 8]
+        assert merged["y"].tolist() == [3, 4, 6, 10, 11]
+        assert merged["customdata"].tolist() == [0, 0, 1, 3, 3]
+
+    def test_indices(self):
+        indices = merged_indices(
+            [np.array([1]), np.array([0, 2]), np.array([0])], [2, 3, 1]
+        )
+
+        assert indices.tolist() == [1, 2, 4, 5]
+
+    def test_indices_select_the_same_samples(self):
+        rng = np.random.default_rng(0)
+        series = [(rng.random(n), rng.random(n)) for n in (5, 0, 8, 3)]
+        indices = [np.flatnonzero(x > 0.5) for x, _ in series]
+
+        merged = merged_samples(series)
+        selected = merged_indices(indices, [len(x) for x, _ in series])
+
+        expected_result = np.concatenate(
+            [x[idx] for (x, _), idx in zip(series, indices)]
+        )
+        np.testing.assert_array_equal(merged["x"][selected], expected_result)
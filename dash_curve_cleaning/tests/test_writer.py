@@ -0,0 +1,167 @@
+import json
+
+import writer
+from datastore import RedisStore
+from sync import points_channel
+from writer import (
+    MAX_VERSIONS,
+    PointWriter,
+    rejected_key,
+    version_key,
+    write_points,
+    writers_key,
+)
+
+UUID = "12345"
+X = f"{UUID}:point_1.x"
+Y = f"{UUID}:point_1.y"
+
+
+def version(redis_cl) -> int:
+    return int(redis_cl.get(version_key(UUID)) or 0)
+
+
+class TestWritePoints:
+    def test_write(self, redis_cl):
+        pubsub = redis_cl.pubsub()
+        pubsub.subscribe(points_channel(UUID))
+        assert pubsub.get_message(timeout=1)["type"] == "subscribe"
+
+        assert write_points(redis_cl, UUID, "a", {X: 1.5}, 0) == 1
+
+        assert float(redis_cl.get(X)) == 1.5
+        assert redis_cl.hget(writers_key(UUID), 1) == b"a"
+        message = pubsub.get_message(timeout=1)
+        assert json.loads(message["data"]) == {X: 1.5, version_key(UUID): 1}
+
+    def test_consecutive_writes_of_a_session(self, redis_cl):
+        write_points(redis_cl, UUID, "a", {X: 1.0}, 0)
+
+        # Moved from the version the session read before its first write.
+        assert write_points(redis_cl, UUID, "a", {Y: 2.0}, 0) == 2
+
+        assert float(redis_cl.get(X)) == 1.0
+        assert float(redis_cl.get(Y)) == 2.0
+
+    def test_write_of_another_session(self, redis_cl):
+        write_points(redis_cl, UUID, "a", {X: 1.0}, 0)
+
+        assert write_points(redis_cl, UUID, "b", {X: 2.0}, 0) is None
+
+        assert float(redis_cl.get(X)) == 1.0
+        assert version(redis_cl) == 1
+
+    def test_write_between_writes_of_a_session(self, redis_cl):
+        write_points(redis_cl, UUID, "a", {X: 1.0}, 0)
+        write_points(redis_cl, UUID, "b", {X: 2.0}, 1)
+
+        assert write_points(redis_cl, UUID, "a", {X: 3.0}, 0) is None
+
+    def test_failed_compare_and_set(self, redis_cl, monkeypatch):
+        written_by = writer.written_by
+
+        def write_in_between(redis_cl_, *args):
+            # Another session writes once the version is watched.
+            redis_cl.incr(version_key(UUID))
+            return written_by(redis_cl_, *args)
+
+        monkeypatch.setattr(writer, "written_by", write_in_between)
+
+        assert write_points(redis_cl, UUID, "a", {X: 1.0}, 0) is None
+
+        assert redis_cl.get(X) is None
+        assert version(redis_cl) == 1
+
+    def test_versions_are_forgotten(self, redis_cl):
+        for i in range(MAX_VERSIONS + 4):
+            write_points(redis_cl, UUID, "a", {X: float(i)}, i)
+
+        assert redis_cl.hlen(writers_key(UUID)) == MAX_VERSIONS
+        assert write_points(redis_cl, UUID, "a", {X: 0.0}, 0) is None
+        assert write_points(redis_cl, UUID, "a", {X: 0.0}, 4) is not None
+
+
+class TestPointWriter:
+    def test_consecutive_saves(self, redis_cl):
+        point_writer = PointWriter(redis_cl, delay=0)
+        point_writer.save(UUID, "a", {X: 1.0}, 0)
+
+        base = point_writer.version(UUID, "a", 0, version(redis_cl))
+        point_writer.save(UUID, "a", {X: 2.0}, base)
+
+        assert base == 1
+        assert version(redis_cl) == 2
+        assert float(redis_cl.get(X)) == 2.0
+
+    def test_consecutive_saves_across_processes(self, redis_cl):
+        first, second = PointWriter(redis_cl, delay=0), PointWriter(redis_cl, delay=0)
+        first.save(UUID, "a", {X: 1.0}, 0)
+
+        base = second.version(UUID, "a", 0, version(redis_cl))
+        second.save(UUID, "a", {X: 2.0}, base)
+
+        assert base == 1
+        assert version(redis_cl) == 2
+        assert float(redis_cl.get(X)) == 2.0
+        assert second.rejected(UUID, "a") == []
+
+    def test_pending_saves_across_processes(self, redis_cl):
+        # Both processes hold a save of the session, moved from the same version.
+        first, second = PointWriter(redis_cl), PointWriter(redis_cl)
+        first.save(UUID, "a", {X: 1.0}, 0)
+        second.save(UUID, "a", {X: 2.0, Y: 3.0}, 0)
+
+        first.flush(UUID)
+        second.flush(UUID)
+
+        assert version(redis_cl) == 2
+        assert float(redis_cl.get(X)) == 2.0
+        assert float(redis_cl.get(Y)) == 3.0
+
+    def test_saves_are_merged(self, redis_cl):
+        point_writer = PointWriter(redis_cl)
+        point_writer.save(UUID, "a", {X: 1.0}, 0)
+        point_writer.save(UUID, "a", {X: 2.0, Y: 3.0}, 0)
+
+        assert point_writer.pending(UUID, "a") == {X: 2.0, Y: 3.0}
+        point_writer.flush(UUID, "a")
+
+        assert point_writer.pending(UUID, "a") == {}
+        assert version(redis_cl) == 1
+        assert float(redis_cl.get(X)) == 2.0
+
+    def test_concurrent_sessions(self, redis_cl):
+        point_writer = PointWriter(redis_cl)
+        point_writer.save(UUID, "a", {X: 1.0}, 0)
+        point_writer.save(UUID, "b", {X: 2.0, Y: 3.0}, 0)
+
+        point_writer.flush(UUID)
+
+        assert version(redis_cl) == 1
+        assert float(redis_cl.get(X)) == 1.0
+        assert redis_cl.get(Y) is None
+        assert point_writer.version(UUID, "b", 0, 1) == 0
+        assert point_writer.rejected(UUID, "b") == [X, Y]
+        assert point_writer.rejected(UUID, "b") == []
+        assert point_writer.rejected(UUID, "a") == []
+
+    def test_round_trips_are_counted(self, redis_cl):
+        point_writer = PointWriter(redis_cl, delay=0)
+        point_writer.save(UUID, "a", {X: 1.0}, 0)
+        store = RedisStore(redis_cl)
+
+        # Nothing is read if the version didn't change.
+        assert point_writer.version(UUID, "a", 1, 1, store) == 1
+        assert store.round_trips == 0
+        assert point_writer.version(UUID, "a", 0, 1, store) == 1
+        assert store.round_trips == 1
+        assert point_writer.rejected(UUID, "a", store) == []
+        assert store.round_trips == 2
+
+    def test_rejected_points_expire(self, redis_cl):
+        point_writer = PointWriter(redis_cl, delay=0)
+        point_writer.save(UUID, "a", {X: 1.0}, 0)
+
+        point_writer.save(UUID, "b", {X: 2.0}, 0)
+
+        assert 0 < redis_cl.ttl(rejected_key(UUID, "b")) <= writer.REJECTED_TTL